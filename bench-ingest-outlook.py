@@ -0,0 +1,437 @@
+
+# Offline ingestion benchmark for run-ingest-outlook.py.
+#
+# Runs fetch_and_process_emails() end to end against an in-process fake Graph
+# /me/messages endpoint and a fake LangGraph threads/runs API (both served
+# through httpx.MockTransport, so no tenant, server or network is needed) and
+# reports messages/sec, p50/p99 per-email latency and peak RSS.
+#
+# The ingest script is run from a copy in a temporary directory, so its ledger,
+# thread registry, delta/resume cursors and attachment cache all live there and
+# production .state/ is never touched. --ingest-args are added after the
+# isolation flags (--rerun --thread-cache-size 0), not instead of them.
+#
+# Usage:
+#   python bench-ingest-outlook.py --messages 2000 --concurrency 1,4,16
+#   python bench-ingest-outlook.py --graph-latency 0.2 --throttle-every 10 \
+#       --ingest-args "--coalesce --run-cleanup skip"
+
+import io
+import os
+import re
+import json
+import time
+import shlex
+import shutil
+import asyncio
+import argparse
+import contextlib
+import importlib.util
+import tempfile
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+import httpx
+
+try:
+    import resource
+except ImportError:  # Windows has no resource module
+    resource = None
+
+_ROOT = Path(__file__).parent.absolute()
+INGEST_SCRIPT = _ROOT / "run-ingest-outlook.py"
+
+# Deployment URL the fake LangGraph answers for
+BENCH_LANGGRAPH_URL = "http://langgraph.bench"
+BENCH_MAILBOX = "bench@example.com"
+
+# Always passed before --ingest-args: every run ingests the whole mailbox
+# (no ledger skips) and keeps no thread cache between runs
+ISOLATION_INGEST_ARGS = "--rerun --thread-cache-size 0"
+
+def load_ingest_module(directory):
+    """Import a copy of run-ingest-outlook.py placed in `directory`.
+
+    The script keeps its state under .state/ next to itself, so loading it from
+    a scratch directory keeps every state file the benchmark writes out of the
+    real one. (Its file name is not a valid module name, hence the spec.)
+    """
+    script = Path(directory) / INGEST_SCRIPT.name
+    shutil.copyfile(INGEST_SCRIPT, script)
+    spec = importlib.util.spec_from_file_location("run_ingest_outlook", script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# ════════════════════════════════════════════════════════════════════════════
+# FAKE MICROSOFT GRAPH
+# ════════════════════════════════════════════════════════════════════════════
+
+class FakeGraph:
+    """In-process stand-in for GET /me/messages with $top/$skiptoken paging.
+
+    Messages are served in the order the query's $orderby asks for
+    (receivedDateTime asc or desc; newest first without one), as Graph does.
+
+    Every page costs `latency` seconds. With `throttle_every`, every Nth request
+    is answered 429 with a Retry-After of `retry_after` seconds, like Graph does
+    once a mailbox exceeds its request quota.
+
+    The time each message is served is recorded in `served_at`, so per-email
+    latency can be measured up to its runs.create on the fake LangGraph.
+    """
+
+    def __init__(self, messages, conversations, body_bytes, latency=0.0,
+                 throttle_every=0, retry_after=0.1):
+        """Generate the mailbox.
+
+        Args:
+            messages: Number of messages in the mailbox
+            conversations: Number of distinct conversationIds they are spread over
+            body_bytes: Approximate size of each HTML body
+            latency: Seconds per page request
+            throttle_every: Answer every Nth request with 429 (0 disables)
+            retry_after: Retry-After seconds sent with each 429
+        """
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.requests = 0
+        self.throttled = 0
+        self.served_at = {}
+
+        now = datetime.now(timezone.utc)
+        padding = "<p style=\"margin:0;font-family:Calibri,sans-serif\">Lorem ipsum dolor sit amet.</p>"
+        body = (
+            "<html><head><style>p{margin:0}</style></head><body>"
+            "<p>Hi, can we move Thursday's review to Friday?</p>"
+            + padding * max(1, body_bytes // len(padding))
+            + "</body></html>"
+        )
+        self.messages = [
+            {
+                "id": f"bench-{i}",
+                "conversationId": f"bench-conversation-{i % conversations}",
+                "subject": f"Benchmark message {i}",
+                "from": {"emailAddress": {"address": BENCH_MAILBOX}},
+                "toRecipients": [{"emailAddress": {"address": "team@example.com"}}],
+                "receivedDateTime": (now - timedelta(seconds=i)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "isRead": False,
+                "body": {"contentType": "html", "content": body},
+            }
+            for i in range(messages)
+        ]
+
+    async def handle(self, request):
+        """httpx.MockTransport handler."""
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.throttle_every and self.requests % self.throttle_every == 0:
+            self.throttled += 1
+            return httpx.Response(429, headers={"Retry-After": str(self.retry_after)}, json={
+                "error": {"code": "TooManyRequests", "message": "Application is over its MailboxConcurrency limit."}
+            })
+        if not request.url.path.endswith("/me/messages"):
+            return httpx.Response(404, json={"error": {"code": "ResourceNotFound"}})
+
+        offset = int(request.url.params.get("$skiptoken", 0))
+        top = int(request.url.params.get("$top", 10))
+        orderby = request.url.params.get("$orderby", "")
+        # self.messages is newest first
+        messages = self.messages[::-1] if orderby.lower().endswith(" asc") else self.messages
+        page = messages[offset:offset + top]
+        served = time.perf_counter()
+        for message in page:
+            self.served_at[message["id"]] = served
+
+        data = {"value": page}
+        if offset + top < len(self.messages):
+            query = {"$top": top, "$skiptoken": offset + top}
+            if orderby:
+                query["$orderby"] = orderby
+            data["@odata.nextLink"] = str(httpx.URL("https://graph.microsoft.com/v1.0/me/messages", params=query))
+        return httpx.Response(200, json=data)
+
+# ════════════════════════════════════════════════════════════════════════════
+# FAKE LANGGRAPH SERVER
+# ════════════════════════════════════════════════════════════════════════════
+
+class FakeLangGraph:
+    """In-process stand-in for the LangGraph threads and runs API.
+
+    Implements the calls ingest_email_to_langgraph() makes (threads get / create
+    / update, runs list / delete / create), each costing `latency` seconds. The
+    time each email's run is created is recorded in `ingested_at`.
+    """
+
+    _THREAD_RE = re.compile(r"^/threads/([^/]+)$")
+    _RUNS_RE = re.compile(r"^/threads/([^/]+)/runs$")
+    _RUN_RE = re.compile(r"^/threads/([^/]+)/runs/([^/]+)$")
+
+    def __init__(self, latency=0.0):
+        """Create an empty server.
+
+        Args:
+            latency: Seconds per API call
+        """
+        self.latency = latency
+        self.requests = 0
+        self.threads = {}
+        self.ingested_at = {}
+
+    def _thread(self, thread_id):
+        return {"thread_id": thread_id, "metadata": {}, "status": "idle", "values": {}}
+
+    async def handle(self, request):
+        """httpx.MockTransport handler."""
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        path = request.url.path
+        method = request.method
+        body = json.loads(request.content) if request.content else {}
+
+        if path == "/threads" and method == "POST":
+            thread_id = body["thread_id"]
+            self.threads.setdefault(thread_id, [])
+            return httpx.Response(200, json=self._thread(thread_id))
+
+        match = self._THREAD_RE.match(path)
+        if match:
+            thread_id = match.group(1)
+            if thread_id not in self.threads:
+                return httpx.Response(404, json={"detail": f"Thread {thread_id} not found"})
+            return httpx.Response(200, json=self._thread(thread_id))
+
+        match = self._RUNS_RE.match(path)
+        if match and match.group(1) in self.threads:
+            runs = self.threads[match.group(1)]
+            if method == "GET":
+                offset = int(request.url.params.get("offset", 0))
+                limit = int(request.url.params.get("limit", 10))
+                return httpx.Response(200, json=runs[offset:offset + limit])
+            run = {"run_id": f"run-{self.requests}", "thread_id": match.group(1), "status": "pending"}
+            runs.append(run)
+            self.ingested_at[body["input"]["email_input"]["id"]] = time.perf_counter()
+            return httpx.Response(200, json=run)
+
+        match = self._RUN_RE.match(path)
+        if match and method == "DELETE" and match.group(1) in self.threads:
+            thread_id, run_id = match.groups()
+            self.threads[thread_id] = [r for r in self.threads[thread_id] if r["run_id"] != run_id]
+            return httpx.Response(204)
+
+        return httpx.Response(404, json={"detail": "Not found"})
+
+# ════════════════════════════════════════════════════════════════════════════
+# BENCHMARK DRIVER
+# ════════════════════════════════════════════════════════════════════════════
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if os.uname().sysname == "Darwin" else peak / 1024
+
+async def run_benchmark(ingest, bench_args, concurrency):
+    """Run one end-to-end ingestion against fresh fake servers.
+
+    Args:
+        ingest: Loaded run-ingest-outlook module
+        bench_args: Parsed benchmark arguments
+        concurrency: --concurrency for this run
+
+    Returns:
+        dict: Throughput, latency and request counters for the run
+    """
+    graph = FakeGraph(
+        bench_args.messages,
+        bench_args.conversations,
+        bench_args.body_bytes,
+        latency=bench_args.graph_latency,
+        throttle_every=bench_args.throttle_every,
+        retry_after=bench_args.retry_after,
+    )
+    langgraph = FakeLangGraph(latency=bench_args.langgraph_latency)
+    args = ingest.parse_args([
+        "--email", BENCH_MAILBOX,
+        "--url", BENCH_LANGGRAPH_URL,
+        "--include-read",
+        "--concurrency", str(concurrency),
+        "--page-size", str(bench_args.page_size),
+        *shlex.split(ISOLATION_INGEST_ARGS),
+        *shlex.split(bench_args.ingest_args),
+    ])
+
+    # The ingest script logs every email; keep that out of the report
+    output = contextlib.nullcontext() if bench_args.verbose else contextlib.redirect_stdout(io.StringIO())
+    started = time.perf_counter()
+    with output:
+        exit_code = await ingest.fetch_and_process_emails(
+            args,
+            graph_transport=httpx.MockTransport(graph.handle),
+            langgraph_transport=httpx.MockTransport(langgraph.handle),
+        )
+    elapsed = time.perf_counter() - started
+
+    latencies = [
+        done - graph.served_at[message_id]
+        for message_id, done in langgraph.ingested_at.items()
+        if message_id in graph.served_at
+    ]
+    p50 = percentile(latencies, 0.50)
+    p99 = percentile(latencies, 0.99)
+    return {
+        "concurrency": concurrency,
+        "exit_code": exit_code,
+        "messages": len(langgraph.ingested_at),
+        "seconds": round(elapsed, 3),
+        "messages_per_sec": round(len(langgraph.ingested_at) / elapsed, 1) if elapsed > 0 else 0.0,
+        "p50_latency_ms": round(p50 * 1000, 1) if p50 is not None else None,
+        "p99_latency_ms": round(p99 * 1000, 1) if p99 is not None else None,
+        "graph_requests": graph.requests,
+        "graph_throttled": graph.throttled,
+        "langgraph_requests": langgraph.requests,
+    }
+
+def print_results(results, rss_mb):
+    """Print one row per benchmark run."""
+    print(f"{'conc':>5} {'msgs':>6} {'secs':>8} {'msgs/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'graph':>6} {'429s':>5} {'lg reqs':>8} {'exit':>5}")
+    for r in results:
+        print(
+            f"{r['concurrency']:>5} {r['messages']:>6} {r['seconds']:>8.2f} {r['messages_per_sec']:>9.1f} "
+            f"{r['p50_latency_ms'] if r['p50_latency_ms'] is not None else '-':>8} "
+            f"{r['p99_latency_ms'] if r['p99_latency_ms'] is not None else '-':>8} "
+            f"{r['graph_requests']:>6} {r['graph_throttled']:>5} {r['langgraph_requests']:>8} {r['exit_code']:>5}"
+        )
+    print(f"Peak RSS: {f'{rss_mb:.1f} MB' if rss_mb is not None else 'n/a'}")
+
+async def main(bench_args):
+    """Run the benchmark for every requested concurrency and report.
+
+    Returns:
+        int: Exit code (0 if every run succeeded)
+    """
+    # A far-future token without refresh_token: no MSAL calls, no token file writes
+    os.environ["OUTLOOK_TOKEN"] = json.dumps({
+        "access_token": "bench-token",
+        "expires_at": int(time.time()) + 86400,
+    })
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench-ingest-") as directory:
+        ingest = load_ingest_module(directory)
+        for concurrency in bench_args.concurrency:
+            for _ in range(bench_args.repeat):
+                results.append(await run_benchmark(ingest, bench_args, concurrency))
+
+    rss_mb = peak_rss_mb()
+    print_results(results, rss_mb)
+    if bench_args.json:
+        with open(bench_args.json, "w") as f:
+            json.dump({"runs": results, "peak_rss_mb": rss_mb}, f, indent=2)
+        print(f"Wrote results to {bench_args.json}")
+    return 0 if all(r["exit_code"] == 0 for r in results) else 1
+
+def parse_args():
+    """Parse command line arguments for the benchmark.
+
+    Returns:
+        argparse.Namespace: Parsed arguments object with attributes for each flag
+    """
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark for run-ingest-outlook.py")
+
+    parser.add_argument(
+        "--messages",
+        type=int,
+        default=1000,
+        help="Messages in the fake mailbox"
+    )
+    parser.add_argument(
+        "--conversations",
+        type=int,
+        default=200,
+        help="Distinct conversations the messages are spread over"
+    )
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=100,
+        help="Messages per Graph page"
+    )
+    parser.add_argument(
+        "--body-bytes",
+        type=int,
+        default=8000,
+        help="Approximate HTML body size of each message"
+    )
+    parser.add_argument(
+        "--graph-latency",
+        type=float,
+        default=0.05,
+        help="Seconds per fake Graph request"
+    )
+    parser.add_argument(
+        "--langgraph-latency",
+        type=float,
+        default=0.01,
+        help="Seconds per fake LangGraph API call"
+    )
+    parser.add_argument(
+        "--throttle-every",
+        type=int,
+        default=0,
+        help="Answer every Nth Graph request with 429 (0 disables throttling)"
+    )
+    parser.add_argument(
+        "--retry-after",
+        type=float,
+        default=0.1,
+        help="Retry-After seconds sent with each fake 429"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=lambda value: [int(c) for c in value.split(",")],
+        default=[1, 4, 16],
+        help="Comma-separated --concurrency values to compare"
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        help="Runs per concurrency value"
+    )
+    parser.add_argument(
+        "--ingest-args",
+        type=str,
+        default="",
+        help="Extra run-ingest-outlook.py arguments, added after --rerun --thread-cache-size 0, "
+             "e.g. \"--coalesce --run-cleanup skip\""
+    )
+    parser.add_argument(
+        "--json",
+        type=str,
+        default=None,
+        help="Also write results to this JSON file (for regression comparison)"
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Show the ingest script's own output"
+    )
+    args = parser.parse_args()
+    if args.messages < 1 or args.conversations < 1:
+        parser.error("--messages and --conversations must be at least 1")
+    return args
+
+if __name__ == "__main__":
+    exit(asyncio.run(main(parse_args())))
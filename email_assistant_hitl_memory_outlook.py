@@ -28,8 +28,15 @@ The workflow uses LangGraph to orchestrate the multi-step process, storing inter
 states and allowing interrupts for human feedback.
 """
 
+import atexit
+import hashlib
+import os
+import re
+import threading
+import time
 from typing import Literal
 
+import httpx
 from langchain.chat_models import init_chat_model
 
 from langgraph.graph import StateGraph, START, END
@@ -68,15 +75,248 @@ tools = get_tools(
 )
 tools_by_name = get_tools_by_name(tools)
 
-# Initialize the LLM for use with router / structured output
+# Model used by every role unless overridden below
+DEFAULT_MODEL = os.getenv("EMAIL_ASSISTANT_MODEL", "openai:gpt-4.1")
+
+# Model per role, each configurable on its own, e.g. a cheaper router:
+#   EMAIL_ASSISTANT_ROUTER_MODEL=openai:gpt-4.1-mini
+MODEL_ROLES = {
+    "router": os.getenv("EMAIL_ASSISTANT_ROUTER_MODEL", DEFAULT_MODEL),   # triage classification
+    "agent": os.getenv("EMAIL_ASSISTANT_AGENT_MODEL", DEFAULT_MODEL),     # tool-calling response agent
+    "memory": os.getenv("EMAIL_ASSISTANT_MEMORY_MODEL", DEFAULT_MODEL),   # preference profile rewrites
+}
+
 # Temperature 0.0 ensures deterministic responses
-llm = init_chat_model("openai:gpt-4.1", temperature=0.0)
-llm_router = llm.with_structured_output(RouterSchema)
+MODEL_TEMPERATURE = float(os.getenv("EMAIL_ASSISTANT_TEMPERATURE", "0.0"))
+
+# Connection pool shared by every OpenAI model built by the registry
+MODEL_MAX_CONNECTIONS = int(os.getenv("EMAIL_ASSISTANT_MAX_CONNECTIONS", "20"))
+
+
+class ModelRegistry:
+    """
+    Builds each chat model and role binding once and hands out the same instance.
+
+    Roles (router, agent, memory) map to a model spec in MODEL_ROLES. Roles that name
+    the same spec share one underlying chat model; OpenAI models additionally share
+    one pair of httpx clients, so every role draws from the same connection pool
+    instead of each opening its own. Nothing is built until a role is first used,
+    which keeps import (cold start) cheap.
+
+    Args:
+        role_models: Mapping of role name to "provider:model" spec
+        temperature: Sampling temperature for every model
+        max_connections: Size of the shared HTTP connection pool
+    """
+
+    def __init__(self, role_models=MODEL_ROLES, temperature=MODEL_TEMPERATURE,
+                 max_connections=MODEL_MAX_CONNECTIONS):
+        self.role_models = dict(role_models)
+        self.temperature = temperature
+        self.max_connections = max_connections
+        self._bindings = {}
+        self._binders = {}
+        self._models = {}
+        self._http_clients = None
+        self._lock = threading.RLock()
+
+    def bind(self, role, binder):
+        """
+        Register how a role's model is specialised (structured output, tools, ...).
+
+        Args:
+            role: Role name from MODEL_ROLES
+            binder: Callable taking the base chat model and returning the bound runnable
+        """
+        with self._lock:
+            self._binders[role] = binder
+            self._bindings.pop(role, None)
+
+    def get(self, role):
+        """
+        Return the bound model for a role, building it on first use.
+
+        Args:
+            role: Role name from MODEL_ROLES
+
+        Returns:
+            The runnable for that role (the same object on every call)
+        """
+        binding = self._bindings.get(role)
+        if binding is not None:
+            return binding
+        with self._lock:
+            if role not in self._bindings:
+                model = self.model(self.role_models[role])
+                binder = self._binders.get(role)
+                self._bindings[role] = binder(model) if binder else model
+            return self._bindings[role]
+
+    def model(self, spec):
+        """Return the base chat model for a spec, building it once."""
+        with self._lock:
+            if spec not in self._models:
+                self._models[spec] = init_chat_model(spec, temperature=self.temperature, **self._client_kwargs(spec))
+            return self._models[spec]
+
+    def _client_kwargs(self, spec):
+        """Return shared HTTP client kwargs for providers that accept them."""
+        if not spec.startswith("openai:"):
+            return {}
+        if self._http_clients is None:
+            limits = httpx.Limits(max_connections=self.max_connections,
+                                  max_keepalive_connections=self.max_connections)
+            self._http_clients = (httpx.Client(limits=limits), httpx.AsyncClient(limits=limits))
+        return {"http_client": self._http_clients[0], "http_async_client": self._http_clients[1]}
+
+
+# Shared by every node in this module
+models = ModelRegistry()
+
+# Router: structured output so the LLM returns a classification; include_raw keeps
+# the AIMessage so its token usage (including provider cache hits) can be recorded
+models.bind("router", lambda llm: llm.with_structured_output(RouterSchema, include_raw=True))
+
+# Agent: bind_tools ensures the LLM will call one of the available tools
+models.bind("agent", lambda llm: llm.bind_tools(tools, tool_choice="required"))
+
+# Memory writer: structured output keeps the updated profile well-formed
+models.bind("memory", lambda llm: llm.with_structured_output(UserPreferences))
+
+# ============================================================================
+# Memory Cache
+# ============================================================================
+
+# Preference profiles only change when update_memory runs, yet triage_router reads
+# one per email and llm_call reads two on every ReAct iteration. These namespaces are
+# served from an in-process cache instead of a store round-trip each time.
+CACHED_MEMORY_NAMESPACES = {
+    ("email_assistant", "triage_preferences"),
+    ("email_assistant", "response_preferences"),
+    ("email_assistant", "cal_preferences"),
+}
+
+# Seconds a cached profile is trusted before it is re-read from the store.
+# Writes from this process update the cache immediately; the TTL only bounds how long
+# another worker's update_memory can go unseen. Set to 0 to disable the cache.
+MEMORY_CACHE_TTL = float(os.getenv("MEMORY_CACHE_TTL", "60"))
+
+
+class MemoryCache:
+    """
+    Versioned, write-through cache for memory profiles.
 
-# Initialize the LLM, enforcing tool use (of any available tools) for agent
-# bind_tools ensures the LLM will call one of the available tools
-llm = init_chat_model("openai:gpt-4.1", temperature=0.0)
-llm_with_tools = llm.bind_tools(tools, tool_choice="required")
+    Each namespace maps to (value, expires_at), plus a version counter that increases
+    only when the profile content actually changes: a local write through
+    update_memory, or a TTL re-read that finds another worker's write. Re-reading an
+    unchanged profile keeps the version, so callers can use it as a cheap "has this
+    profile changed" token (see PromptCache).
+
+    Entries are keyed by the underlying store (see underlying_store) and namespace.
+    LangGraph hands each run its own store wrapper around the same underlying store,
+    so runs share entries, while two separate stores in one process (tests, several
+    graphs) never see each other's profiles. Whether an entry is still current is
+    decided by the TTL.
+
+    Args:
+        ttl: Seconds an entry is served before the store is consulted again
+        namespaces: Namespaces eligible for caching; others always go to the store
+    """
+
+    def __init__(self, ttl=MEMORY_CACHE_TTL, namespaces=CACHED_MEMORY_NAMESPACES):
+        self.ttl = ttl
+        self.namespaces = set(namespaces)
+        self._entries = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def enabled_for(self, namespace):
+        """Return True if reads of this namespace may be served from the cache."""
+        return self.ttl > 0 and tuple(namespace) in self.namespaces
+
+    @staticmethod
+    def _key(store, namespace):
+        store = underlying_store(store)
+        return (id(store), tuple(namespace)), store
+
+    def lookup(self, store, namespace):
+        """
+        Return the cached value for a namespace, or None on a miss or expired entry.
+
+        Args:
+            store: Store the profile lives in (a run's wrapper or the store itself)
+            namespace: Memory namespace tuple
+
+        Returns:
+            The cached profile string, or None if the store must be consulted
+        """
+        key, store = self._key(store, namespace)
+        with self._lock:
+            entry = self._entries.get(key)
+            # The entry holds its store, so a new store reusing a freed id() misses
+            if entry and entry[2] is store and entry[1] > time.monotonic():
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def fill(self, store, namespace, value):
+        """
+        Record a value read from (or written to) the store.
+
+        The namespace version is bumped only when the value differs from the last
+        one seen, so a TTL refresh that finds the same profile keeps downstream
+        caches warm.
+
+        Args:
+            store: Store the value was read from or written to
+            namespace: Memory namespace tuple
+            value: Current profile content
+        """
+        key, store = self._key(store, namespace)
+        namespace = key[1]
+        with self._lock:
+            version, last_value = self._versions.get(namespace, (0, None))
+            if version == 0 or last_value != value:
+                self._versions[namespace] = (version + 1, value)
+            self._entries[key] = (value, time.monotonic() + self.ttl, store)
+
+    def invalidate(self, namespace=None):
+        """
+        Drop one namespace (or everything), in every store, so the next read goes
+        to the store.
+
+        Args:
+            namespace: Namespace tuple to drop, or None to clear the whole cache
+        """
+        with self._lock:
+            if namespace is None:
+                self._entries.clear()
+            else:
+                namespace = tuple(namespace)
+                for key in [key for key in self._entries if key[1] == namespace]:
+                    del self._entries[key]
+
+    def version(self, namespace):
+        """Return the current version counter for a namespace (0 if never seen)."""
+        with self._lock:
+            return self._versions.get(tuple(namespace), (0, None))[0]
+
+    def stats(self):
+        """Return hit/miss counters and the hit rate as a dict."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Shared by every node in this module
+memory_cache = MemoryCache()
 
 # ============================================================================
 # Memory Management Functions
@@ -89,6 +329,9 @@ def get_memory(store, namespace, default_content=None):
     This function implements a "lazy initialization" pattern - if memory hasn't been
     stored yet, it creates it with sensible defaults. This allows the agent to learn
     and improve as it interacts with users.
+
+    Preference namespaces in CACHED_MEMORY_NAMESPACES are served from memory_cache
+    for up to MEMORY_CACHE_TTL seconds, so steady-state reads skip the store.
     
     Args:
         store: LangGraph BaseStore instance to search for existing memory
@@ -98,20 +341,31 @@ def get_memory(store, namespace, default_content=None):
     Returns:
         str: The content of the memory profile, either from existing memory or the default
     """
+    # Serve preference profiles from the cache when possible
+    cacheable = memory_cache.enabled_for(namespace)
+    if cacheable:
+        cached = memory_cache.lookup(store, namespace)
+        if cached is not None:
+            return cached
+
     # Search for existing memory with namespace and key
     user_preferences = store.get(namespace, "user_preferences")
     
     # If memory exists, return its content (the value)
     if user_preferences:
-        return user_preferences.value
+        user_preferences = user_preferences.value
     
     # If memory doesn't exist, add it to the store and return the default content
     else:
         # Namespace, key, value
         store.put(namespace, "user_preferences", default_content)
         user_preferences = default_content
+
+    # Remember what the store holds so the next read skips the round-trip
+    if cacheable and user_preferences is not None:
+        memory_cache.fill(store, namespace, user_preferences)
     
-    # Return the default content
+    # Return the content
     return user_preferences 
 
 def update_memory(store, namespace, messages):
@@ -122,31 +376,638 @@ def update_memory(store, namespace, messages):
     edits a response, ignores a suggestion, or provides feedback, this function
     updates the stored preferences so future responses are better aligned with
     user preferences.
+
+    The profile rewrite is an LLM call, so by default it is handed to the background
+    memory_updater and this function returns immediately; the human's accept / edit /
+    ignore action is no longer held up by it. Set MEMORY_UPDATE_ASYNC=0 to rewrite
+    inline instead; an inline rewrite that keeps losing the compare-and-swap is
+    queued on memory_updater rather than failing the run.
     
     Args:
         store: LangGraph BaseStore instance to update memory
         namespace: Tuple defining the memory namespace, e.g. ("email_assistant", "triage_preferences")
         messages: List of messages to update the memory with (usually includes user feedback)
     """
+    if MEMORY_UPDATE_ASYNC:
+        memory_updater.submit(store, namespace, messages)
+        return
+    try:
+        rewrite_memory(store, namespace, [messages])
+    except MemoryConflictError as e:
+        print(f"🧠 {e}; queued for a background retry")
+        memory_updater.submit(store, namespace, messages)
 
-    # Get the existing memory
-    user_preferences = store.get(namespace, "user_preferences")
-    
-    # Initialize LLM with structured output for updating preferences
-    # This ensures the updated memory is well-structured and consistent
-    llm = init_chat_model("openai:gpt-4.1", temperature=0.0).with_structured_output(UserPreferences)
-    
-    # Call the LLM to intelligently update the memory based on the feedback messages
-    # The MEMORY_UPDATE_INSTRUCTIONS tells the LLM how to incorporate user feedback
-    result = llm.invoke(
-        [
-            {"role": "system", "content": MEMORY_UPDATE_INSTRUCTIONS.format(current_profile=user_preferences.value, namespace=namespace)},
-        ] + messages
-    )
-    
-    # Save the updated memory to the store for future use
-    store.put(namespace, "user_preferences", result.user_preferences)
 
+def rewrite_memory(store, namespace, events):
+    """
+    Rewrite a memory profile from one or more feedback events.
+
+    All events are folded into a single LLM call. The stored profile is applied with
+    compare-and-swap: the item is re-read just before the write, and if another
+    writer changed it while the LLM was running, the rewrite is redone on top of the
+    newer profile (up to MEMORY_UPDATE_CAS_RETRIES times) instead of clobbering it.
+    If it still loses after that, nothing is written and MemoryConflictError is
+    raised, so the caller can queue the events again.
+
+    Args:
+        store: LangGraph BaseStore instance to update memory
+        namespace: Tuple defining the memory namespace
+        events: List of message lists, one per feedback event, oldest first
+
+    Returns:
+        str: The profile that was written
+
+    Raises:
+        MemoryConflictError: The profile kept changing on every attempt
+    """
+    # Flatten the events; tell the LLM how many there are when more than one was merged
+    messages = [message for event in events for message in event]
+    if len(events) > 1:
+        messages = [{
+            "role": "user",
+            "content": f"The following {len(events)} feedback events arrived since the profile was last updated. Incorporate all of them."
+        }] + messages
+
+    # Shared structured-output model for updating preferences
+    llm = models.get("memory")
+
+    for attempt in range(1, MEMORY_UPDATE_CAS_RETRIES + 2):
+        # Get the existing memory and remember which revision we are rewriting
+        user_preferences = store.get(namespace, "user_preferences")
+        revision = _memory_revision(user_preferences)
+        current_profile = user_preferences.value if user_preferences else ""
+
+        # Call the LLM to intelligently update the memory based on the feedback messages
+        # The MEMORY_UPDATE_INSTRUCTIONS tells the LLM how to incorporate user feedback
+        result = llm.invoke(
+            [
+                {"role": "system", "content": MEMORY_UPDATE_INSTRUCTIONS.format(current_profile=current_profile, namespace=namespace)},
+            ] + messages
+        )
+
+        # Compare-and-swap: only write if nobody else updated the profile meanwhile.
+        # BaseStore has no conditional put, so the check and write are serialized
+        # in-process by _memory_write_lock; across workers the window is one get/put.
+        with _memory_write_lock:
+            if _memory_revision(store.get(namespace, "user_preferences")) == revision:
+                # Save the updated memory to the store for future use
+                store.put(namespace, "user_preferences", result.user_preferences)
+                break
+        if attempt > MEMORY_UPDATE_CAS_RETRIES:
+            # Writing now would drop whatever the other writer just saved
+            raise MemoryConflictError(
+                f"Memory {namespace[-1]} changed during each of {attempt} rewrites, not overwriting it"
+            )
+        print(f"🧠 Memory {namespace[-1]} changed during rewrite, retrying ({attempt}/{MEMORY_UPDATE_CAS_RETRIES})")
+
+    # Write through so this process sees the new profile (and a new version) at once
+    if memory_cache.enabled_for(namespace):
+        memory_cache.fill(store, namespace, result.user_preferences)
+    else:
+        memory_cache.invalidate(namespace)
+
+    return result.user_preferences
+
+
+class MemoryConflictError(RuntimeError):
+    """Raised when a memory rewrite loses the compare-and-swap on every attempt."""
+
+
+def _memory_revision(item):
+    """Return a token identifying the stored revision of a memory item (None if absent)."""
+    if item is None:
+        return None
+    return getattr(item, "updated_at", None) or item.value
+
+
+# ============================================================================
+# Background Memory Updates
+# ============================================================================
+
+# Run update_memory rewrites on a background thread instead of inside the HITL nodes
+MEMORY_UPDATE_ASYNC = os.getenv("MEMORY_UPDATE_ASYNC", "1") != "0"
+
+# Seconds to wait after the first queued event for a namespace before rewriting it,
+# so a burst of feedback (several edits in one review session) costs one LLM call
+MEMORY_UPDATE_DEBOUNCE = float(os.getenv("MEMORY_UPDATE_DEBOUNCE", "2.0"))
+
+# Rewrite immediately once this many events are queued for a namespace
+MEMORY_UPDATE_MAX_BATCH = int(os.getenv("MEMORY_UPDATE_MAX_BATCH", "8"))
+
+# How many times a rewrite is redone when the profile changed underneath it
+MEMORY_UPDATE_CAS_RETRIES = 3
+
+# Serializes the compare-and-swap check with the write
+_memory_write_lock = threading.Lock()
+
+
+def underlying_store(store):
+    """
+    Return the store a per-run LangGraph store wrapper delegates to.
+
+    Batched store wrappers keep the real store in `_store` and are tied to the
+    run's event loop, so background writes must bypass them. Stores that are not
+    wrappers are returned unchanged.
+    """
+    while getattr(store, "_store", None) is not None:
+        store = store._store
+    return store
+
+
+class MemoryUpdateWorker:
+    """
+    Debounced background worker for memory profile rewrites.
+
+    Feedback events are queued per namespace. A daemon thread waits until a
+    namespace's oldest event is MEMORY_UPDATE_DEBOUNCE seconds old (or the batch is
+    full), then hands the whole batch to rewrite_memory as one LLM call. Namespaces
+    are independent: a burst of response feedback does not delay triage updates.
+
+    Events from different graph runs merge even though each run passes its own
+    store wrapper; the rewrite goes to the underlying store (see underlying_store),
+    which outlives the run that queued the event.
+
+    A batch whose rewrite keeps losing the compare-and-swap (MemoryConflictError)
+    is queued again, ahead of any newer events for its namespace, and retried
+    after another debounce instead of being dropped or written blindly.
+
+    Args:
+        debounce: Seconds to collect events before rewriting a namespace
+        max_batch: Events that trigger an immediate rewrite
+    """
+
+    def __init__(self, debounce=MEMORY_UPDATE_DEBOUNCE, max_batch=MEMORY_UPDATE_MAX_BATCH):
+        self.debounce = debounce
+        self.max_batch = max_batch
+        self._pending = {}
+        self._busy = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self.events = 0
+        self.rewrites = 0
+        self.failures = 0
+        self.conflicts = 0
+
+    def submit(self, store, namespace, messages):
+        """
+        Queue a feedback event and return immediately.
+
+        Args:
+            store: Store the profile lives in
+            namespace: Memory namespace tuple
+            messages: Feedback messages for this event
+        """
+        key = tuple(namespace)
+        store = underlying_store(store)
+        with self._cond:
+            if key in self._pending:
+                _, _, first_at, events = self._pending[key]
+            else:
+                first_at, events = time.monotonic(), []
+            events.append(list(messages))
+            self._pending[key] = (store, key, first_at, events)
+            self.events += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="memory-updater", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _next_batch(self):
+        """Block until some namespace is due, then pop and return its batch."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                due_in = None
+                for key, (store, namespace, first_at, events) in self._pending.items():
+                    wait = first_at + self.debounce - now
+                    if wait <= 0 or len(events) >= self.max_batch:
+                        del self._pending[key]
+                        self._busy += 1
+                        return store, namespace, events
+                    due_in = wait if due_in is None else min(due_in, wait)
+                self._cond.wait(due_in)
+
+    def _run(self):
+        """Worker loop: rewrite each due namespace, never letting one failure stop the thread."""
+        while True:
+            store, namespace, events = self._next_batch()
+            try:
+                rewrite_memory(store, namespace, events)
+                self.rewrites += 1
+                if len(events) > 1:
+                    print(f"🧠 Memory {namespace[-1]} updated from {len(events)} merged feedback events")
+            except MemoryConflictError as e:
+                self.conflicts += 1
+                print(f"🧠 {e}; retrying in {self.debounce:g}s")
+                self._requeue(store, namespace, events)
+            except Exception as e:
+                self.failures += 1
+                print(f"⚠️ Memory update for {namespace[-1]} failed: {e}")
+            finally:
+                with self._cond:
+                    self._busy -= 1
+                    self._cond.notify_all()
+
+    def _requeue(self, store, namespace, events):
+        """Put a batch back in front of any events queued for its namespace meanwhile."""
+        with self._cond:
+            if namespace in self._pending:
+                _, _, _, newer = self._pending[namespace]
+                events = events + newer
+            self._pending[namespace] = (store, namespace, time.monotonic(), events)
+
+    def flush(self, timeout=None):
+        """
+        Make every queued event due now and wait until they have been written.
+
+        Args:
+            timeout: Maximum seconds to wait, or None to wait indefinitely
+
+        Returns:
+            bool: True if the queue drained within the timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            for key, (store, namespace, first_at, events) in list(self._pending.items()):
+                self._pending[key] = (store, namespace, first_at - self.debounce, events)
+            self._cond.notify_all()
+            while self._pending or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stats(self):
+        """Return event, rewrite, conflict and failure counters as a dict."""
+        with self._cond:
+            return {
+                "events": self.events,
+                "rewrites": self.rewrites,
+                "conflicts": self.conflicts,
+                "failures": self.failures,
+                "pending": sum(len(entry[3]) for entry in self._pending.values()),
+            }
+
+
+# Shared by every node in this module; flushed at interpreter exit so queued
+# feedback is not lost when a worker process shuts down
+memory_updater = MemoryUpdateWorker()
+atexit.register(memory_updater.flush, 30)
+
+
+# ============================================================================
+# Prompt Assembly and Prefix Caching
+# ============================================================================
+
+# Move learned preferences to the end of the system prompt so everything before them
+# (role, background, tool docs) is byte-identical across emails. Provider-side prompt
+# caching only matches on an exact prefix, so a preference in the middle of the prompt
+# would make the whole tail uncacheable. Set to 0 to keep the templates' own layout.
+PROMPT_PREFERENCES_LAST = os.getenv("PROMPT_PREFERENCES_LAST", "1") != "0"
+
+# Print prompt cache statistics every this many LLM calls (0 = only at exit)
+PROMPT_CACHE_REPORT_EVERY = int(os.getenv("PROMPT_CACHE_REPORT_EVERY", "100"))
+
+
+class PromptCache:
+    """
+    Assembles system prompts with a stable prefix and memoizes the result.
+
+    A prompt is identified by a name (e.g. "triage") and rebuilt only when one of its
+    preference profiles changes. Changes are detected from memory_cache versions, or
+    from a content hash for namespaces that are not cached. Between changes the same
+    string object is returned, so no str.format runs on the hot path.
+
+    The cache also tallies what the provider reports per call: input tokens, how many
+    of them were served from the provider's prompt cache, and call latency.
+    """
+
+    def __init__(self):
+        self._prompts = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.calls = {}
+
+    def system_prompt(self, name, template, static, preferences):
+        """
+        Return the system prompt for a template, building it only if preferences changed.
+
+        Args:
+            name: Identifier for this prompt, e.g. "triage" or "agent"
+            template: str.format template from email_assistant.prompts
+            static: Template fields that never change between emails
+            preferences: List of (field, label, namespace, value) for learned profiles
+
+        Returns:
+            str: The formatted system prompt
+        """
+        key = tuple(self._preference_token(namespace, value) for _, _, namespace, value in preferences)
+        with self._lock:
+            entry = self._prompts.get(name)
+            if entry and entry[0] == key:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        if PROMPT_PREFERENCES_LAST:
+            # Point the template at the trailing sections, then append them in order
+            fields = dict(static)
+            for field, label, _, _ in preferences:
+                fields[field] = f"See the < {label} > section at the end of this prompt."
+            prompt = template.format(**fields).rstrip() + "".join(
+                f"\n\n< {label} >\n{value}\n</ {label} >" for _, label, _, value in preferences
+            )
+        else:
+            prompt = template.format(**static, **{field: value for field, _, _, value in preferences})
+
+        with self._lock:
+            self._prompts[name] = (key, prompt)
+        return prompt
+
+    def _preference_token(self, namespace, value):
+        """Return a cheap token that changes whenever a preference profile changes.
+
+        For cached namespaces the value itself rides along with the version: a cache
+        hit returns the same string object, so comparing it is an identity check,
+        and a profile served for another store (versions are per namespace) still
+        never reuses a prompt built from a different value.
+        """
+        if memory_cache.enabled_for(namespace) and memory_cache.version(namespace):
+            return memory_cache.version(namespace), value
+        return hashlib.sha1(str(value).encode("utf-8")).hexdigest()
+
+    def record(self, name, message, seconds):
+        """
+        Tally provider usage for one LLM call made with a cached prompt.
+
+        Args:
+            name: Prompt identifier the call used
+            message: AIMessage returned by the model (usage_metadata is read if present)
+            seconds: Wall-clock duration of the call
+        """
+        usage = getattr(message, "usage_metadata", None) or {}
+        cached = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+        with self._lock:
+            calls = self.calls.setdefault(name, {"calls": 0, "input_tokens": 0, "cached_tokens": 0, "seconds": 0.0})
+            calls["calls"] += 1
+            calls["input_tokens"] += usage.get("input_tokens", 0) or 0
+            calls["cached_tokens"] += cached
+            calls["seconds"] += seconds
+            total = sum(c["calls"] for c in self.calls.values())
+        if PROMPT_CACHE_REPORT_EVERY and total % PROMPT_CACHE_REPORT_EVERY == 0:
+            self.report()
+
+    def stats(self):
+        """Return local memo and provider cache statistics as a dict."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            per_prompt = {}
+            for name, c in self.calls.items():
+                per_prompt[name] = dict(
+                    c,
+                    cached_fraction=c["cached_tokens"] / c["input_tokens"] if c["input_tokens"] else 0.0,
+                    avg_seconds=c["seconds"] / c["calls"] if c["calls"] else 0.0,
+                )
+            return {
+                "prefix_hits": self.hits,
+                "prefix_misses": self.misses,
+                "prefix_hit_rate": self.hits / lookups if lookups else 0.0,
+                "prompts": per_prompt,
+            }
+
+    def report(self):
+        """Print a one-line summary per prompt."""
+        stats = self.stats()
+        if not stats["prompts"]:
+            return
+        print(f"📊 Prompt prefix memo: {stats['prefix_hits']} hits / {stats['prefix_misses']} builds "
+              f"({stats['prefix_hit_rate']:.0%})")
+        for name, c in stats["prompts"].items():
+            print(f"   {name}: {c['calls']} calls, {c['cached_tokens']}/{c['input_tokens']} input tokens "
+                  f"from provider cache ({c['cached_fraction']:.0%}), avg {c['avg_seconds']:.2f}s")
+
+
+# Shared by every node in this module; the final tally is printed at exit
+prompt_cache = PromptCache()
+atexit.register(prompt_cache.report)
+
+# ============================================================================
+# Pre-Triage Rules
+# ============================================================================
+
+# Run the local rules below before the router LLM (0 sends every email to the LLM)
+PRE_TRIAGE = os.getenv("PRE_TRIAGE", "1") != "0"
+
+# Weight of each signal; an email is ignored without an LLM call once the total
+# reaches PRE_TRIAGE_IGNORE_SCORE. No single rule is enough on its own, so a
+# mailing-list discussion (List-Unsubscribe only) still reaches the LLM, while a
+# newsletter (List-Unsubscribe plus bulk precedence or a no-reply sender) does not.
+# Learned verdicts stay below the threshold by themselves (sender and domain are not
+# added together): they only tip mail that already looks automated, so a sender is
+# never locked out of the LLM, and edits to the triage preferences, by history alone.
+PRE_TRIAGE_WEIGHTS = {
+    "list_unsubscribe": 2,   # List-Unsubscribe header present
+    "precedence_bulk": 2,    # Precedence: bulk / junk
+    "auto_submitted": 1,     # Auto-Submitted other than "no", or X-Auto-Response-Suppress
+    "no_reply_sender": 2,    # noreply@, do-not-reply@, mailer-daemon@, ...
+    "learned_sender": 2,     # this address was ignored before and never kept
+    "learned_domain": 1,     # this domain was ignored before and never kept
+}
+PRE_TRIAGE_IGNORE_SCORE = int(os.getenv("PRE_TRIAGE_IGNORE_SCORE", "3"))
+
+# Ignore verdicts needed (with no "keep" verdicts) before a sender or domain counts;
+# one kept more often than ignored always goes to the LLM
+PRE_TRIAGE_LEARN_MIN = int(os.getenv("PRE_TRIAGE_LEARN_MIN", "3"))
+
+# Learned verdicts not refreshed for this many days stop counting, so the LLM sees
+# (and re-judges) the sender again
+PRE_TRIAGE_VERDICT_MAX_AGE_DAYS = float(os.getenv("PRE_TRIAGE_VERDICT_MAX_AGE_DAYS", "30"))
+
+# Store namespace holding one item per sender domain:
+#   {"domain": {"ignore": n, "keep": n, "at": ts}, "senders": {address: {...}}}
+# so pre-triage reads a single item per email and a verdict writes a single item.
+# Nothing is read or written here while PRE_TRIAGE is off.
+SENDER_VERDICTS_NAMESPACE = ("email_assistant", "sender_verdicts")
+
+# Print pre-triage statistics every this many emails (0 = only at exit)
+PRE_TRIAGE_REPORT_EVERY = int(os.getenv("PRE_TRIAGE_REPORT_EVERY", "100"))
+
+NO_REPLY_PATTERN = re.compile(
+    r"^(?:no[-_.]?reply|do[-_.]?not[-_.]?reply|mailer-daemon|postmaster|bounces?)(?:[+-][^@]*)?@",
+    re.IGNORECASE,
+)
+ADDRESS_PATTERN = re.compile(r"<([^<>@\s]+@[^<>\s]+)>|([^<>@\s]+@[^<>\s,]+)")
+
+
+def sender_address(email_input):
+    """Return the lower-cased sender address from an email_input dict ("" if none)."""
+    match = ADDRESS_PATTERN.search(email_input.get("from") or "")
+    return (match.group(1) or match.group(2)).lower() if match else ""
+
+
+def load_sender_verdicts(store, sender):
+    """
+    Read the learned verdicts for a sender's domain (one store get).
+
+    Args:
+        store: LangGraph BaseStore holding learned sender verdicts
+        sender: Lower-cased sender address
+
+    Returns:
+        dict: {"domain": {...}, "senders": {...}, "revision": ...}, empty counters if
+              nothing was learned; "revision" identifies the item read, for the
+              compare-and-swap in record_sender_verdict
+    """
+    item = store.get(SENDER_VERDICTS_NAMESPACE, sender.rsplit("@", 1)[-1])
+    value = item.value if item else {}
+    return {
+        "domain": dict(value.get("domain", {})),
+        "senders": {address: dict(counts) for address, counts in value.get("senders", {}).items()},
+        "revision": _memory_revision(item),
+    }
+
+
+def pre_triage(email_input, verdicts):
+    """
+    Classify obvious bulk and automated mail without calling the router LLM.
+
+    Scores header rules (List-Unsubscribe, Precedence, Auto-Submitted), no-reply
+    sender patterns and learned sender / domain verdicts using PRE_TRIAGE_WEIGHTS.
+    Only "ignore" is ever decided locally; anything the rules are not confident
+    about returns None and goes to the LLM. A sender or domain kept more often
+    than ignored always goes to the LLM.
+
+    Headers come from email_input["headers"], which run-ingest-outlook.py fills
+    (with --triage-headers) from internetMessageHeaders; emails without them are
+    scored on sender alone.
+
+    Args:
+        email_input: The email_input dict from the graph state
+        verdicts: Learned verdicts for the sender's domain (see load_sender_verdicts)
+
+    Returns:
+        tuple: (classification or None, list of matched rule names)
+    """
+    headers = {name.lower(): str(value).lower() for name, value in (email_input.get("headers") or {}).items()}
+    sender = sender_address(email_input)
+    reasons = []
+
+    if "list-unsubscribe" in headers:
+        reasons.append("list_unsubscribe")
+    if headers.get("precedence", "").strip() in ("bulk", "junk"):
+        reasons.append("precedence_bulk")
+    if headers.get("auto-submitted", "no").strip() != "no" or "x-auto-response-suppress" in headers:
+        reasons.append("auto_submitted")
+    if NO_REPLY_PATTERN.match(sender):
+        reasons.append("no_reply_sender")
+
+    # Learned verdicts: mostly-kept senders veto the shortcut; stale ignores no longer count
+    fresh_after = time.time() - PRE_TRIAGE_VERDICT_MAX_AGE_DAYS * 86400
+    for counts, rule in ((verdicts["senders"].get(sender, {}), "learned_sender"), (verdicts["domain"], "learned_domain")):
+        if counts.get("keep", 0) > counts.get("ignore", 0):
+            return None, reasons
+        if (counts.get("ignore", 0) >= PRE_TRIAGE_LEARN_MIN and not counts.get("keep", 0)
+                and counts.get("at", 0) >= fresh_after):
+            reasons.append(rule)
+            break
+
+    score = sum(PRE_TRIAGE_WEIGHTS[reason] for reason in reasons)
+    return ("ignore" if score >= PRE_TRIAGE_IGNORE_SCORE else None), reasons
+
+
+def record_sender_verdict(store, email_input, verdict, verdicts=None):
+    """
+    Learn from a triage outcome for the email's sender address and domain.
+
+    Called with the router's decision and with every human override (ignoring a
+    notification or a draft, or choosing to respond), so the user's choices are
+    what ultimately keep or block a sender.
+
+    Does nothing while PRE_TRIAGE is off, and skips the write for a "keep" when
+    the sender and domain are already kept more often than ignored (another
+    "keep" cannot change any pre-triage decision). The domain item is updated
+    with compare-and-swap like rewrite_memory, so concurrent runs do not lose
+    each other's counts; after MEMORY_UPDATE_CAS_RETRIES conflicts the verdict
+    is dropped rather than overwriting the newer counts.
+
+    Args:
+        store: LangGraph BaseStore holding learned sender verdicts
+        email_input: The email_input dict from the graph state
+        verdict: "ignore" if the email was ignored, "keep" if it was responded to or surfaced
+        verdicts: Verdicts already read for this email by pre-triage, to skip a store get
+    """
+    sender = sender_address(email_input)
+    if not PRE_TRIAGE or not sender:
+        return
+    domain = sender.rsplit("@", 1)[-1]
+    for attempt in range(1, MEMORY_UPDATE_CAS_RETRIES + 2):
+        if verdicts is None:
+            verdicts = load_sender_verdicts(store, sender)
+        sender_counts = verdicts["senders"].setdefault(sender, {})
+        if verdict == "keep" and all(
+            counts.get("keep", 0) > counts.get("ignore", 0) for counts in (verdicts["domain"], sender_counts)
+        ):
+            return
+        now = time.time()
+        for counts in (verdicts["domain"], sender_counts):
+            counts[verdict] = counts.get(verdict, 0) + 1
+            counts["at"] = now
+        with _memory_write_lock:
+            if _memory_revision(store.get(SENDER_VERDICTS_NAMESPACE, domain)) == verdicts["revision"]:
+                store.put(SENDER_VERDICTS_NAMESPACE, domain,
+                          {"domain": verdicts["domain"], "senders": verdicts["senders"]})
+                return
+        # Another run recorded a verdict for this domain meanwhile: re-read and re-apply
+        verdicts = None
+    print(f"⚠️ Sender verdict for {sender} not recorded: the {domain} verdicts kept changing")
+
+
+class PreTriageStats:
+    """Counts how many triage decisions were made locally instead of by the LLM."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.emails = 0
+        self.avoided = 0
+        self.rules = {}
+
+    def record(self, classification, reasons):
+        """Record one pre-triage outcome (classification is None when the LLM was used)."""
+        with self._lock:
+            self.emails += 1
+            if classification is not None:
+                self.avoided += 1
+                for reason in reasons:
+                    self.rules[reason] = self.rules.get(reason, 0) + 1
+            emails = self.emails
+        if PRE_TRIAGE_REPORT_EVERY and emails % PRE_TRIAGE_REPORT_EVERY == 0:
+            self.report()
+
+    def stats(self):
+        """Return counters and the fraction of LLM triage calls avoided as a dict."""
+        with self._lock:
+            return {
+                "emails": self.emails,
+                "llm_calls_avoided": self.avoided,
+                "avoided_fraction": self.avoided / self.emails if self.emails else 0.0,
+                "rules": dict(self.rules),
+            }
+
+    def report(self):
+        """Print a one-line summary."""
+        stats = self.stats()
+        if not stats["emails"]:
+            return
+        rules = ", ".join(f"{name}={count}" for name, count in sorted(stats["rules"].items()))
+        print(f"📊 Pre-triage: {stats['llm_calls_avoided']}/{stats['emails']} emails decided locally "
+              f"({stats['avoided_fraction']:.0%} of LLM triage calls avoided){': ' + rules if rules else ''}")
+
+
+# Shared by every node in this module; the final tally is printed at exit
+pre_triage_stats = PreTriageStats()
+atexit.register(pre_triage_stats.report)
 
 # ============================================================================
 # Workflow Nodes (LangGraph Steps)
@@ -162,6 +1023,7 @@ def triage_router(state: State, store: BaseStore) -> Command[Literal["triage_int
     - Messages meant for other teams
     
     This uses the user's learned triage preferences to make more accurate decisions over time.
+    Obvious bulk and automated mail is ignored by pre_triage() without calling the LLM.
     
     Returns:
         Command directing the workflow to:
@@ -170,6 +1032,17 @@ def triage_router(state: State, store: BaseStore) -> Command[Literal["triage_int
         - "__end__": If the email should be ignored
     """
     
+    # Cheap local rules first: confident "ignore" decisions skip the LLM entirely.
+    # The sender's verdicts are read once here and reused when recording the outcome.
+    sender = sender_address(state["email_input"])
+    verdicts = load_sender_verdicts(store, sender) if PRE_TRIAGE and sender else None
+    if PRE_TRIAGE:
+        decision, reasons = pre_triage(state["email_input"], verdicts or {"domain": {}, "senders": {}})
+        pre_triage_stats.record(decision, reasons)
+        if decision == "ignore":
+            print(f"🚫 Classification: IGNORE - Pre-triage rules matched ({', '.join(reasons)})")
+            return Command(goto=END, update={"classification_decision": decision})
+
     # Parse the email input
     author, to, subject, email_thread, email_id = parse_outlook(state["email_input"])
     user_prompt = triage_user_prompt.format(
@@ -182,19 +1055,26 @@ def triage_router(state: State, store: BaseStore) -> Command[Literal["triage_int
     # Search for existing triage_preferences memory (or use defaults if none exist)
     triage_instructions = get_memory(store, ("email_assistant", "triage_preferences"), default_triage_instructions)
 
-    # Format system prompt with background and triage instructions
-    system_prompt = triage_system_prompt.format(
-        background=default_background,
-        triage_instructions=triage_instructions,
+    # System prompt: static background first, learned triage instructions last
+    system_prompt = prompt_cache.system_prompt(
+        "triage",
+        triage_system_prompt,
+        {"background": default_background},
+        [("triage_instructions", "Triage Instructions", ("email_assistant", "triage_preferences"), triage_instructions)],
     )
 
     # Run the router LLM - it will classify the email
-    result = llm_router.invoke(
+    started = time.perf_counter()
+    output = models.get("router").invoke(
         [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
         ]
     )
+    prompt_cache.record("triage", output["raw"], time.perf_counter() - started)
+    if output["parsed"] is None:
+        raise output["parsing_error"] or ValueError("Router returned no classification")
+    result = output["parsed"]
 
     # Decision
     classification = result.classification
@@ -234,6 +1114,9 @@ def triage_router(state: State, store: BaseStore) -> Command[Literal["triage_int
 
     else:
         raise ValueError(f"Invalid classification: {classification}")
+
+    # Teach pre-triage which senders the router ignores and which it keeps
+    record_sender_verdict(store, state["email_input"], "ignore" if classification == "ignore" else "keep", verdicts)
     
     return Command(goto=goto, update=update)
 
@@ -294,6 +1177,7 @@ def triage_interrupt_handler(state: State, store: BaseStore) -> Command[Literal[
             "role": "user",
             "content": f"The user decided to respond to the email, so update the triage preferences to capture this."
         }] + messages)
+        record_sender_verdict(store, state["email_input"], "keep")
 
         goto = "response_agent"
 
@@ -305,6 +1189,7 @@ def triage_interrupt_handler(state: State, store: BaseStore) -> Command[Literal[
                         })
         # Update memory with feedback 
         update_memory(store, ("email_assistant", "triage_preferences"), messages)
+        record_sender_verdict(store, state["email_input"], "ignore")
         goto = END
 
     # Catch all other responses
@@ -336,23 +1221,25 @@ def llm_call(state: State, store: BaseStore):
     # Search for existing response_preferences memory (or use defaults)
     response_preferences = get_memory(store, ("email_assistant", "response_preferences"), default_response_preferences)
 
+    # System prompt: tool docs and background first, learned preferences last
+    system_prompt = prompt_cache.system_prompt(
+        "agent",
+        agent_system_prompt_hitl_memory,
+        {"tools_prompt": OUTLOOK_TOOLS_PROMPT, "background": default_background},
+        [
+            ("response_preferences", "Response Preferences", ("email_assistant", "response_preferences"), response_preferences),  # Learned email writing style
+            ("cal_preferences", "Calendar Preferences", ("email_assistant", "cal_preferences"), cal_preferences),  # Learned calendar preferences
+        ],
+    )
+
     # Call the LLM with all tools available
     # The LLM will generate a response with tool calls if needed
-    return {
-        "messages": [
-            llm_with_tools.invoke(
-                [
-                    {"role": "system", "content": agent_system_prompt_hitl_memory.format(
-                        tools_prompt=OUTLOOK_TOOLS_PROMPT,
-                        background=default_background,
-                        response_preferences=response_preferences,  # Learned email writing style
-                        cal_preferences=cal_preferences  # Learned calendar preferences
-                    )}
-                ]
-                + state["messages"]
-            )
-        ]
-    }
+    started = time.perf_counter()
+    response = models.get("agent").invoke(
+        [{"role": "system", "content": system_prompt}] + state["messages"]
+    )
+    prompt_cache.record("agent", response, time.perf_counter() - started)
+    return {"messages": [response]}
     
 def interrupt_handler(state: State, store: BaseStore) -> Command[Literal["llm_call", "__end__"]]:
     """
@@ -523,6 +1410,8 @@ def interrupt_handler(state: State, store: BaseStore) -> Command[Literal["llm_ca
                     "role": "user",
                     "content": f"The user ignored the email draft. That means they did not want to respond to the email. Update the triage preferences to ensure emails of this type are not classified as respond. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
                 }])
+                # The user overrode a "respond" triage: teach pre-triage about this sender
+                record_sender_verdict(store, state["email_input"], "ignore")
 
             elif tool_call["name"] == "schedule_meeting_tool":
                 # Don't execute the tool, and tell the agent how to proceed
@@ -534,6 +1423,8 @@ def interrupt_handler(state: State, store: BaseStore) -> Command[Literal["llm_ca
                     "role": "user",
                     "content": f"The user ignored the calendar meeting draft. That means they did not want to schedule a meeting for this email. Update the triage preferences to ensure emails of this type are not classified as respond. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
                 }])
+                # The user overrode a "respond" triage: teach pre-triage about this sender
+                record_sender_verdict(store, state["email_input"], "ignore")
 
             elif tool_call["name"] == "Question":
                 # Don't execute the tool, and tell the agent how to proceed
@@ -545,6 +1436,8 @@ def interrupt_handler(state: State, store: BaseStore) -> Command[Literal["llm_ca
                     "role": "user",
                     "content": f"The user ignored the Question. That means they did not want to answer the question or deal with this email. Update the triage preferences to ensure emails of this type are not classified as respond. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
                 }])
+                # The user overrode a "respond" triage: teach pre-triage about this sender
+                record_sender_verdict(store, state["email_input"], "ignore")
 
             else:
                 raise ValueError(f"Invalid tool call: {tool_call['name']}")
@@ -2,16 +2,37 @@
 import json
 import uuid
 import hashlib
+import html
+import math
+import random
+import secrets
+import signal
 import asyncio
 import argparse
+import bisect
+import fnmatch
+import importlib.util
 import os
+import re
+import sqlite3
 import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import httpx
 import msal
+from dataclasses import dataclass, field
 from pathlib import Path
 from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import parse_qs, quote, urlsplit
 from dotenv import load_dotenv
-from langgraph_sdk import get_client
-import requests
+from langgraph_sdk.client import LangGraphClient
+
+try:
+    import fcntl
+except ImportError:  # Windows: token refreshes are not serialized across processes
+    fcntl = None
 
 load_dotenv()
 
@@ -19,14 +40,710 @@ load_dotenv()
 _ROOT = Path(__file__).parent.absolute()
 _SECRETS_DIR = _ROOT / ".secrets"
 TOKEN_PATH = _SECRETS_DIR / "token.json"
+_STATE_DIR = _ROOT / ".state"
+DELTA_STATE_PATH = _STATE_DIR / "delta.json"
+RESUME_STATE_PATH = _STATE_DIR / "resume.json"
+
+# The access token is refreshed this many seconds before it expires; a failed
+# background refresh is retried after TOKEN_RETRY_SECONDS
+TOKEN_REFRESH_MARGIN = 300
+TOKEN_RETRY_SECONDS = 30
+
+# Email bodies are cut to this many characters after normalization (0 disables)
+BODY_MAX_CHARS = 20000
+
+# Histogram bucket bounds (seconds) and Prometheus name prefix for --metrics
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRICS_PREFIX = "outlook_ingest"
+
+# Default connection pool for the shared LangGraph client of each deployment
+LANGGRAPH_MAX_CONNECTIONS = 20
+LANGGRAPH_MAX_KEEPALIVE = 10
+
+# Maximum in-flight runs.delete calls when cleaning up a thread concurrently
+RUN_CLEANUP_CONCURRENCY = 8
+RUN_CLEANUP_STRATEGIES = ("concurrent", "serial", "skip")
+
+LEDGER_PATH = _STATE_DIR / "processed.sqlite3"
+DAEMON_STATUS_PATH = _STATE_DIR / "daemon_status.json"
+
+# Bounds for the adaptive --daemon polling interval, in seconds
+POLL_MIN_SECONDS = 15
+POLL_MAX_SECONDS = 300
+
+# Local change-notification receiver and Graph subscription lifetime. Outlook
+# message subscriptions may last at most 10080 minutes; they are renewed at half
+# their lifetime. A failed renewal is retried after SUBSCRIPTION_RETRY_SECONDS
+# (doubling up to SUBSCRIPTION_RETRY_MAX_SECONDS) rather than half a lifetime later.
+WEBHOOK_HOST = "127.0.0.1"
+WEBHOOK_PORT = 8765
+SUBSCRIPTION_MINUTES = 4200
+SUBSCRIPTION_RETRY_SECONDS = 30
+SUBSCRIPTION_RETRY_MAX_SECONDS = 900
+
+THREAD_REGISTRY_PATH = _STATE_DIR / "threads.json"
+
+# Per-mailbox ledger, delta and resume state in --mailboxes mode, plus one
+# thread registry per worker process (shards never share a state file)
+MAILBOX_STATE_DIR = _STATE_DIR / "mailboxes"
+
+# Attachment cache (content-addressed by SHA-256) and download limits. Files are
+# streamed in ATTACHMENT_CHUNK_SIZE pieces, so memory use does not grow with
+# attachment size; only a short text extract is passed to LangGraph.
+ATTACHMENTS_DIR = _STATE_DIR / "attachments"
+ATTACHMENT_MAX_BYTES = 25 * 1024 * 1024
+ATTACHMENT_TYPES = (
+    "text/*",
+    "application/pdf",
+    "application/json",
+    "application/xml",
+    "application/msword",
+    "application/vnd.openxmlformats-officedocument.*",
+)
+ATTACHMENT_CHUNK_SIZE = 64 * 1024
+ATTACHMENT_TEXT_CHARS = 2000
+ATTACHMENT_PDF_PAGES = 3
+
+# LangGraph thread IDs remembered as existing (least recently used evicted first)
+THREAD_REGISTRY_SIZE = 10000
+
+# Processed-message ledger entries older than this are evicted on open, and
+# again every LEDGER_EVICT_SECONDS while a daemon or webhook keeps it open
+LEDGER_MAX_AGE_DAYS = 30
+LEDGER_EVICT_SECONDS = 3600
+
+# Delta cursors are stored per folder so other folders can be synced later
+DELTA_CURSOR_KEY = "me/mailFolders/inbox"
 
 GRAPH_BASE = "https://graph.microsoft.com/v1.0"
 
+# Default connection pool for the shared Graph client
+GRAPH_MAX_CONNECTIONS = 10
+GRAPH_MAX_KEEPALIVE = 5
+
+# Throttling: Graph allows roughly 10000 requests per 10 minutes per mailbox, so
+# the default Graph rate stays under that. LangGraph is not paced by default.
+GRAPH_RATE = 15.0
+LANGGRAPH_RATE = 0.0
+MAX_RETRIES = 6
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 120.0
+
+# JSON batching: Graph accepts at most 20 sub-requests per $batch call, and
+# pending requests wait at most this many seconds for companions
+GRAPH_BATCH_SIZE = 20
+GRAPH_BATCH_WINDOW = 0.05
+
+# Messages requested per Graph page ($top); Graph caps message pages at 1000
+GRAPH_PAGE_SIZE = 100
+GRAPH_MAX_PAGE_SIZE = 1000
+
+# With concurrency > 1, run this many ingestion lanes per in-flight slot so that
+# two busy conversations hashing to the same lane rarely starve a free slot
+INGEST_LANES_PER_SLOT = 4
+
+# Messages buffered per lane before pagination waits for the workers to catch up
+INGEST_QUEUE_DEPTH = 16
+
+# ════════════════════════════════════════════════════════════════════════════
+# LOCAL STATE HELPERS
+# ════════════════════════════════════════════════════════════════════════════
+
+def write_json_atomic(path, data):
+    """Write JSON to a file atomically.
+
+    The data is written to a temporary file next to the target and moved into
+    place with os.replace, so a crash mid-write never leaves a truncated file.
+
+    Args:
+        path: Destination Path
+        data: JSON-serializable object
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+# ════════════════════════════════════════════════════════════════════════════
+# INSTRUMENTATION
+# ════════════════════════════════════════════════════════════════════════════
+
+class _NullSpan:
+    """Span used while metrics are disabled: entering and leaving it does nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    """Times one stage into a histogram; errors also bump `<name>.errors`."""
+
+    __slots__ = ("metrics", "name", "started")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.started)
+        if exc_type is not None and not issubclass(exc_type, asyncio.CancelledError):
+            self.metrics.count(f"{self.name}.errors")
+        return False
+
+def prometheus_name(name):
+    """Map a dotted metric name onto the Prometheus charset [a-zA-Z0-9_:]."""
+    name = re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+    return f"_{name}" if name[:1].isdigit() else name
+
+def prometheus_labels(labels):
+    """Render (name, value) label pairs as a Prometheus label set ("" if none)."""
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{prometheus_name(key)}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+class Metrics:
+    """Stage timings, counters and histograms for the ingest pipeline.
+
+    Disabled by default; every call then returns immediately (spans are a shared
+    no-op object), so instrumented code costs one attribute check per call.
+    Once enabled with `configure()`, `export()` writes a snapshot either as JSON
+    lines (one object per metric, appended, so daemon snapshots accumulate) or
+    in the Prometheus text format (rewritten atomically, suitable for the
+    node_exporter textfile collector).
+
+    Counters may carry labels (e.g. the mailbox of a per-mailbox throttle);
+    each label set is a separate series of the same metric.
+
+    Usage:
+        with METRICS.span("graph.page"):
+            response = await graph.get(url)
+        METRICS.count("emails.processed")
+        METRICS.count("graph.retries", labels={"mailbox": address})
+        METRICS.export()
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.format = None
+        self.counters = {}
+        self.histograms = {}
+
+    def configure(self, path, fmt=None):
+        """Enable collection and set the export target.
+
+        Args:
+            path: File the snapshot is written to
+            fmt: "jsonl" or "prometheus"; inferred from a .prom suffix otherwise
+        """
+        self.enabled = True
+        self.path = Path(path)
+        self.format = fmt or ("prometheus" if self.path.suffix == ".prom" else "jsonl")
+
+    def span(self, name):
+        """Context manager timing the enclosed block into histogram `name`."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def count(self, name, value=1, labels=None):
+        """Add `value` to counter `name` (the series of `labels`, if given)."""
+        if self.enabled:
+            key = (name, tuple(sorted(labels.items())) if labels else ())
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds):
+        """Record one duration in histogram `name`."""
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = {
+                "buckets": [0] * (len(METRICS_BUCKETS) + 1), "sum": 0.0, "count": 0
+            }
+        histogram["buckets"][bisect.bisect_left(METRICS_BUCKETS, seconds)] += 1
+        histogram["sum"] += seconds
+        histogram["count"] += 1
+
+    def snapshot(self):
+        """Current metrics as a list of JSON-serializable dicts."""
+        timestamp = datetime.now(timezone.utc).isoformat()
+        rows = []
+        for (name, labels), value in sorted(self.counters.items()):
+            row = {"ts": timestamp, "type": "counter", "name": name, "value": value}
+            if labels:
+                row["labels"] = dict(labels)
+            rows.append(row)
+        for name, histogram in sorted(self.histograms.items()):
+            rows.append({
+                "ts": timestamp,
+                "type": "histogram",
+                "name": name,
+                "count": histogram["count"],
+                "sum_seconds": round(histogram["sum"], 6),
+                "buckets": dict(zip([*map(str, METRICS_BUCKETS), "+Inf"], histogram["buckets"])),
+            })
+        return rows
+
+    def prometheus_text(self):
+        """Current metrics in the Prometheus text exposition format."""
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(self.counters.items()):
+            metric = prometheus_name(f"{METRICS_PREFIX}_{name}_total")
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{prometheus_labels(labels)} {value}")
+        for name, histogram in sorted(self.histograms.items()):
+            metric = prometheus_name(f"{METRICS_PREFIX}_{name}_seconds")
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, bucket in zip([*map(str, METRICS_BUCKETS), "+Inf"], histogram["buckets"]):
+                cumulative += bucket
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines += [f"{metric}_sum {histogram['sum']:.6f}", f"{metric}_count {histogram['count']}"]
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        """Write a snapshot to the configured file (no-op when disabled)."""
+        if not self.enabled:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            if self.format == "prometheus":
+                tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+                tmp_path.write_text(self.prometheus_text())
+                os.replace(tmp_path, self.path)
+            else:
+                with open(self.path, "a") as f:
+                    for row in self.snapshot():
+                        f.write(json.dumps(row) + "\n")
+        except Exception as e:
+            print(f"Could not write metrics to {self.path}: {str(e)}")
+
+# Process-wide metrics registry, enabled by --metrics
+METRICS = Metrics()
+
+# ════════════════════════════════════════════════════════════════════════════
+# OUTLOOK AUTHENTICATION
+# ════════════════════════════════════════════════════════════════════════════
+
+DEFAULT_TOKEN_SCOPES = ["Mail.ReadWrite", "Mail.Send", "Calendars.ReadWrite", "offline_access"]
+
+# One MSAL application per (client, tenant), reused by every refresh
+_MSAL_APPS = {}
+
+def get_msal_app():
+    """Return the shared msal.PublicClientApplication, or None if not configured.
+
+    Building the application discovers the tenant's authority metadata over the
+    network, so it is created once per process and reused by every refresh.
+    """
+    client_id = os.getenv("OUTLOOK_CLIENT_ID")
+    tenant_id = os.getenv("OUTLOOK_TENANT_ID")
+    if not client_id or not tenant_id:
+        print("Missing OUTLOOK_CLIENT_ID or OUTLOOK_TENANT_ID for refresh")
+        return None
+    app = _MSAL_APPS.get((client_id, tenant_id))
+    if app is None:
+        app = msal.PublicClientApplication(
+            client_id,
+            authority=f"https://login.microsoftonline.com/{tenant_id}"
+        )
+        _MSAL_APPS[(client_id, tenant_id)] = app
+    return app
+
+def read_token_data(path=None):
+    """Read OAuth2 token data from OUTLOOK_TOKEN or the local token file.
+
+    Args:
+        path: Token file of a specific mailbox; when given, only that file is
+              read and OUTLOOK_TOKEN is ignored
+
+    Returns:
+        dict: Token data, or None if neither source has usable JSON
+    """
+    # 1. Try environment variable first (preferred for cloud deployments)
+    env_token = os.getenv("OUTLOOK_TOKEN") if path is None else None
+    if env_token:
+        try:
+            token_data = json.loads(env_token)
+            print("Using OUTLOOK_TOKEN environment variable")
+            return token_data
+        except Exception as e:
+            print(f"Could not parse OUTLOOK_TOKEN environment variable: {str(e)}")
+    
+    # 2. Try local file as fallback (preferred for local development)
+    path = path or TOKEN_PATH
+    if path.exists():
+        try:
+            with open(path, "r") as f:
+                token_data = json.load(f)
+            print(f"Using token from {path}")
+            return token_data
+        except Exception as e:
+            print(f"Could not load token from {path}: {str(e)}")
+    else:
+        print(f"Token file not found at {path}")
+    
+    print("Could not find valid token data in any location")
+    return None
+
+@contextmanager
+def token_file_lock(path):
+    """Hold an exclusive lock on a token file across processes.
+
+    Worker processes of a --mailboxes run may share one token file. Refreshing
+    under this lock means only one of them redeems the refresh token at a time,
+    and the others pick up the token it saved instead of overwriting it (a
+    rotated refresh token would otherwise be lost). A no-op where fcntl is
+    unavailable.
+
+    Args:
+        path: Token file to lock; the lock is taken on a sibling ".lock" file
+    """
+    if fcntl is None:
+        yield
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(f".{path.name}.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def refresh_token_data(token_data, path=None):
+    """Exchange the refresh token for a new access token.
+
+    Blocking (MSAL does synchronous HTTP); async callers run it in a thread.
+    On success `token_data` is updated in place and saved atomically to
+    `path` (TOKEN_PATH by default), so a crash mid-write never leaves a
+    truncated token file.
+
+    The refresh runs under token_file_lock. If the file already holds a
+    different access token that is good for more than TOKEN_REFRESH_MARGIN
+    seconds, another process refreshed it meanwhile and that token is adopted
+    without calling MSAL.
+
+    Args:
+        token_data: Token dict holding at least "refresh_token"
+        path: Token file to save the refreshed token to
+
+    Returns:
+        bool: True if a new access token was obtained
+    """
+    path = path or TOKEN_PATH
+    with token_file_lock(path):
+        return _refresh_token_data_locked(token_data, path)
+
+def _refresh_token_data_locked(token_data, path):
+    if path.exists():
+        try:
+            with open(path, "r") as f:
+                saved = json.load(f)
+        except Exception:
+            saved = {}
+        if (saved.get("access_token") and saved["access_token"] != token_data.get("access_token")
+                and saved.get("expires_at", 0) > time.time() + TOKEN_REFRESH_MARGIN):
+            token_data.update(saved)
+            print(f"Using token refreshed by another process in {path}")
+            return True
+
+    if not token_data.get("refresh_token"):
+        print("No refresh_token available")
+        return False
+    
+    app = get_msal_app()
+    if app is None:
+        return False
+    
+    result = app.acquire_token_by_refresh_token(
+        token_data["refresh_token"],
+        scopes=token_data.get("scope", DEFAULT_TOKEN_SCOPES)
+    )
+    
+    if "access_token" not in result:
+        print(f"Token refresh failed: {result.get('error_description', result.get('error', 'unknown error'))}")
+        return False
+    
+    token_data.update({
+        "access_token": result["access_token"],
+        "refresh_token": result.get("refresh_token", token_data["refresh_token"]),
+        "expires_at": int(time.time()) + result["expires_in"],
+        "expires_in": result["expires_in"],
+    })
+    write_json_atomic(path, token_data)
+    print("Token refreshed and saved")
+    return True
+
+class TokenManager:
+    """Keep the Outlook access token fresh for the lifetime of a run.
+
+    The token is loaded (and refreshed if close to expiry) once by `load()`.
+    After `start()`, a background task refreshes it TOKEN_REFRESH_MARGIN
+    seconds before it expires, running the blocking MSAL call in a worker
+    thread, so Graph callers never wait on auth: they read `access_token`, which
+    always returns the current token without blocking.
+
+    A 401 from Graph (token revoked or clock skew) triggers `refresh(stale=...)`
+    through TokenAuth; concurrent 401s share a single refresh.
+
+    Usage:
+        tokens = TokenManager()
+        if tokens.load():
+            tokens.start()
+            graph = GraphClient(token_manager=tokens)
+            ...
+            await tokens.aclose()
+    """
+
+    def __init__(self, refresh_margin=TOKEN_REFRESH_MARGIN, retry_seconds=TOKEN_RETRY_SECONDS,
+                 token_path=None):
+        """Create the manager.
+
+        Args:
+            refresh_margin: Seconds before expiry at which the token is refreshed
+            retry_seconds: Delay between attempts after a failed refresh
+            token_path: Token file of a specific mailbox (see read_token_data);
+                        OUTLOOK_TOKEN or TOKEN_PATH when None
+        """
+        self.token_path = token_path
+        self.refresh_margin = refresh_margin
+        self.retry_seconds = retry_seconds
+        self.refreshes = 0
+        self._token_data = None
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    @property
+    def access_token(self):
+        """The current access token (never blocks)."""
+        return self._token_data["access_token"] if self._token_data else None
+
+    @property
+    def expires_at(self):
+        """Expiry of the current access token as a Unix timestamp."""
+        return self._token_data.get("expires_at", 0) if self._token_data else 0
+
+    def load(self):
+        """Load token data and refresh it now if it is about to expire.
+
+        Returns:
+            str: The access token, or None if no valid token is available
+        """
+        token_data = read_token_data(self.token_path)
+        if token_data is None:
+            return None
+        try:
+            if token_data.get("expires_at", 0) < time.time() + self.refresh_margin:
+                if not refresh_token_data(token_data, self.token_path):
+                    return None
+        except Exception as e:
+            print(f"Error creating access token: {str(e)}")
+            return None
+        self._token_data = token_data
+        return self.access_token
+
+    async def refresh(self, stale=None):
+        """Refresh the access token off the event loop.
+
+        Args:
+            stale: Token that was rejected; if the current token already differs,
+                   another caller refreshed it and nothing is done
+
+        Returns:
+            bool: True if a usable token is available afterwards
+        """
+        async with self._lock:
+            if stale is not None and stale != self.access_token:
+                return True
+            token_data = dict(self._token_data or {})
+            try:
+                with METRICS.span("auth.refresh"):
+                    refreshed = await asyncio.to_thread(refresh_token_data, token_data, self.token_path)
+            except Exception as e:
+                print(f"Error refreshing access token: {str(e)}")
+                refreshed = False
+            if refreshed:
+                self._token_data = token_data
+                self.refreshes += 1
+            return refreshed
+
+    async def _refresh_loop(self):
+        if not (self._token_data or {}).get("refresh_token"):
+            print("No refresh_token available; the access token will not be renewed")
+            return
+        while True:
+            delay = self.expires_at - self.refresh_margin - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if not await self.refresh():
+                print(f"Retrying token refresh in {self.retry_seconds}s")
+                await asyncio.sleep(self.retry_seconds)
+
+    def start(self):
+        """Start refreshing the token in the background."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def aclose(self):
+        """Stop the background refresh."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+class TokenAuth(httpx.Auth):
+    """httpx auth flow that stamps each request with the TokenManager's token.
+
+    A 401 answer triggers one refresh and a single retry of the request.
+    """
+
+    def __init__(self, token_manager):
+        self.token_manager = token_manager
+
+    async def async_auth_flow(self, request):
+        token = self.token_manager.access_token
+        request.headers["Authorization"] = f"Bearer {token}"
+        response = yield request
+        if response.status_code == 401 and await self.token_manager.refresh(stale=token):
+            request.headers["Authorization"] = f"Bearer {self.token_manager.access_token}"
+            yield request
+
+# ════════════════════════════════════════════════════════════════════════════
+# EMAIL BODY NORMALIZATION
+# ════════════════════════════════════════════════════════════════════════════
+#
+# Outlook HTML bodies are often 10-50x larger than the text they carry (inline
+# styles, hidden elements, markup). Everything left in the body ends up in the
+# triage and response-agent prompts, so bodies are reduced to plain text before
+# ingestion. Dropping the quoted previous message of a reply (--strip-quotes) is
+# opt-in: forwards are never cut, and a reply is only cut at a complete reply
+# header. Every stage is a precompiled regex pass, which keeps normalization well
+# under a millisecond per typical email.
+
+# Elements whose content is never shown to the reader
+_HTML_HIDDEN_RE = re.compile(r"<(style|script|head|title)\b.*?</\1\s*>|<!--.*?-->", re.I | re.S)
+# Block-level tags that end a line of text
+_HTML_BREAK_RE = re.compile(r"<(?:br|hr|/p|/div|/tr|/li|/h[1-6])\b[^>]*>", re.I)
+_HTML_TAG_RE = re.compile(r"<[^>]+>")
+# Start of a quoted reply: "On <date>, <sender> wrote:", or a complete Outlook
+# header block (From, Sent/Date, To, optional Cc, Subject on consecutive lines),
+# optionally preceded by "-----Original Message-----" or Outlook's underscore rule.
+# A lone "From:" line or separator is not enough, so body text is never cut at one.
+_TEXT_QUOTE_RE = re.compile(
+    r"^(?:On\b.{0,200}\bwrote:\s*$"
+    r"|(?:(?:-{2,}\s*Original Message\s*-{2,}|_{10,})\s*\n)?"
+    r"From:[^\n]*\n(?:Sent|Date):[^\n]*\nTo:[^\n]*\n(?:Cc:[^\n]*\n)?Subject:)",
+    re.I | re.M,
+)
+# Forwards carry their content below the header block, so they are never cut
+_FORWARD_SUBJECT_RE = re.compile(r"^\s*(?:fwd?|wg|tr)\s*:", re.I)
+_FORWARD_MARKER_RE = re.compile(r"^-{2,}\s*Forwarded message\s*-{2,}|^Begin forwarded message:", re.I | re.M)
+_QUOTED_LINE_RE = re.compile(r"^>.*(?:\n|$)", re.M)
+_SIGNATURE_RE = re.compile(r"^(?:Sent from my \w+|Get Outlook for \w+)", re.I | re.M)
+_INLINE_SPACE_RE = re.compile(r"[ \t\r\f\v\xa0\u200b\u200c\u200d\ufeff]+")
+_LINE_EDGE_RE = re.compile(r" ?\n ?")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+def html_to_text(content):
+    """Convert an HTML body to plain text.
+
+    Args:
+        content: HTML body from Graph
+
+    Returns:
+        str: Text with one line per block element and entities decoded
+    """
+    content = _HTML_HIDDEN_RE.sub("", content)
+    content = _HTML_BREAK_RE.sub("\n", content)
+    return html.unescape(_HTML_TAG_RE.sub("", content))
+
+def is_forward(text, subject=""):
+    """Return True if a message forwards another (by subject prefix or body marker)."""
+    return bool(_FORWARD_SUBJECT_RE.match(subject or "") or _FORWARD_MARKER_RE.search(text))
+
+def strip_quoted_text(text, subject=""):
+    """Drop the quoted previous message, ">"-quoted lines and mobile signatures of a reply.
+
+    Forwards are returned unchanged. A reply is cut at "On ... wrote:" or at a
+    complete From/Sent/To/Subject header block only, and never down to nothing:
+    if no new text precedes the quote, the body is kept whole.
+
+    Args:
+        text: Plain-text body (whitespace already collapsed)
+        subject: Message subject, used to recognise forwards
+
+    Returns:
+        str: The new text of the reply
+    """
+    if is_forward(text, subject):
+        return text
+    for pattern in (_TEXT_QUOTE_RE, _SIGNATURE_RE):
+        match = pattern.search(text)
+        if match and text[:match.start()].strip():
+            text = text[:match.start()]
+    unquoted = _QUOTED_LINE_RE.sub("", text)
+    return unquoted if unquoted.strip() else text
+
+def collapse_whitespace(text):
+    """Collapse runs of spaces and blank lines, and trim the ends."""
+    text = _INLINE_SPACE_RE.sub(" ", text)
+    text = _LINE_EDGE_RE.sub("\n", text)
+    return _BLANK_LINES_RE.sub("\n\n", text).strip()
+
+def cap_body(text, max_chars):
+    """Truncate text to max_chars (0 disables the cap), noting what was cut."""
+    if max_chars and len(text) > max_chars:
+        return f"{text[:max_chars].rstrip()}\n\n[... {len(text) - max_chars} more characters truncated]"
+    return text
+
+def normalize_body(content, content_type, max_chars=BODY_MAX_CHARS, strip_quotes=False, subject=""):
+    """Reduce an email body to plain text.
+
+    Stages: HTML-to-text (HTML bodies only), whitespace collapsing, optionally
+    quoted-reply stripping (see strip_quoted_text), and the size cap.
+
+    Args:
+        content: Body content from Graph
+        content_type: "html" or "text"
+        max_chars: Maximum characters kept (0 for no cap)
+        strip_quotes: Drop the quoted previous message of replies
+        subject: Message subject, used to recognise forwards
+
+    Returns:
+        str: Normalized plain-text body
+    """
+    if content_type == "html":
+        content = html_to_text(content)
+    text = collapse_whitespace(content)
+    if strip_quotes:
+        text = strip_quoted_text(text, subject)
+    return cap_body(text.rstrip(), max_chars)
+
 # ════════════════════════════════════════════════════════════════════════════
 # EMAIL CONTENT EXTRACTION FUNCTIONS
 # ════════════════════════════════════════════════════════════════════════════
 
-def extract_message_part(message: dict) -> str:
+def extract_message_part(message: dict, normalize=True, max_chars=BODY_MAX_CHARS, strip_quotes=False) -> str:
     """Extract content from an Outlook message.
     
     Outlook messages have a simpler structure than Gmail:
@@ -37,11 +754,18 @@ def extract_message_part(message: dict) -> str:
     
     Priority:
     1. If Text, return plain text
-    2. If HTML, return HTML content (can be stripped if needed)
+    2. If HTML, return the text of the HTML (see normalize_body)
     3. Fallback to empty string
     
+    Unless `normalize` is False, both are reduced to plain text with
+    normalize_body(); with `strip_quotes` the quoted previous message of a
+    reply is dropped as well.
+    
     Args:
         message: Full Outlook message object from Graph API
+        normalize: Run the body-normalization pipeline
+        max_chars: Size cap applied by normalization (0 for no cap)
+        strip_quotes: Drop the quoted previous message of replies
         
     Returns:
         str: Extracted email content, empty string if no content found
@@ -50,113 +774,71 @@ def extract_message_part(message: dict) -> str:
     content_type = body.get("contentType", "").lower()
     content = body.get("content", "")
     
-    # For text content, return as-is
-    if content_type == "text":
-        return content
+    if content_type not in ("text", "html"):
+        return ""
     
-    # For HTML, return HTML (assistant can handle it)
-    if content_type == "html":
+    # Raw passthrough: the assistant gets the body exactly as Graph sent it
+    if not normalize:
         return content
     
-    return ""
+    return normalize_body(
+        content,
+        content_type,
+        max_chars=max_chars,
+        strip_quotes=strip_quotes,
+        subject=message.get("subject") or "",
+    )
+
+# Message properties read by extract_email_data() and extract_message_part().
+# This is the single source for the $select projection sent to Graph, so keep it
+# in sync when extraction starts reading a new field.
+EXTRACTED_MESSAGE_FIELDS = (
+    "id",
+    "conversationId",
+    "subject",
+    "from",
+    "toRecipients",
+    "receivedDateTime",
+    "body",
+    "hasAttachments",
+)
+
+# Transport headers forwarded to the graph for its pre-triage rules (bulk mail,
+# mailing lists, auto-generated notifications). internetMessageHeaders carries
+# every header of the message (Received chains, DKIM, ...), which can double the
+# size of a page, so it is only selected with --triage-headers and everything
+# but these is dropped before ingestion.
+TRIAGE_HEADERS = (
+    "List-Unsubscribe",
+    "List-Id",
+    "Precedence",
+    "Auto-Submitted",
+    "X-Auto-Response-Suppress",
+)
+
+# Delta pages cannot be filtered on isRead server-side, so read status is
+# fetched as well and checked locally
+DELTA_MESSAGE_FIELDS = EXTRACTED_MESSAGE_FIELDS + ("isRead",)
+
+def build_select_clause(fields=EXTRACTED_MESSAGE_FIELDS):
+    """Build the OData $select clause for Outlook message queries.
+
+    Args:
+        fields: Message properties to request, defaults to the fields consumed
+               by extract_email_data()
 
-def load_outlook_credentials():
-    """Load Outlook credentials from environment variables or local file.
-    
-    This function implements a flexible credential loading strategy to support
-    different deployment environments:
-    
-    1. **Local Development**: Reads from .secrets/token.json file
-    2. **Cloud Deployment**: Reads from OUTLOOK_TOKEN environment variable
-    3. **Fallback Chain**: Tries environment variable first, then local file
-    
-    The credential file/variable should contain JSON with OAuth2 token data:
-    {
-        "access_token": "...",
-        "refresh_token": "...",
-        "expires_at": 1234567890,
-        "expires_in": 3600,
-        ...
-    }
-    
     Returns:
-        access_token string: Valid access token for Graph API
-        or None if credentials can't be loaded from any source
+        str: Query fragment such as "$select=id,subject,body"
     """
-    token_data = None
-    
-    # 1. Try environment variable first (preferred for cloud deployments)
-    env_token = os.getenv("OUTLOOK_TOKEN")
-    if env_token:
-        try:
-            token_data = json.loads(env_token)
-            print("Using OUTLOOK_TOKEN environment variable")
-        except Exception as e:
-            print(f"Could not parse OUTLOOK_TOKEN environment variable: {str(e)}")
-    
-    # 2. Try local file as fallback (preferred for local development)
-    if token_data is None:
-        if TOKEN_PATH.exists():
-            try:
-                with open(TOKEN_PATH, "r") as f:
-                    token_data = json.load(f)
-                print(f"Using token from {TOKEN_PATH}")
-            except Exception as e:
-                print(f"Could not load token from {TOKEN_PATH}: {str(e)}")
-        else:
-            print(f"Token file not found at {TOKEN_PATH}")
-    
-    # If we couldn't get token data from any source, return None
-    if token_data is None:
-        print("Could not find valid token data in any location")
-        return None
-    
-    try:
-        # Get or refresh access token
-        now = int(time.time())
-        expires_at = token_data.get("expires_at", 0)
-        
-        if expires_at < now + 300:  # Refresh if <5min left
-            if not token_data.get("refresh_token"):
-                print("No refresh_token available")
-                return None
-            
-            if not os.getenv("OUTLOOK_CLIENT_ID") or not os.getenv("OUTLOOK_TENANT_ID"):
-                print("Missing OUTLOOK_CLIENT_ID or OUTLOOK_TENANT_ID for refresh")
-                return None
-            
-            app = msal.PublicClientApplication(
-                os.getenv("OUTLOOK_CLIENT_ID"),
-                authority=f"https://login.microsoftonline.com/{os.getenv('OUTLOOK_TENANT_ID')}"
-            )
-            
-            result = app.acquire_token_by_refresh_token(
-                token_data["refresh_token"],
-                scopes=token_data.get("scope", ["Mail.ReadWrite", "Mail.Send", "Calendars.ReadWrite", "offline_access"])
-            )
-            
-            if "access_token" in result:
-                expires_at = int(time.time()) + result["expires_in"]
-                token_data.update({
-                    "access_token": result["access_token"],
-                    "refresh_token": result.get("refresh_token", token_data["refresh_token"]),
-                    "expires_at": expires_at,
-                    "expires_in": result["expires_in"],
-                })
-                # Save updated token
-                with open(TOKEN_PATH, "w") as f:
-                    json.dump(token_data, f, indent=2)
-                print("Token refreshed and saved")
-            else:
-                print("Token refresh failed")
-                return None
-        
-        return token_data["access_token"]
-    except Exception as e:
-        print(f"Error creating access token: {str(e)}")
-        return None
+    return "$select=" + ",".join(fields)
+
+def message_fields(args, fields=EXTRACTED_MESSAGE_FIELDS):
+    """Message properties to select for this run: `fields`, plus headers with --triage-headers."""
+    if args.triage_headers:
+        return fields + ("internetMessageHeaders",)
+    return fields
 
-def extract_email_data(message):
+def extract_email_data(message, normalize=True, max_chars=BODY_MAX_CHARS, strip_quotes=False):
     """Extract key information from an Outlook message into standardized format.
     
     This function processes a raw Outlook message and extracts all relevant data
@@ -170,163 +852,2601 @@ def extract_email_data(message):
     4. Return standardized EmailData dictionary
     
     Args:
-        message: Full Outlook message object from Graph API
-        
+        message: Full Outlook message object from Graph API
+        normalize: Normalize the body (see extract_message_part)
+        max_chars: Body size cap after normalization (0 for no cap)
+        strip_quotes: Drop the quoted previous message of replies
+        
+    Returns:
+        dict: Standardized email data with keys:
+            - from_email: Sender email address and name
+            - to_email: Recipient email address
+            - subject: Email subject line
+            - page_content: Email body (extracted)
+            - id: Outlook message ID (for tracking)
+            - thread_id: Outlook conversation ID (groups related emails)
+            - send_time: Email send timestamp (ISO format)
+            - content_hash: SHA-256 of sender, recipients, subject and body, so
+              an edited or re-sent message with the same ID is not skipped
+            - body_bytes: Size of the body as received from Graph (UTF-8)
+            - page_content_bytes: Size of the body after normalization (UTF-8)
+            - headers: The TRIAGE_HEADERS present on the message, by name
+    """
+    
+    # Extract key fields from the message
+    # Outlook uses direct dict structure: message["subject"], message["from"]["emailAddress"]["address"], etc.
+    subject = message.get('subject', 'No Subject')
+    from_email = message.get("from", {}).get("emailAddress", {}).get("address", 'Unknown Sender')
+    to_email = ", ".join(
+        [r["emailAddress"]["address"] for r in message.get("toRecipients", [])]
+    )
+    date = message.get('receivedDateTime', 'Unknown Date')
+    
+    # Keep only the transport headers the pre-triage rules look at
+    wanted = {name.lower(): name for name in TRIAGE_HEADERS}
+    headers = {
+        wanted[header["name"].lower()]: header.get("value", "")
+        for header in message.get("internetMessageHeaders") or []
+        if header.get("name", "").lower() in wanted
+    }
+    
+    # Extract message content using the content extraction helper
+    content = extract_message_part(message, normalize=normalize, max_chars=max_chars, strip_quotes=strip_quotes)
+    raw_body = message.get("body", {}).get("content", "")
+    
+    # Fingerprint the content so the processed-message ledger can tell a
+    # re-delivered message from one whose content actually changed. The raw
+    # body is hashed so changing normalization settings doesn't re-ingest.
+    content_hash = hashlib.sha256(
+        "\x1f".join([from_email, to_email, subject, raw_body]).encode("UTF-8")
+    ).hexdigest()
+    
+    # Create standardized email data object for LangGraph consumption
+    email_data = {
+        "from_email": from_email,
+        "to_email": to_email,
+        "subject": subject,
+        "page_content": content,
+        "id": message['id'],
+        "thread_id": message['conversationId'],
+        "send_time": date,
+        "content_hash": content_hash,
+        "body_bytes": len(raw_body.encode("UTF-8")),
+        "page_content_bytes": len(content.encode("UTF-8")),
+        "headers": headers,
+    }
+    
+    return email_data
+
+# ════════════════════════════════════════════════════════════════════════════
+# SHARED LANGGRAPH CLIENTS
+# ════════════════════════════════════════════════════════════════════════════
+
+# One long-lived (LangGraphClient, httpx.AsyncClient) pair per deployment URL
+_LANGGRAPH_CLIENTS = {}
+
+def langgraph_headers():
+    """Build LangGraph request headers, picking up the API key like get_client()."""
+    for env_var in ("LANGGRAPH_API_KEY", "LANGSMITH_API_KEY", "LANGCHAIN_API_KEY"):
+        api_key = os.getenv(env_var)
+        if api_key:
+            return {"x-api-key": api_key}
+    return {}
+
+def get_langgraph_client(url, max_connections=LANGGRAPH_MAX_CONNECTIONS,
+                         max_keepalive=LANGGRAPH_MAX_KEEPALIVE, throttle=None, transport=None):
+    """Return the shared LangGraph SDK client for a deployment URL.
+
+    langgraph_sdk.get_client() builds a new HTTP connection pool on every call,
+    which under concurrent ingestion turns into a TCP/TLS handshake storm. This
+    creates one client per URL on first use and hands the same instance to
+    every later caller until close_langgraph_clients() runs. Pool limits, the
+    throttle and the transport only apply when the client is first created.
+
+    Args:
+        url: LangGraph deployment URL
+        max_connections: Upper bound on open connections to the deployment
+        max_keepalive: Idle connections kept open for reuse
+        throttle: Optional Throttle applied to every SDK request
+        transport: Optional httpx transport used instead of the pooled network
+                   transport (e.g. an httpx.MockTransport in benchmarks)
+
+    Returns:
+        LangGraphClient: Shared client for the deployment
+    """
+    entry = _LANGGRAPH_CLIENTS.get(url)
+    if entry is None:
+        if transport is None:
+            transport = httpx.AsyncHTTPTransport(
+                retries=5,
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive,
+                ),
+            )
+        if throttle is not None:
+            transport = ThrottledTransport(transport, throttle)
+        http_client = httpx.AsyncClient(
+            base_url=url,
+            transport=transport,
+            timeout=httpx.Timeout(connect=5, read=300, write=300, pool=5),
+            headers=langgraph_headers(),
+        )
+        entry = (LangGraphClient(http_client), http_client)
+        _LANGGRAPH_CLIENTS[url] = entry
+    return entry[0]
+
+def langgraph_pool_size(args, concurrency=None):
+    """Connections the shared LangGraph pool needs for a run.
+
+    Each of the `concurrency` in-flight ingests makes one LangGraph call at a
+    time, except during concurrent run cleanup, which fans out to
+    --run-cleanup-concurrency deletes. A smaller pool makes requests queue for a
+    connection and fail with PoolTimeout, which is not retried for runs.create,
+    so --langgraph-max-connections is raised to that peak when it is lower.
+
+    Args:
+        args: Parsed command-line arguments
+        concurrency: In-flight ingests sharing the pool (defaults to --concurrency)
+
+    Returns:
+        int: max_connections for get_langgraph_client
+    """
+    concurrency = args.concurrency if concurrency is None else concurrency
+    fan_out = args.run_cleanup_concurrency if args.run_cleanup == "concurrent" else 1
+    needed = concurrency * fan_out
+    if needed > args.langgraph_max_connections:
+        print(f"Raising the LangGraph connection pool from {args.langgraph_max_connections} to {needed} "
+              f"({concurrency} concurrent ingests x {fan_out} requests each)")
+    return max(args.langgraph_max_connections, needed)
+
+async def close_langgraph_clients():
+    """Close every shared LangGraph client and its connection pool."""
+    while _LANGGRAPH_CLIENTS:
+        _, (_, http_client) = _LANGGRAPH_CLIENTS.popitem()
+        await http_client.aclose()
+
+# ════════════════════════════════════════════════════════════════════════════
+# LANGGRAPH THREAD REGISTRY
+# ════════════════════════════════════════════════════════════════════════════
+
+class ThreadRegistry:
+    """LRU set of LangGraph thread IDs known to exist on one deployment.
+
+    Lets ingest_email_to_langgraph skip the threads.get round-trip for threads
+    it has already created or seen. The registry is persisted between runs in a
+    JSON file keyed by deployment URL, and bounded to `capacity` entries with
+    least-recently-used eviction.
+
+    Usage:
+        registry = ThreadRegistry(args.url)
+        if thread_id not in registry:
+            ...  # create-if-absent, then registry.add(thread_id)
+        registry.save()
+    """
+
+    def __init__(self, url, path=THREAD_REGISTRY_PATH, capacity=THREAD_REGISTRY_SIZE):
+        """Load the registry for a deployment URL.
+
+        Args:
+            url: LangGraph deployment URL the thread IDs belong to
+            path: JSON file shared by all deployments
+            capacity: Maximum number of thread IDs remembered
+        """
+        self.url = url
+        self.path = path
+        self.capacity = capacity
+        self._threads = OrderedDict()
+
+        if path.exists():
+            try:
+                with open(path, "r") as f:
+                    thread_ids = json.load(f).get(url, [])
+                for thread_id in thread_ids[-capacity:]:
+                    self._threads[thread_id] = None
+            except Exception as e:
+                print(f"Could not load thread registry from {path}: {str(e)}")
+
+    def __contains__(self, thread_id):
+        if thread_id not in self._threads:
+            return False
+        self._threads.move_to_end(thread_id)
+        return True
+
+    def __len__(self):
+        return len(self._threads)
+
+    def add(self, thread_id):
+        """Remember a thread as existing, evicting the least recently used."""
+        self._threads[thread_id] = None
+        self._threads.move_to_end(thread_id)
+        while len(self._threads) > self.capacity:
+            self._threads.popitem(last=False)
+
+    def discard(self, thread_id):
+        """Forget a thread, e.g. after the server reports it missing."""
+        self._threads.pop(thread_id, None)
+
+    def save(self):
+        """Persist the registry, keeping entries for other deployments."""
+        state = {}
+        if self.path.exists():
+            try:
+                with open(self.path, "r") as f:
+                    state = json.load(f)
+            except Exception:
+                state = {}
+        state[self.url] = list(self._threads)
+        write_json_atomic(self.path, state)
+
+# ════════════════════════════════════════════════════════════════════════════
+# LANGGRAPH INGESTION FUNCTIONS
+# ════════════════════════════════════════════════════════════════════════════
+
+async def list_thread_runs(client, thread_id, page_size=100):
+    """List every run on a LangGraph thread, following offset pagination.
+
+    Args:
+        client: LangGraph SDK client
+        thread_id: LangGraph thread UUID
+        page_size: Runs requested per runs.list call
+
+    Returns:
+        list: Run objects for the thread
+    """
+    runs = []
+    while True:
+        page = await client.runs.list(thread_id, limit=page_size, offset=len(runs))
+        runs.extend(page)
+        if len(page) < page_size:
+            return runs
+
+async def cleanup_thread_runs(client, thread_id, strategy="concurrent", max_concurrency=RUN_CLEANUP_CONCURRENCY):
+    """Delete every previous run on a LangGraph thread.
+
+    Strategies:
+    - "serial": one runs.delete at a time (latency grows with thread history)
+    - "concurrent": up to `max_concurrency` deletes in flight at once
+
+    Individual delete failures are reported and do not stop the cleanup.
+
+    Args:
+        client: LangGraph SDK client
+        thread_id: LangGraph thread UUID
+        strategy: "serial" or "concurrent"
+        max_concurrency: Cap on in-flight deletes for the concurrent strategy
+
+    Returns:
+        int: Number of runs deleted
+    """
+    # List all runs for this thread
+    # Each run represents one execution of the workflow
+    runs = await list_thread_runs(client, thread_id)
+    limit = asyncio.Semaphore(max_concurrency if strategy == "concurrent" else 1)
+
+    async def delete_run(run_info):
+        run_id = run_info["run_id"]
+        async with limit:
+            print(f"Deleting previous run {run_id} from thread {thread_id}")
+            try:
+                await client.runs.delete(thread_id, run_id)
+                return True
+            except Exception as e:
+                print(f"Failed to delete run {run_id}: {str(e)}")
+                return False
+
+    # Delete all previous runs to avoid state accumulation
+    # This ensures fresh processing without old state interference
+    results = await asyncio.gather(*(delete_run(run_info) for run_info in runs))
+    return sum(results)
+
+async def ingest_email_to_langgraph(email_data, graph_name, url="http://127.0.0.1:2024",
+                                    cleanup="concurrent", cleanup_concurrency=RUN_CLEANUP_CONCURRENCY,
+                                    thread_registry=None):
+    """Ingest an email to LangGraph for agent processing.
+    
+    This function takes extracted email data and feeds it into a running LangGraph
+    deployment. It handles:
+    1. Thread management (create new or retrieve existing)
+    2. Run cleanup (delete previous runs to avoid state accumulation)
+    3. Email submission to the graph workflow
+    
+    Run cleanup strategies:
+    - "concurrent" (default): delete previous runs in parallel, capped by
+      `cleanup_concurrency`, so latency no longer grows with thread history
+    - "serial": delete previous runs one at a time
+    - "skip": keep previous runs and rely on multitask_strategy="rollback"
+      to cancel any run still in flight when the new one is created
+    
+    The function converts Outlook conversation IDs (which can be strings) into
+    consistent UUIDs for the LangGraph system, ensuring thread continuity.
+    
+    Args:
+        email_data: Dictionary containing extracted email information
+                   Required keys: from_email, to_email, subject, page_content, id, thread_id
+        graph_name: Name of the LangGraph deployment to use
+                   Example: "email_assistant_hitl_memory_outlook"
+        url: URL of the LangGraph deployment
+            Default: http://127.0.0.1:2024 (local development)
+        cleanup: Run cleanup strategy, "concurrent", "serial" or "skip"
+        cleanup_concurrency: Maximum in-flight run deletes for "concurrent"
+        thread_registry: Optional ThreadRegistry of threads known to exist; when
+                        given, threads.get is skipped for known threads and
+                        unknown ones are created with if_exists="do_nothing"
+    
+    Returns:
+        tuple: (thread_id, run) containing:
+            - thread_id: UUID string for the LangGraph thread
+            - run: Run object with execution details
+    """
+    # Connect to LangGraph server (shared client, reused across emails)
+    client = get_langgraph_client(url)
+    
+    # Create a consistent UUID for the thread
+    # This ensures the same Outlook conversation always maps to the same LangGraph thread
+    # Uses MD5 hash to convert Outlook's string conversation IDs to UUID format
+    raw_thread_id = email_data["thread_id"]
+    thread_id = str(
+        uuid.UUID(hex=hashlib.md5(raw_thread_id.encode("UTF-8")).hexdigest())
+    )
+    print(f"Outlook conversation ID: {raw_thread_id} → LangGraph thread ID: {thread_id}")
+    
+    thread_exists = False
+    if thread_registry is not None:
+        if thread_id in thread_registry:
+            # Known from an earlier ingest: no need to ask the server
+            thread_exists = True
+            print(f"Found existing thread: {thread_id} (cached)")
+        else:
+            # Atomic create-if-absent: one round-trip whether or not the thread
+            # already exists. It may predate the registry, so treat it as existing
+            # and let run cleanup find whatever runs it has.
+            print(f"Ensuring thread exists: {thread_id}")
+            with METRICS.span("langgraph.threads_create"):
+                await client.threads.create(thread_id=thread_id, if_exists="do_nothing")
+            thread_registry.add(thread_id)
+            thread_exists = True
+    else:
+        try:
+            # Try to get existing thread info
+            # If the thread already exists in LangGraph, we retrieve it
+            # (threads_get.errors counts misses, i.e. new conversations)
+            with METRICS.span("langgraph.threads_get"):
+                thread_info = await client.threads.get(thread_id)
+            thread_exists = True
+            print(f"Found existing thread: {thread_id}")
+        except Exception as e:
+            # If thread doesn't exist, create it
+            # This happens on the first email for a new Outlook conversation
+            print(f"Creating new thread: {thread_id}")
+            with METRICS.span("langgraph.threads_create"):
+                thread_info = await client.threads.create(thread_id=thread_id)
+    
+    # If thread exists, clean up previous runs to avoid state accumulation
+    if thread_exists and cleanup != "skip":
+        try:
+            with METRICS.span("langgraph.run_cleanup"):
+                deleted = await cleanup_thread_runs(client, thread_id, cleanup, cleanup_concurrency)
+            METRICS.count("langgraph.runs_deleted", deleted)
+        except Exception as e:
+            print(f"Error listing/deleting runs: {str(e)}")
+    
+    # Update thread metadata with current email ID for tracking
+    try:
+        with METRICS.span("langgraph.threads_update"):
+            await client.threads.update(thread_id, metadata={"email_id": email_data["id"]})
+    except httpx.HTTPStatusError as e:
+        # A cached thread was deleted on the server since it was registered
+        if thread_registry is None or e.response.status_code != 404:
+            raise
+        print(f"Cached thread {thread_id} no longer exists, recreating it")
+        thread_registry.discard(thread_id)
+        await client.threads.create(thread_id=thread_id, if_exists="do_nothing")
+        thread_registry.add(thread_id)
+        await client.threads.update(thread_id, metadata={"email_id": email_data["id"]})
+    
+    # Create a fresh run for this email
+    # The run executes the LangGraph workflow with the email as input
+    print(f"Creating run for thread {thread_id} with graph {graph_name}")
+    
+    # Transform email data into the format expected by the workflow
+    email_input = {
+        "from": email_data["from_email"],
+        "to": email_data["to_email"],
+        "subject": email_data["subject"],
+        "body": email_data["page_content"],
+        "id": email_data["id"]
+    }
+    # List / bulk / auto-submitted headers for the graph's pre-triage rules
+    if email_data.get("headers"):
+        email_input["headers"] = email_data["headers"]
+    # Attachment names, sizes and short text extracts (--attachments)
+    if email_data.get("attachments"):
+        email_input["attachments"] = email_data["attachments"]
+    
+    with METRICS.span("langgraph.runs_create"):
+        run = await client.runs.create(
+            thread_id,
+            graph_name,
+            input={"email_input": email_input},
+            # Use rollback strategy if anything fails
+            multitask_strategy="rollback",
+        )
+    
+    print(f"Run created successfully with thread ID: {thread_id}")
+
+    return thread_id, run
+
+# ════════════════════════════════════════════════════════════════════════════
+# RATE LIMITING AND RETRIES
+# ════════════════════════════════════════════════════════════════════════════
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (delta-seconds or HTTP-date) into seconds."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+class Throttle:
+    """Token bucket plus retry bookkeeping for one remote endpoint.
+
+    - `acquire()` paces requests to `rate` per second with bursts up to `burst`
+      (a rate of 0 disables pacing), and holds every caller back while the
+      endpoint is blocked by a Retry-After answer.
+    - `backoff()` computes the next retry delay: the server's Retry-After when
+      given, otherwise exponential backoff with full jitter.
+
+    Time spent waiting on the server (Retry-After and backoff) is accumulated in
+    `throttled_seconds`; time spent pacing on the local bucket in
+    `paced_seconds`.
+    """
+
+    def __init__(self, name, rate=0.0, burst=None, max_retries=MAX_RETRIES,
+                 base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY, labels=None):
+        """Create the throttle.
+
+        Args:
+            name: Endpoint name used in log output and metric names
+            rate: Sustained requests per second (0 disables the token bucket)
+            burst: Bucket capacity, defaults to one second's worth of requests
+            max_retries: Retries allowed per request before giving up
+            base_delay: First backoff delay in seconds
+            max_delay: Upper bound on a single backoff delay in seconds
+            labels: Metric labels telling apart throttles of the same endpoint,
+                    e.g. {"mailbox": address}; their values also tag log output
+        """
+        self.name = name
+        self.labels = labels or {}
+        self.label = "".join(f"[{value}]" for value in self.labels.values())
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.throttled_seconds = 0.0
+        self.paced_seconds = 0.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a request may be sent."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                blocked = self._blocked_until - now
+                if blocked > 0:
+                    self.throttled_seconds += blocked
+                    await asyncio.sleep(blocked)
+                    continue
+                if self.rate <= 0:
+                    return
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+                self.paced_seconds += wait
+                await asyncio.sleep(wait)
+
+    def block_for(self, seconds):
+        """Hold back every caller of this endpoint for `seconds`."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def backoff(self, attempt, retry_after=None):
+        """Delay before retry number `attempt` (0-based)."""
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def summary(self):
+        """One-line description of time lost to throttling."""
+        return (
+            f"{self.name}{self.label}: {self.throttled_seconds:.1f}s throttled over {self.retries} retries, "
+            f"{self.paced_seconds:.1f}s paced by the local rate limit"
+        )
+
+class ThrottledTransport(httpx.AsyncBaseTransport):
+    """httpx transport that applies a Throttle to every request.
+
+    Wrapping the transport (rather than individual call sites) covers every
+    Graph request and every LangGraph SDK call alike. Retries go up to the
+    throttle's max_retries; a Retry-After header blocks the whole endpoint for
+    that long so concurrent callers back off together.
+
+    A request is only resent when that cannot duplicate work. 429, and 503
+    with Retry-After, mean the server refused the request, so they are retried
+    for every method. A 504, a 503 without Retry-After, or a transport error
+    after the connection was made (e.g. a read timeout) may come after the
+    server already acted on it, so those are retried only for idempotent
+    methods; for a POST such as runs.create they are passed through instead of
+    creating a second run. Connection failures are retried for every method.
+    Once retries are exhausted the last response (or error) is passed through
+    to the caller.
+    """
+
+    RETRY_STATUSES = (429, 503, 504)
+    IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+    def __init__(self, transport, throttle):
+        self.transport = transport
+        self.throttle = throttle
+
+    def can_resend(self, request, error):
+        """Whether `request` may be sent again after transport error `error`."""
+        if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout)):
+            return True
+        return request.method in self.IDEMPOTENT_METHODS
+
+    def can_retry(self, request, response, retry_after):
+        """Whether `request` may be sent again after a `response` in RETRY_STATUSES."""
+        if response.status_code == 429 or (response.status_code == 503 and retry_after is not None):
+            return True
+        return request.method in self.IDEMPOTENT_METHODS
+
+    async def handle_async_request(self, request):
+        throttle = self.throttle
+        attempt = 0
+        while True:
+            await throttle.acquire()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                if attempt >= throttle.max_retries or not self.can_resend(request, e):
+                    raise
+                delay = throttle.backoff(attempt)
+                reason = type(e).__name__
+            else:
+                if response.status_code not in self.RETRY_STATUSES or attempt >= throttle.max_retries:
+                    return response
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if not self.can_retry(request, response, retry_after):
+                    return response
+                await response.aclose()
+                delay = throttle.backoff(attempt, retry_after)
+                reason = f"HTTP {response.status_code}"
+                if retry_after is not None:
+                    # Everyone waits out the server's Retry-After inside acquire()
+                    throttle.block_for(delay)
+                    delay = 0.0
+
+            attempt += 1
+            throttle.retries += 1
+            METRICS.count(f"{throttle.name.lower()}.retries", labels=throttle.labels)
+            print(f"{throttle.name}{throttle.label} {reason} on {request.method} {request.url.path}, retry {attempt}/{throttle.max_retries}")
+            if delay > 0:
+                throttle.throttled_seconds += delay
+                await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+# ════════════════════════════════════════════════════════════════════════════
+# GRAPH HTTP CLIENT AND PAGINATION
+# ════════════════════════════════════════════════════════════════════════════
+
+class GraphClient:
+    """Shared async HTTP client for Microsoft Graph.
+
+    Wraps a single httpx.AsyncClient so every Graph call in a run reuses the same
+    keep-alive connection pool instead of opening a new TLS connection per
+    request. HTTP/2 is negotiated when the optional `h2` package is installed,
+    which lets concurrent requests multiplex over one connection. With a
+    Throttle, requests are rate limited and 429/503/504 answers are retried.
+
+    Usage:
+        async with GraphClient(access_token) as graph:
+            response = await graph.get(f"{GRAPH_BASE}/me/messages")
+    """
+
+    def __init__(self, access_token=None, max_connections=GRAPH_MAX_CONNECTIONS,
+                 max_keepalive=GRAPH_MAX_KEEPALIVE, throttle=None, token_manager=None,
+                 transport=None, mailbox=None):
+        """Create the pooled client.
+
+        Args:
+            access_token: OAuth2 bearer token for Graph API
+            max_connections: Upper bound on open connections in the pool
+            max_keepalive: Idle connections kept open for reuse
+            throttle: Optional Throttle applied to every request
+            token_manager: Optional TokenManager supplying a fresh token to every
+                           request (takes precedence over access_token)
+            transport: Optional httpx transport used instead of the pooled network
+                       transport (e.g. an httpx.MockTransport in benchmarks)
+            mailbox: Mailbox address to read through /users/{mailbox}; the
+                     signed-in user's mailbox (/me) when None
+        """
+        self.mailbox = mailbox
+        self.mailbox_path = f"users/{quote(mailbox)}" if mailbox else "me"
+        self.http2 = transport is None and importlib.util.find_spec("h2") is not None
+        self.throttle = throttle
+        if transport is None:
+            transport = httpx.AsyncHTTPTransport(
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive,
+                ),
+            )
+        if throttle is not None:
+            transport = ThrottledTransport(transport, throttle)
+        headers = {"Content-Type": "application/json"}
+        if token_manager is None:
+            headers["Authorization"] = f"Bearer {access_token}"
+        self._client = httpx.AsyncClient(
+            base_url=GRAPH_BASE,
+            headers=headers,
+            auth=TokenAuth(token_manager) if token_manager is not None else None,
+            transport=transport,
+            timeout=httpx.Timeout(30.0, connect=10.0),
+        )
+
+    def mailbox_url(self, path):
+        """Absolute Graph URL of `path` under this client's mailbox."""
+        return f"{GRAPH_BASE}/{self.mailbox_path}/{path}"
+
+    async def request(self, method, url, **kwargs):
+        """Send a request through the shared pool and return the httpx.Response."""
+        return await self._client.request(method, url, **kwargs)
+
+    async def get(self, url, **kwargs):
+        """Send a GET request through the shared pool."""
+        return await self.request("GET", url, **kwargs)
+
+    def stream(self, method, url, **kwargs):
+        """Stream a response body: `async with graph.stream("GET", url) as response`."""
+        return self._client.stream(method, url, **kwargs)
+
+    async def aclose(self):
+        """Close every pooled connection."""
+        await self._client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+class GraphRequestError(Exception):
+    """Raised when Microsoft Graph answers a request with a non-200 status."""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"Graph request failed ({status_code}): {text}")
+        self.status_code = status_code
+        self.text = text
+
+class GraphBatcher:
+    """Coalesce individual Graph requests into JSON $batch round-trips.
+
+    Callers await `request()` (or the `get` helper) as if it were a single
+    call. Requests are buffered for at most `window` seconds, or until
+    `max_size` are pending, and then sent together as one POST to /$batch.
+    Graph accepts at most 20 sub-requests per batch.
+
+    Graph applies its per-mailbox concurrency limit to the sub-requests of a
+    batch, so a 20-request batch routinely comes back with some sub-responses
+    throttled (429/503/504). Those sub-requests are re-queued after their
+    Retry-After (or a jittered backoff), which also holds back the whole Graph
+    endpoint through its Throttle, up to the throttle's max_retries. Each caller
+    gets back its own final sub-response as a dict with "status", "headers" and
+    "body" keys, so a failed sub-request only affects its own caller.
+
+    Usage:
+        batcher = GraphBatcher(graph)
+        results = await asyncio.gather(*(batcher.get(f"/me/messages/{i}") for i in ids))
+        await batcher.aclose()
+    """
+
+    def __init__(self, graph, max_size=GRAPH_BATCH_SIZE, window=GRAPH_BATCH_WINDOW):
+        """Create the batcher.
+
+        Args:
+            graph: Shared GraphClient used to send each batch
+            max_size: Sub-requests per batch (Graph maximum is 20)
+            window: Seconds to wait for more requests before flushing
+        """
+        self.graph = graph
+        self.max_size = min(max_size, GRAPH_BATCH_SIZE)
+        self.window = window
+        self.batches_sent = 0
+        self.requests_sent = 0
+        self.requests_retried = 0
+        self._pending = []
+        self._timer = None
+        self._next_id = 0
+        self._flushing = set()
+        self._retrying = set()
+
+    async def request(self, method, url, body=None, headers=None):
+        """Queue one sub-request and wait for its sub-response.
+
+        Args:
+            method: HTTP method
+            url: Graph URL, absolute or relative to the API version root
+            body: Optional JSON body
+            headers: Optional sub-request headers
+
+        Returns:
+            dict: Sub-response with "status", "headers" and "body"
+        """
+        if url.startswith(GRAPH_BASE):
+            url = url[len(GRAPH_BASE):]
+        self._next_id += 1
+        sub_request = {"id": str(self._next_id), "method": method, "url": url}
+        if body is not None:
+            sub_request["body"] = body
+            sub_request["headers"] = {"Content-Type": "application/json", **(headers or {})}
+        elif headers:
+            sub_request["headers"] = headers
+
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue((sub_request, future, 0))
+        return await future
+
+    async def get(self, url, headers=None):
+        """Batched GET."""
+        return await self.request("GET", url, headers=headers)
+
+    def _enqueue(self, item):
+        """Add a (sub_request, future, attempt) item and schedule a flush."""
+        self._pending.append(item)
+        if len(self._pending) >= self.max_size:
+            self._spawn(self.flush(), self._flushing)
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_after_window())
+
+    def _retry_later(self, item, sub_response):
+        """Re-queue a throttled sub-request once its Retry-After has passed."""
+        sub_request, future, attempt = item
+        headers = {k.lower(): v for k, v in (sub_response.get("headers") or {}).items()}
+        retry_after = parse_retry_after(headers.get("retry-after"))
+        throttle = self.graph.throttle
+        if throttle is not None:
+            delay = throttle.backoff(attempt, retry_after)
+            if retry_after is not None:
+                # The mailbox is saturated: hold back every Graph caller, not just this one
+                throttle.block_for(delay)
+            throttle.retries += 1
+        else:
+            delay = retry_after if retry_after is not None else random.uniform(0, RETRY_BASE_DELAY * 2 ** attempt)
+        self.requests_retried += 1
+        METRICS.count("graph.batch_retries", labels=throttle.labels if throttle is not None else None)
+        print(f"Graph $batch sub-request {sub_request['method']} {sub_request['url']} "
+              f"got HTTP {sub_response.get('status')}, retry {attempt + 1} in {delay:.1f}s")
+
+        async def requeue():
+            await asyncio.sleep(delay)
+            self._enqueue((sub_request, future, attempt + 1))
+
+        self._spawn(requeue(), self._retrying)
+
+    def _spawn(self, coro, tasks):
+        """Run `coro` as a task held in `tasks` until it finishes.
+
+        The event loop only keeps weak references to tasks, so without this a
+        flush or re-queue could be garbage-collected mid-flight; it also lets
+        aclose() wait for them.
+        """
+        task = asyncio.create_task(coro)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    async def _flush_after_window(self):
+        await asyncio.sleep(self.window)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        """Send every pending sub-request, at most `max_size` per $batch call."""
+        max_retries = self.graph.throttle.max_retries if self.graph.throttle is not None else MAX_RETRIES
+        while self._pending:
+            chunk = self._pending[:self.max_size]
+            del self._pending[:self.max_size]
+            items = {item[0]["id"]: item for item in chunk}
+            futures = {sub_id: item[1] for sub_id, item in items.items()}
+            try:
+                response = await self.graph.request(
+                    "POST",
+                    f"{GRAPH_BASE}/$batch",
+                    json={"requests": [sub_request for sub_request, _, _ in chunk]},
+                )
+                if response.status_code != 200:
+                    raise GraphRequestError(response.status_code, response.text)
+                self.batches_sent += 1
+                self.requests_sent += len(chunk)
+                for sub_response in response.json().get("responses", []):
+                    sub_id = sub_response.get("id")
+                    future = futures.pop(sub_id, None)
+                    if future is None or future.done():
+                        continue
+                    if (sub_response.get("status") in ThrottledTransport.RETRY_STATUSES
+                            and items[sub_id][2] < max_retries):
+                        self._retry_later(items[sub_id], sub_response)
+                    else:
+                        future.set_result(sub_response)
+                for future in futures.values():
+                    if not future.done():
+                        future.set_exception(GraphRequestError(0, "Missing sub-response in $batch reply"))
+            except Exception as e:
+                for future in futures.values():
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def aclose(self):
+        """Flush anything still pending, including throttled sub-requests awaiting a retry."""
+        while True:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            await self.flush()
+            tasks = self._flushing | self._retrying
+            if not tasks:
+                return
+            for result in await asyncio.gather(*tasks, return_exceptions=True):
+                if isinstance(result, Exception):
+                    print(f"Graph $batch background task failed: {str(result)}")
+
+async def iter_message_pages(graph, url, headers=None, cursor=None):
+    """Yield pages of Outlook messages as Graph returns them.
+
+    Follows @odata.nextLink one page at a time, so callers can start working on
+    the first page while later pages are still being requested, and only one
+    page is held in memory by the generator at any time.
+
+    Args:
+        graph: Shared GraphClient used for every page request
+        url: Initial Graph query URL
+        headers: Optional extra headers sent with every page request
+        cursor: Optional dict updated with the "nextLink" about to be fetched
+               (the resume point if paging fails) and the "deltaLink" of the
+               final page when paging a delta query
+
+    Yields:
+        list: Message objects of one result page
+
+    Raises:
+        GraphRequestError: If Graph returns a non-200 response
+        httpx.TransportError: If a page request fails to connect or times out
+            after the throttle's retries
+    """
+    page_number = 0
+    while url:
+        if cursor is not None:
+            cursor["nextLink"] = url
+        with METRICS.span("graph.page"):
+            response = await graph.get(url, headers=headers)
+        if response.status_code != 200:
+            raise GraphRequestError(response.status_code, response.text)
+
+        data = response.json()
+        page = data.get("value", [])
+        page_number += 1
+        print(f"Fetched page {page_number} ({len(page)} emails)")
+        METRICS.count("graph.messages", len(page))
+        url = data.get("@odata.nextLink")
+        if cursor is not None and "@odata.deltaLink" in data:
+            cursor["deltaLink"] = data["@odata.deltaLink"]
+        yield page
+
+# ════════════════════════════════════════════════════════════════════════════
+# ATTACHMENTS
+# ════════════════════════════════════════════════════════════════════════════
+
+# Attachment properties fetched with each message; contentBytes is left out on
+# purpose so file contents are never inlined (base64) into a message page
+ATTACHMENT_METADATA_FIELDS = ("id", "name", "contentType", "size", "isInline")
+
+def build_attachments_expand():
+    """Build the $expand clause fetching attachment metadata with each message."""
+    return f"$expand=attachments($select={','.join(ATTACHMENT_METADATA_FIELDS)})"
+
+def extract_attachment_text(path, content_type, max_chars):
+    """Read a short text extract from a cached attachment.
+
+    Text-like files are read only up to the bytes needed for `max_chars`. PDFs
+    are extracted from their first pages when the optional `pypdf` package is
+    installed. Other types yield no text.
+
+    Args:
+        path: Path of the cached attachment
+        content_type: MIME type reported by Graph
+        max_chars: Maximum characters returned
+
+    Returns:
+        str: Extract, or None when the type has no text to offer
+    """
+    if content_type.startswith("text/") or content_type in ("application/json", "application/xml"):
+        with open(path, "rb") as f:
+            text = f.read(max_chars * 4).decode("UTF-8", errors="replace")
+        if content_type == "text/html":
+            text = html_to_text(text)
+    elif content_type == "application/pdf" and importlib.util.find_spec("pypdf") is not None:
+        from pypdf import PdfReader
+        reader = PdfReader(path)
+        text = "\n".join(
+            page.extract_text() or "" for page in reader.pages[:ATTACHMENT_PDF_PAGES]
+        )
+    else:
+        return None
+    text = collapse_whitespace(text)
+    if len(text) > max_chars:
+        # Only the start of the file was read, so the remaining length is unknown
+        text = f"{text[:max_chars].rstrip()}\n\n[... truncated]"
+    return text or None
+
+class AttachmentStore:
+    """Streams message attachments into a local content-addressed cache.
+
+    Attachment metadata arrives with the message (see build_attachments_expand)
+    or, for delta pages and notifications, which cannot $expand, from one extra
+    metadata request. File attachments that pass the size and type limits are
+    then downloaded from `/attachments/{id}/$value` in `chunk_size` pieces,
+    hashed while they are written, and moved to `<root>/<sha256[:2]>/<sha256>`.
+    At most one chunk per download is held in memory, whatever the attachment
+    size, and identical files received twice are stored once.
+
+    Usage:
+        store = AttachmentStore()
+        email_data["attachments"] = await store.fetch(graph, message)
+    """
+
+    def __init__(self, root=ATTACHMENTS_DIR, max_bytes=ATTACHMENT_MAX_BYTES,
+                 types=ATTACHMENT_TYPES, text_chars=ATTACHMENT_TEXT_CHARS,
+                 chunk_size=ATTACHMENT_CHUNK_SIZE):
+        """Create the store.
+
+        Args:
+            root: Cache directory
+            max_bytes: Largest attachment downloaded
+            types: MIME type patterns allowed (fnmatch-style, e.g. "text/*")
+            text_chars: Length of the text extract passed to LangGraph (0 disables)
+            chunk_size: Bytes read per chunk while streaming
+        """
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.types = tuple(types)
+        self.text_chars = text_chars
+        self.chunk_size = chunk_size
+        self.downloaded = 0
+        self.cached = 0
+        self.skipped = 0
+        self.bytes_downloaded = 0
+
+    def skip_reason(self, attachment):
+        """Why an attachment is not downloaded, or None if it should be."""
+        if attachment.get("@odata.type", "#microsoft.graph.fileAttachment") != "#microsoft.graph.fileAttachment":
+            return "not a file attachment"
+        if attachment.get("isInline"):
+            return "inline"
+        if attachment.get("size", 0) > self.max_bytes:
+            return f"larger than {self.max_bytes} bytes"
+        content_type = (attachment.get("contentType") or "").lower()
+        if not any(fnmatch.fnmatch(content_type, pattern) for pattern in self.types):
+            return f"type {content_type or 'unknown'} not allowed"
+        return None
+
+    async def list_attachments(self, graph, message, batcher=None):
+        """Attachment metadata of a message, fetching it if it wasn't expanded.
+
+        With a GraphBatcher, the metadata requests of concurrently ingested
+        messages (delta pages cannot $expand) share $batch round-trips.
+        """
+        if "attachments" in message:
+            return message["attachments"]
+        if not message.get("hasAttachments"):
+            return []
+        url = graph.mailbox_url(f"messages/{message['id']}/attachments")
+        select = "$select=" + ",".join(ATTACHMENT_METADATA_FIELDS)
+        if batcher is not None:
+            result = await batcher.get(f"{url}?{select}")
+            if result["status"] != 200:
+                raise GraphRequestError(result["status"], json.dumps(result.get("body")))
+            return result["body"].get("value", [])
+        response = await graph.get(url, params={"$select": ",".join(ATTACHMENT_METADATA_FIELDS)})
+        if response.status_code != 200:
+            raise GraphRequestError(response.status_code, response.text)
+        return response.json().get("value", [])
+
+    async def download(self, graph, message_id, attachment):
+        """Stream one attachment into the cache.
+
+        Returns:
+            tuple: (sha256, path) of the cached file, or None if the download
+                   turned out larger than max_bytes
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.root / f".{uuid.uuid4().hex}.part"
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            url = graph.mailbox_url(f"messages/{message_id}/attachments/{attachment['id']}/$value")
+            async with graph.stream("GET", url) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    raise GraphRequestError(response.status_code, response.text)
+                with open(tmp_path, "wb") as f:
+                    async for chunk in response.aiter_bytes(self.chunk_size):
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            # Reported size was wrong; stop instead of buffering on
+                            return None
+                        digest.update(chunk)
+                        f.write(chunk)
+
+            sha256 = digest.hexdigest()
+            path = self.root / sha256[:2] / sha256
+            if path.exists():
+                self.cached += 1
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, path)
+            self.downloaded += 1
+            self.bytes_downloaded += size
+            METRICS.count("attachments.bytes", size)
+            return sha256, path
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    async def fetch(self, graph, message, batcher=None):
+        """Download a message's allowed attachments and describe all of them.
+
+        Args:
+            graph: Shared GraphClient
+            message: Outlook message object from Graph API
+            batcher: Optional GraphBatcher for the attachment metadata request
+
+        Returns:
+            list: One dict per attachment with "name", "content_type" and
+                  "size", plus "sha256" and a short "text" extract when it was
+                  downloaded, or "skipped" with the reason when it was not
+        """
+        results = []
+        for attachment in await self.list_attachments(graph, message, batcher):
+            info = {
+                "name": attachment.get("name"),
+                "content_type": attachment.get("contentType"),
+                "size": attachment.get("size"),
+            }
+            reason = self.skip_reason(attachment)
+            if reason is None:
+                with METRICS.span("attachments.download"):
+                    cached = await self.download(graph, message["id"], attachment)
+                if cached is None:
+                    reason = f"larger than {self.max_bytes} bytes"
+                else:
+                    info["sha256"], path = cached
+                    if self.text_chars:
+                        text = await asyncio.to_thread(
+                            extract_attachment_text,
+                            path,
+                            (attachment.get("contentType") or "").lower(),
+                            self.text_chars,
+                        )
+                        if text:
+                            info["text"] = text
+            if reason is not None:
+                self.skipped += 1
+                METRICS.count("attachments.skipped")
+                info["skipped"] = reason
+            results.append(info)
+        return results
+
+    def summary(self):
+        """One-line description of attachment activity."""
+        return (
+            f"Attachments: {self.downloaded} downloaded ({self.bytes_downloaded} bytes, "
+            f"{self.cached} already cached), {self.skipped} skipped"
+        )
+
+# ════════════════════════════════════════════════════════════════════════════
+# PROCESSED-MESSAGE LEDGER
+# ════════════════════════════════════════════════════════════════════════════
+
+class ProcessedLedger:
+    """Durable record of Outlook messages already submitted to LangGraph.
+
+    Entries are keyed by (message ID, content hash) and stored in a local SQLite
+    file. On open, entries older than `max_age_days` are evicted and the rest are
+    loaded into an in-memory index, so `seen()` is an O(1) lookup that needs no
+    I/O and already-ingested mail is skipped before any LangGraph call. New
+    entries are written through to SQLite and committed in small batches. A
+    long-lived ledger (--daemon, --webhook) evicts again from `record()` every
+    `evict_seconds`, so neither the file nor the index grows without bound.
+
+    Usage:
+        ledger = ProcessedLedger(LEDGER_PATH)
+        if not ledger.seen(email_data["id"], email_data["content_hash"]):
+            ...  # ingest
+            ledger.record(email_data["id"], email_data["content_hash"])
+        ledger.close()
+    """
+
+    # Uncommitted inserts allowed before an automatic commit
+    COMMIT_EVERY = 50
+
+    def __init__(self, path=LEDGER_PATH, max_age_days=LEDGER_MAX_AGE_DAYS,
+                 evict_seconds=LEDGER_EVICT_SECONDS):
+        """Open (or create) the ledger, evict stale entries and load the rest.
+
+        Args:
+            path: SQLite file path
+            max_age_days: Entries older than this many days are deleted
+            evict_seconds: Interval between evictions while the ledger is open
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_age_days = max_age_days
+        self.evict_seconds = evict_seconds
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS processed ("
+            " message_id TEXT NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " processed_at REAL NOT NULL,"
+            " PRIMARY KEY (message_id, content_hash))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS processed_at_idx ON processed (processed_at)"
+        )
+
+        self._keys = {}
+        self._pending = 0
+        evicted = self.evict()
+        self._keys = {
+            (message_id, content_hash): processed_at
+            for message_id, content_hash, processed_at in self._conn.execute(
+                "SELECT message_id, content_hash, processed_at FROM processed"
+            )
+        }
+        print(f"Ledger {path}: {len(self._keys)} processed emails, {evicted} evicted")
+
+    def seen(self, message_id, content_hash):
+        """Return True if this exact message content was already ingested."""
+        return (message_id, content_hash) in self._keys
+
+    def record(self, message_id, content_hash):
+        """Mark a message as ingested."""
+        now = time.time()
+        self._keys[(message_id, content_hash)] = now
+        self._conn.execute(
+            "INSERT OR REPLACE INTO processed VALUES (?, ?, ?)",
+            (message_id, content_hash, now),
+        )
+        self._pending += 1
+        if now - self._evicted_at >= self.evict_seconds:
+            evicted = self.evict()
+            if evicted:
+                print(f"Ledger {self.path}: {evicted} entries older than {self.max_age_days} days evicted")
+        elif self._pending >= self.COMMIT_EVERY:
+            self.flush()
+
+    def evict(self):
+        """Delete entries older than max_age_days from disk and memory.
+
+        Returns:
+            int: Number of entries deleted from the SQLite file
+        """
+        now = time.time()
+        cutoff = now - self.max_age_days * 86400
+        evicted = self._conn.execute(
+            "DELETE FROM processed WHERE processed_at < ?", (cutoff,)
+        ).rowcount
+        self.flush()
+        self._keys = {key: at for key, at in self._keys.items() if at >= cutoff}
+        self._evicted_at = now
+        return evicted
+
+    def flush(self):
+        """Commit pending inserts to disk."""
+        self._conn.commit()
+        self._pending = 0
+
+    def close(self):
+        """Commit pending inserts and close the database."""
+        self.flush()
+        self._conn.close()
+
+# ════════════════════════════════════════════════════════════════════════════
+# CONCURRENT INGESTION (WORKER POOL)
+# ════════════════════════════════════════════════════════════════════════════
+
+@dataclass
+class IngestStats:
+    """Aggregate counters for one ingestion run.
+
+    Workers update these as they finish each email so the final report can show
+    throughput across the whole pool rather than per-email timings.
+    """
+    processed: int = 0
+    failed: int = 0
+    skipped: int = 0
+    runs_saved: int = 0
+    body_bytes: int = 0
+    page_content_bytes: int = 0
+    last_lag_seconds: float | None = None
+    started_at: float = field(default_factory=time.perf_counter)
+
+    def report(self):
+        """Print a one-line throughput summary for the run."""
+        elapsed = time.perf_counter() - self.started_at
+        rate = self.processed / elapsed if elapsed > 0 else 0.0
+        print(
+            f"\nProcessed {self.processed} emails successfully "
+            f"({self.failed} failed, {self.skipped} already processed) "
+            f"in {elapsed:.1f}s - {rate:.2f} emails/sec"
+        )
+        if self.body_bytes:
+            saved = self.body_bytes - self.page_content_bytes
+            print(
+                f"Email bodies: {self.body_bytes} bytes received, {self.page_content_bytes} ingested "
+                f"({saved} saved, {100 * saved / self.body_bytes:.0f}%)"
+            )
+        if self.runs_saved:
+            print(f"Coalescing saved {self.runs_saved} LangGraph runs")
+
+def ingest_lag_seconds(received):
+    """Seconds between an email's receivedDateTime and now, or None if unparseable."""
+    try:
+        received_at = datetime.fromisoformat(received.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+    return round((datetime.now(timezone.utc) - received_at).total_seconds(), 1)
+
+@dataclass
+class IngestContext:
+    """Shared state handed to every ingestion worker of a run."""
+    args: argparse.Namespace
+    semaphore: asyncio.Semaphore
+    stats: IngestStats
+    ledger: ProcessedLedger | None = None
+    thread_registry: ThreadRegistry | None = None
+    graph: GraphClient | None = None
+    attachments: AttachmentStore | None = None
+    batcher: GraphBatcher | None = None
+
+def conversation_lane(message, lanes):
+    """Pick the ingestion lane for a message.
+
+    All messages of one Outlook conversation hash to the same lane, and each lane
+    is drained by a single worker, so emails of a conversation reach LangGraph in
+    the order they were fetched while different conversations run in parallel.
+
+    Args:
+        message: Outlook message object from Graph API
+        lanes: Number of lanes (workers) in the pool
+
+    Returns:
+        int: Lane index in range [0, lanes)
+    """
+    key = message.get("conversationId") or message.get("id", "")
+    return int(hashlib.md5(key.encode("UTF-8")).hexdigest(), 16) % lanes
+
+def add_conversation_context(email_data, earlier):
+    """Append earlier messages of the conversation to an email's body.
+
+    Args:
+        email_data: Extracted newest email, updated in place
+        earlier: Extracted earlier emails of the same conversation, oldest first
+    """
+    parts = [email_data["page_content"], "--- Earlier messages in this conversation (oldest first) ---"]
+    for data in earlier:
+        parts.append(
+            f"From: {data['from_email']}\n"
+            f"Sent: {data['send_time']}\n"
+            f"Subject: {data['subject']}\n\n"
+            f"{data['page_content']}"
+        )
+    email_data["page_content"] = "\n\n".join(parts)
+
+async def ingest_message(message, position, ctx, earlier=()):
+    """Extract one Outlook message and submit it to LangGraph.
+
+    Messages already in the processed ledger are skipped before any LangGraph
+    call. The context semaphore caps how many LangGraph submissions are in
+    flight at once, independently of how many lanes feed it. LangGraph failures
+    are counted here; anything else raised (extraction, ledger) is counted by
+    ingest_worker, so neither aborts the rest of the run.
+
+    With --coalesce, `earlier` holds the other new messages of the conversation;
+    they ride along as context in the body of this single run and are recorded
+    in the ledger with it.
+
+    Args:
+        message: Outlook message object from Graph API
+        position: 1-based index of the message in the fetched result set
+        ctx: IngestContext shared by the run
+        earlier: Older messages of the same conversation, oldest first
+    """
+    stats = ctx.stats
+
+    # Extract email data into standardized format
+    with METRICS.span("extract"):
+        email_data, *earlier_data = [
+            extract_email_data(
+                m,
+                normalize=not ctx.args.raw_body,
+                max_chars=ctx.args.body_max_chars,
+                strip_quotes=ctx.args.strip_quotes,
+            )
+            for m in (message, *earlier)
+        ]
+
+    # Skip emails this ledger has already seen with identical content
+    if ctx.ledger is not None and ctx.ledger.seen(email_data["id"], email_data["content_hash"]):
+        stats.skipped += 1 + len(earlier_data)
+        METRICS.count("emails.skipped", 1 + len(earlier_data))
+        print(f"\nSkipping email {position} (already processed): {email_data['subject']}")
+        return
+    if ctx.ledger is not None:
+        earlier_data = [d for d in earlier_data if not ctx.ledger.seen(d["id"], d["content_hash"])]
+        stats.skipped += len(earlier) - len(earlier_data)
+        METRICS.count("emails.skipped", len(earlier) - len(earlier_data))
+    if earlier_data:
+        add_conversation_context(email_data, earlier_data)
+
+    print(f"\nProcessing email {position}:")
+    print(f"From: {email_data['from_email']}")
+    print(f"Subject: {email_data['subject']}")
+    if earlier_data:
+        print(f"Coalesced with {len(earlier_data)} earlier message(s) in this conversation")
+    print(f"Body: {email_data['body_bytes']} -> {email_data['page_content_bytes']} bytes "
+          f"({email_data['body_bytes'] - email_data['page_content_bytes']} saved)")
+
+    # Attachments of the ingested message (coalesced earlier ones contribute
+    # their body text only). A failed download doesn't hold back the email.
+    if ctx.attachments is not None:
+        try:
+            email_data["attachments"] = await ctx.attachments.fetch(ctx.graph, message, ctx.batcher)
+        except Exception as e:
+            METRICS.count("attachments.errors")
+            print(f"Failed to fetch attachments of email {email_data['id']}: {str(e)}")
+        if email_data.get("attachments"):
+            print(f"Attachments: {', '.join(a['name'] or '?' for a in email_data['attachments'])}")
+
+    # Time spent queued behind --concurrency is tracked apart from LangGraph time
+    with METRICS.span("ingest.semaphore_wait"):
+        await ctx.semaphore.acquire()
+    try:
+        # Send email to LangGraph for agent processing
+        with METRICS.span("ingest.langgraph"):
+            await ingest_email_to_langgraph(
+                email_data,
+                ctx.args.graph_name,
+                url=ctx.args.url,
+                cleanup=ctx.args.run_cleanup,
+                cleanup_concurrency=ctx.args.run_cleanup_concurrency,
+                thread_registry=ctx.thread_registry,
+            )
+    except Exception as e:
+        stats.failed += 1
+        METRICS.count("emails.failed")
+        print(f"Failed to ingest email {email_data['id']}: {str(e)}")
+        return
+    finally:
+        ctx.semaphore.release()
+
+    for data in (email_data, *earlier_data):
+        if ctx.ledger is not None:
+            ctx.ledger.record(data["id"], data["content_hash"])
+        stats.processed += 1
+        stats.body_bytes += data["body_bytes"]
+        stats.page_content_bytes += data["page_content_bytes"]
+    stats.runs_saved += len(earlier_data)
+    METRICS.count("emails.processed", 1 + len(earlier_data))
+    stats.last_lag_seconds = ingest_lag_seconds(email_data["send_time"])
+
+async def ingest_worker(queue, ctx):
+    """Drain one ingestion lane until it receives the None sentinel.
+
+    Args:
+        queue: asyncio.Queue of (position, message, earlier) tuples for this lane
+        ctx: IngestContext shared by the run
+    """
+    while True:
+        item = await queue.get()
+        try:
+            if item is None:
+                return
+            position, message, earlier = item
+            await ingest_message(message, position, ctx, earlier)
+        except Exception as e:
+            # A malformed message (e.g. no conversationId) or a ledger error must
+            # not kill the lane: later submits to it would block forever
+            ctx.stats.failed += 1 + len(earlier)
+            METRICS.count("emails.failed", 1 + len(earlier))
+            print(f"Failed to ingest email {position} ({message.get('id', 'no id')}): {str(e)}")
+        finally:
+            queue.task_done()
+
+class IngestPool:
+    """Pool of ingestion lanes fed one message at a time.
+
+    Messages are routed with conversation_lane(), so each conversation is always
+    handled by the same worker. Lane queues are bounded, so `submit()` waits when
+    LangGraph falls behind instead of buffering without limit.
+
+    Usage:
+        pool = IngestPool(ctx)
+        await pool.submit(message)
+        await pool.join()
+    """
+
+    def __init__(self, ctx):
+        """Start one worker task per lane.
+
+        Args:
+            ctx: IngestContext shared by every worker
+        """
+        concurrency = ctx.args.concurrency
+        self.lanes = 1 if concurrency == 1 else concurrency * INGEST_LANES_PER_SLOT
+        self.ctx = ctx
+        self.submitted = 0
+        self._queues = [asyncio.Queue(maxsize=INGEST_QUEUE_DEPTH) for _ in range(self.lanes)]
+        self._workers = [
+            asyncio.create_task(ingest_worker(queue, ctx))
+            for queue in self._queues
+        ]
+
+    async def submit(self, message, earlier=()):
+        """Queue a message (and any coalesced earlier ones) on its conversation's lane."""
+        self.submitted += 1
+        lane = conversation_lane(message, self.lanes)
+        await self._queues[lane].put((self.submitted, message, earlier))
+
+    async def join(self):
+        """Signal every lane to finish, then wait for in-flight ingests."""
+        for queue in self._queues:
+            await queue.put(None)
+        await asyncio.gather(*self._workers)
+
+class ConversationCoalescer:
+    """Group a window's messages by conversation for one run per conversation.
+
+    Each run on a conversation's thread rolls back the one before it
+    (multitask_strategy="rollback"), so ingesting several new replies of one
+    conversation separately pays for several triage calls and keeps only the
+    last. The coalescer holds messages until pagination finishes, then yields
+    each conversation's newest message with the earlier ones as context.
+
+    Usage:
+        coalescer = ConversationCoalescer()
+        coalescer.add(message)
+        for newest, earlier in coalescer.groups():
+            await pool.submit(newest, earlier)
+    """
+
+    def __init__(self):
+        self._pending = {}
+
+    def add(self, message):
+        """Hold a message until the window is complete."""
+        key = message.get("conversationId") or message.get("id", "")
+        self._pending.setdefault(key, []).append(message)
+
+    def groups(self):
+        """Yield (newest, earlier) per conversation, earlier oldest first, and clear."""
+        pending, self._pending = self._pending, {}
+        for messages in pending.values():
+            messages.sort(key=lambda m: m.get("receivedDateTime", ""))
+            yield messages[-1], messages[:-1]
+
+# ════════════════════════════════════════════════════════════════════════════
+# OUTLOOK QUERY BUILDING AND DELTA SYNC
+# ════════════════════════════════════════════════════════════════════════════
+
+def window_cutoff(minutes):
+    """Format the start of a trailing time window for OData filters.
+
+    Graph rejects microseconds in datetime literals, so this uses whole seconds.
+
+    Args:
+        minutes: Window length in minutes
+
+    Returns:
+        str: UTC timestamp such as "2024-05-01T09:30:00Z"
+    """
+    return (
+        datetime.now(timezone.utc) - timedelta(minutes=minutes)
+    ).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def build_messages_url(args, minutes_since=None, mailbox_path="me"):
+    """Build the filtered Graph query URL for a --minutes-since window.
+
+    Args:
+        args: Parsed command-line arguments (minutes_since, include_read, email,
+              page_size)
+        minutes_since: Optional window override, used by --daemon to query only
+                      the time since its previous cycle
+        mailbox_path: "me" or "users/{address}" (see GraphClient)
+
+    Returns:
+        str: Graph /me/messages URL with $filter, $orderby, $select and $top
+             (and $expand of attachment metadata with --attachments)
+    """
+    if minutes_since is None:
+        minutes_since = args.minutes_since
+    
+    # Construct Outlook search query using OData filters
+    filters = []
+    
+    # Add time constraint if specified
+    if minutes_since > 0:
+        filters.append(f"receivedDateTime ge {window_cutoff(minutes_since)}")
+        
+    # Only include unread emails unless --include-read is specified
+    # This helps focus on new messages that need responses
+    if not args.include_read:
+        filters.append("isRead eq false")
+        
+    # # Add sender/recipient filter
+    # if args.email:
+    #     filters.append(
+    #         f"(from/emailAddress/address eq '{args.email}' "
+    #         f"or toRecipients/any(r: r/emailAddress/address eq '{args.email}'))"
+    #     )
+
+    # Add sender/recipient filter
+    if args.email:
+        # For now, filter by sender only (toRecipients/any has known syntax issues with Microsoft Graph)
+        # This can be expanded to include recipient filtering if needed
+        filters.append(
+            f"from/emailAddress/address eq '{args.email}'"
+        )
+    
+    query = []
+    if filters:
+        query.append("$filter=" + " and ".join(filters))
+    # Oldest first: each run on a conversation's thread rolls back the one
+    # before it, so the newest message has to be submitted last to survive
+    query.append("$orderby=receivedDateTime asc")
+    
+    # Only ask Graph for the fields extract_email_data() reads, in pages of
+    # --page-size, to cut payload bytes and round-trips on large mailboxes
+    query.append(build_select_clause(message_fields(args)))
+    if args.attachments:
+        query.append(build_attachments_expand())
+    query.append(f"$top={args.page_size}")
+        
+    return f"{GRAPH_BASE}/{mailbox_path}/messages?" + "&".join(query)
+
+def load_resume_link(path=RESUME_STATE_PATH):
+    """Return the page link saved by a run whose pagination failed, if any."""
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r") as f:
+            return json.load(f).get("nextLink")
+    except Exception as e:
+        print(f"Could not load resume state from {path}: {str(e)}")
+        return None
+
+def load_delta_link(key=DELTA_CURSOR_KEY, path=DELTA_STATE_PATH):
+    """Return the stored deltaLink for a delta cursor, or None on first sync."""
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r") as f:
+            return json.load(f).get(key)
+    except Exception as e:
+        print(f"Could not load delta state from {path}: {str(e)}")
+        return None
+
+def save_delta_link(delta_link, key=DELTA_CURSOR_KEY, path=DELTA_STATE_PATH):
+    """Persist the deltaLink for a delta cursor so the next run resumes from it."""
+    state = {}
+    if path.exists():
+        try:
+            with open(path, "r") as f:
+                state = json.load(f)
+        except Exception:
+            state = {}
+    state[key] = delta_link
+    write_json_atomic(path, state)
+
+def build_delta_url(args, mailbox_path="me", key=DELTA_CURSOR_KEY, path=DELTA_STATE_PATH):
+    """Build the Graph delta query URL for incremental inbox sync.
+
+    If a deltaLink was stored by a previous run it is returned as-is, so Graph
+    only sends messages created or changed since then. On the first sync a new
+    delta round is started, optionally limited to the --minutes-since window.
+
+    Delta queries do not support $top or filtering on isRead, so page size is
+    sent with the Prefer header (see message_request_headers) and read status and
+    sender are filtered client-side by wanted_message().
+
+    Args:
+        args: Parsed command-line arguments (minutes_since)
+        mailbox_path: "me" or "users/{address}" (see GraphClient)
+        key: Delta cursor key in the state file
+        path: Delta state file
+
+    Returns:
+        str: Stored deltaLink or initial delta query URL
+    """
+    delta_link = load_delta_link(key, path)
+    if delta_link:
+        print(f"Resuming delta sync from {path}")
+        return delta_link
+
+    print("No delta state found, starting a new delta sync")
+    query = []
+    if args.minutes_since > 0:
+        query.append(f"$filter=receivedDateTime ge {window_cutoff(args.minutes_since)}")
+    query.append(build_select_clause(message_fields(args, DELTA_MESSAGE_FIELDS)))
+    return f"{GRAPH_BASE}/{mailbox_path}/mailFolders/inbox/messages/delta?" + "&".join(query)
+
+def message_request_headers(args):
+    """Prefer headers for message requests, or None if there are none.
+
+    Delta queries take the page size as a preference instead of $top, and
+    --text-body asks Graph to convert HTML bodies to text server-side.
+    """
+    prefer = []
+    if args.delta:
+        prefer.append(f"odata.maxpagesize={args.page_size}")
+    if args.text_body:
+        prefer.append('outlook.body-content-type="text"')
+    return {"Prefer": ", ".join(prefer)} if prefer else None
+
+def wanted_message(message, args):
+    """Apply the filters that delta queries and pushed messages skip server-side.
+
+    Args:
+        message: Message object (or @removed tombstone) from a delta page or a
+                change notification
+        args: Parsed command-line arguments (include_read, email)
+
+    Returns:
+        bool: True if the message should be ingested
+    """
+    # Deleted or moved-out messages come back as tombstones with no content
+    if "@removed" in message:
+        return False
+    if not args.include_read and message.get("isRead"):
+        return False
+    if args.email:
+        sender = message.get("from", {}).get("emailAddress", {}).get("address", "")
+        if sender.lower() != args.email.lower():
+            return False
+    return True
+
+# ════════════════════════════════════════════════════════════════════════════
+# DAEMON MODE (ADAPTIVE POLLING)
+# ════════════════════════════════════════════════════════════════════════════
+
+@dataclass
+class DaemonCounters:
+    """Lifetime counters for --daemon, printed and written after every cycle."""
+    cycles: int = 0
+    processed: int = 0
+    failed: int = 0
+    skipped: int = 0
+    started_at: float = field(default_factory=time.time)
+    last_sync: float | None = None
+    last_lag_seconds: float | None = None
+    interval_seconds: float = 0.0
+
+    def update(self, stats, interval_seconds):
+        """Fold one cycle's IngestStats into the lifetime counters."""
+        self.cycles += 1
+        self.processed += stats.processed
+        self.failed += stats.failed
+        self.skipped += stats.skipped
+        self.last_sync = time.time()
+        if stats.last_lag_seconds is not None:
+            self.last_lag_seconds = stats.last_lag_seconds
+        self.interval_seconds = interval_seconds
+
+    def snapshot(self):
+        """Return the counters as a JSON-serializable dict."""
+        uptime = time.time() - self.started_at
+        return {
+            "cycles": self.cycles,
+            "processed": self.processed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "messages_per_sec": round(self.processed / uptime, 3) if uptime > 0 else 0.0,
+            "lag_seconds": self.last_lag_seconds,
+            "last_sync": (
+                datetime.fromtimestamp(self.last_sync, timezone.utc).isoformat()
+                if self.last_sync else None
+            ),
+            "next_poll_seconds": self.interval_seconds,
+            "uptime_seconds": round(uptime, 1),
+        }
+
+def next_poll_interval(interval, found_mail, args):
+    """Adapt the daemon polling interval to mailbox activity.
+
+    Mail arriving snaps the interval back to --poll-min-seconds; every idle (or
+    failed) cycle doubles it, up to --poll-max-seconds.
+
+    Args:
+        interval: Current interval in seconds
+        found_mail: Whether the last cycle ingested at least one email
+        args: Parsed command-line arguments (poll_min_seconds, poll_max_seconds)
+
+    Returns:
+        float: Interval to wait before the next cycle
+    """
+    if found_mail:
+        return args.poll_min_seconds
+    return min(args.poll_max_seconds, interval * 2)
+
+async def run_daemon(args, graph, ledger=None, thread_registry=None, attachments=None):
+    """Poll the mailbox until interrupted, reusing warm clients and credentials.
+
+    Each cycle runs run_ingest_cycle(). Without --delta the query window covers
+    the time since the last successful cycle started plus a minute of overlap;
+    the processed ledger drops anything seen twice. The Graph client's TokenManager
+    refreshes credentials in the background, and the counters are printed and
+    written to DAEMON_STATUS_PATH after every cycle.
+
+    Args:
+        args: Parsed command-line arguments
+        graph: Shared GraphClient
+        ledger: Optional ProcessedLedger
+        thread_registry: Optional ThreadRegistry
+        attachments: Optional AttachmentStore (--attachments)
+
+    Returns:
+        int: Exit code once stopped (0 for a clean shutdown)
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signame in ("SIGINT", "SIGTERM"):
+        try:
+            loop.add_signal_handler(getattr(signal, signame), stop.set)
+        except (NotImplementedError, AttributeError):
+            # Signal handlers are unavailable on Windows event loops
+            pass
+
+    counters = DaemonCounters()
+    interval = args.poll_min_seconds
+    minutes_since = args.minutes_since
+    last_success_started = None
+    print(f"Daemon started: polling every {args.poll_min_seconds}-{args.poll_max_seconds}s")
+
+    while not stop.is_set():
+        cycle_started = time.time()
+
+        # After the first cycle, query from the start of the last successful
+        # cycle with a minute of overlap
+        if last_success_started is not None:
+            minutes_since = math.ceil((cycle_started - last_success_started) / 60) + 1
+
+        # The Graph client's TokenManager keeps the token fresh in the background
+        with METRICS.span("cycle"):
+            exit_code, stats = await run_ingest_cycle(
+                args, graph, ledger, thread_registry, minutes_since=minutes_since,
+                attachments=attachments,
+            )
+
+        # Make progress durable between cycles
+        if ledger is not None:
+            ledger.flush()
+        if thread_registry is not None:
+            thread_registry.save()
+
+        interval = next_poll_interval(interval, exit_code == 0 and stats.processed > 0, args)
+        counters.update(stats, interval)
+        snapshot = counters.snapshot()
+        write_json_atomic(DAEMON_STATUS_PATH, snapshot)
+        print(f"Daemon status: {json.dumps(snapshot)}")
+        METRICS.export()
+
+        if exit_code == 0:
+            last_success_started = cycle_started
+
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+    print("Daemon stopped")
+    return 0
+
+# ════════════════════════════════════════════════════════════════════════════
+# CHANGE NOTIFICATIONS (WEBHOOK RECEIVER)
+# ════════════════════════════════════════════════════════════════════════════
+
+class NotificationReceiver:
+    """Minimal async HTTP endpoint for Graph change notifications.
+
+    Graph first validates a subscription by POSTing `?validationToken=...`,
+    which must be echoed back as text/plain. After that, each notification
+    batch is a JSON body of the form:
+
+        {"value": [{"subscriptionId": "...", "clientState": "...",
+                    "changeType": "created",
+                    "resource": "Users/.../Messages/<id>",
+                    "resourceData": {"id": "<message id>"}}]}
+
+    Notifications with the expected clientState are acknowledged with 202 right
+    away (Graph expects an answer within a few seconds) and their message IDs
+    are queued for ingestion. Any local stand-in can exercise the receiver by
+    POSTing such a payload, e.g.:
+
+        curl -X POST http://127.0.0.1:8765/ -H "Content-Type: application/json" \
+             -d '{"value": [{"clientState": "<state>", "changeType": "created",
+                             "resourceData": {"id": "<message id>"}}]}'
+    """
+
+    def __init__(self, client_state):
+        """Create the receiver.
+
+        Args:
+            client_state: Shared secret expected in every notification
+        """
+        self.client_state = client_state
+        self.message_ids = asyncio.Queue()
+        self.received = 0
+        self.rejected = 0
+
+    def accept_notifications(self, payload):
+        """Queue the message IDs of valid notifications in a payload.
+
+        Args:
+            payload: Decoded JSON notification body
+
+        Returns:
+            int: Number of message IDs queued
+        """
+        queued = 0
+        for notification in payload.get("value", []):
+            if notification.get("clientState") != self.client_state:
+                self.rejected += 1
+                continue
+            if notification.get("changeType", "created") != "created":
+                continue
+            message_id = notification.get("resourceData", {}).get("id")
+            if message_id:
+                self.message_ids.put_nowait(message_id)
+                queued += 1
+        self.received += queued
+        return queued
+
+    async def handle_connection(self, reader, writer):
+        """Serve one HTTP request on an accepted connection."""
+        try:
+            request_line = await reader.readline()
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", "0"))
+            body = await reader.readexactly(length) if length else b""
+
+            query = parse_qs(urlsplit(target).query)
+            if "validationToken" in query:
+                # Subscription validation handshake: echo the token back
+                await self._respond(writer, 200, query["validationToken"][0], "text/plain")
+            elif method == "POST":
+                queued = self.accept_notifications(json.loads(body or b"{}"))
+                print(f"Notification received: {queued} new emails queued")
+                await self._respond(writer, 202)
+            else:
+                await self._respond(writer, 405)
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            print(f"Rejected malformed notification request: {str(e)}")
+            await self._respond(writer, 400)
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, body="", content_type="text/plain"):
+        reason = {200: "OK", 202: "Accepted", 400: "Bad Request", 405: "Method Not Allowed"}[status]
+        payload = body.encode("UTF-8")
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: {content_type}; charset=utf-8\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Connection: close\r\n\r\n".encode("latin-1") + payload
+        )
+        await writer.drain()
+
+def subscription_expiry(minutes):
+    """Format an expirationDateTime `minutes` from now for Graph subscriptions."""
+    return (datetime.now(timezone.utc) + timedelta(minutes=minutes)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+async def create_subscription(graph, notification_url, client_state, minutes):
+    """Subscribe to new inbox messages and return the subscription ID.
+
+    Graph validates `notification_url` synchronously during this call, so the
+    receiver must already be listening behind it.
+    """
+    response = await graph.request("POST", f"{GRAPH_BASE}/subscriptions", json={
+        "changeType": "created",
+        "notificationUrl": notification_url,
+        "resource": "me/mailFolders('Inbox')/messages",
+        "expirationDateTime": subscription_expiry(minutes),
+        "clientState": client_state,
+    })
+    if response.status_code != 201:
+        raise GraphRequestError(response.status_code, response.text)
+    return response.json()["id"]
+
+async def renew_subscription_periodically(graph, subscription, minutes, stop, recreate):
+    """Extend a subscription's expiry well before it lapses, until `stop` is set.
+
+    Renewal happens at half the subscription lifetime. A failed attempt is
+    retried after SUBSCRIPTION_RETRY_SECONDS, doubling up to
+    SUBSCRIPTION_RETRY_MAX_SECONDS, so a transient error still leaves most of
+    the remaining lifetime for further attempts. A subscription Graph no longer
+    knows (404, e.g. it expired while the host was asleep) is recreated.
+
+    Args:
+        graph: Shared GraphClient
+        subscription: Dict whose "id" holds the current subscription ID; updated
+                      in place when the subscription is recreated
+        minutes: Subscription lifetime
+        stop: Event that ends renewal
+        recreate: Coroutine function creating a new subscription and returning its ID
+    """
+    delay = minutes * 30
+    retry_delay = SUBSCRIPTION_RETRY_SECONDS
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=delay)
+            return
+        except asyncio.TimeoutError:
+            pass
+        try:
+            response = await graph.request(
+                "PATCH",
+                f"{GRAPH_BASE}/subscriptions/{subscription['id']}",
+                json={"expirationDateTime": subscription_expiry(minutes)},
+            )
+            if response.status_code == 404:
+                print(f"Subscription {subscription['id']} no longer exists, recreating it")
+                subscription["id"] = await recreate()
+                print(f"Created subscription {subscription['id']}")
+            elif response.status_code == 200:
+                print(f"Renewed subscription {subscription['id']}")
+            else:
+                raise GraphRequestError(response.status_code, response.text)
+        except Exception as e:
+            print(f"Failed to renew subscription {subscription['id']}: {str(e)} (retrying in {retry_delay}s)")
+            delay = retry_delay
+            retry_delay = min(retry_delay * 2, SUBSCRIPTION_RETRY_MAX_SECONDS)
+        else:
+            delay = minutes * 30
+            retry_delay = SUBSCRIPTION_RETRY_SECONDS
+
+async def fetch_notified_messages(batcher, receiver, pool, args):
+    """Fetch notified messages from Graph and hand them to the ingest pool.
+
+    Every ID already queued when the fetcher wakes up (up to one batch) is
+    fetched through the GraphBatcher in a single $batch round-trip, then
+    submitted in notification order. With --attachments the attachment metadata
+    is expanded into the same request. Messages that still fail after the
+    batcher's retries are counted as failed ingests.
+    """
+    query = build_select_clause(message_fields(args, DELTA_MESSAGE_FIELDS))
+    if args.attachments:
+        query += "&" + build_attachments_expand()
+    headers = {"Prefer": 'outlook.body-content-type="text"'} if args.text_body else None
+    graph = batcher.graph
+    while True:
+        message_ids = [await receiver.message_ids.get()]
+        while len(message_ids) < batcher.max_size and not receiver.message_ids.empty():
+            message_ids.append(receiver.message_ids.get_nowait())
+
+        results = await asyncio.gather(
+            *(batcher.get(graph.mailbox_url(f"messages/{message_id}?{query}"), headers=headers)
+              for message_id in message_ids),
+            return_exceptions=True,
+        )
+        for message_id, result in zip(message_ids, results):
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                if result["status"] != 200:
+                    raise GraphRequestError(result["status"], json.dumps(result.get("body")))
+                message = result["body"]
+                if wanted_message(message, args):
+                    await pool.submit(message)
+            except Exception as e:
+                pool.ctx.stats.failed += 1
+                METRICS.count("emails.failed")
+                print(f"Failed to fetch notified email {message_id}: {str(e)}")
+            finally:
+                receiver.message_ids.task_done()
+
+async def run_webhook_receiver(args, graph, ledger=None, thread_registry=None, attachments=None):
+    """Ingest new mail as Graph pushes change notifications for it.
+
+    Starts the NotificationReceiver on --webhook-host/--webhook-port and, when
+    --notification-url is given, subscribes to new inbox messages and keeps the
+    subscription renewed. Without --notification-url no subscription is made,
+    which is how the receiver is tested against a local stand-in that POSTs
+    notification payloads. Runs until SIGINT/SIGTERM, then deletes the
+    subscription and drains in-flight ingests.
+
+    Args:
+        args: Parsed command-line arguments
+        graph: Shared GraphClient
+        ledger: Optional ProcessedLedger
+        thread_registry: Optional ThreadRegistry
+        attachments: Optional AttachmentStore (--attachments)
+
+    Returns:
+        int: Exit code (0 for a clean shutdown, 1 if subscribing failed)
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signame in ("SIGINT", "SIGTERM"):
+        try:
+            loop.add_signal_handler(getattr(signal, signame), stop.set)
+        except (NotImplementedError, AttributeError):
+            # Signal handlers are unavailable on Windows event loops
+            pass
+
+    client_state = os.getenv("OUTLOOK_WEBHOOK_CLIENT_STATE") or secrets.token_hex(16)
+    receiver = NotificationReceiver(client_state)
+    server = await asyncio.start_server(
+        receiver.handle_connection, args.webhook_host, args.webhook_port
+    )
+    print(f"Listening for change notifications on http://{args.webhook_host}:{args.webhook_port}/")
+
+    stats = IngestStats()
+    batcher = GraphBatcher(graph)
+    pool = IngestPool(IngestContext(
+        args=args,
+        semaphore=asyncio.Semaphore(args.concurrency),
+        stats=stats,
+        ledger=ledger,
+        thread_registry=thread_registry,
+        graph=graph,
+        attachments=attachments,
+        batcher=batcher,
+    ))
+    fetcher = asyncio.create_task(fetch_notified_messages(batcher, receiver, pool, args))
+
+    async def subscribe():
+        return await create_subscription(
+            graph, args.notification_url, client_state, args.subscription_minutes
+        )
+
+    # Holds the current subscription ID; the renewer replaces it on recreation
+    subscription = {"id": None}
+    renewer = None
+    exit_code = 0
+    try:
+        if args.notification_url:
+            subscription["id"] = await subscribe()
+            print(f"Created subscription {subscription['id']} -> {args.notification_url}")
+            renewer = asyncio.create_task(renew_subscription_periodically(
+                graph, subscription, args.subscription_minutes, stop, subscribe
+            ))
+        else:
+            print("No --notification-url given, not subscribing (local test mode)")
+        await stop.wait()
+    except GraphRequestError as e:
+        print(f"Could not create subscription: {str(e)}")
+        exit_code = 1
+    finally:
+        stop.set()
+        if renewer is not None:
+            # Whatever the renewer was doing, cleanup below must still run
+            renewer.cancel()
+            await asyncio.gather(renewer, return_exceptions=True)
+        if subscription["id"] is not None:
+            try:
+                response = await graph.request("DELETE", f"{GRAPH_BASE}/subscriptions/{subscription['id']}")
+                if response.status_code in (204, 404):
+                    print(f"Deleted subscription {subscription['id']}")
+                else:
+                    print(f"Failed to delete subscription {subscription['id']}: {response.text}")
+            except Exception as e:
+                print(f"Failed to delete subscription {subscription['id']}: {str(e)}")
+        server.close()
+        await server.wait_closed()
+        # Finish fetching whatever was already notified, then drain the pool
+        await receiver.message_ids.join()
+        fetcher.cancel()
+        await batcher.aclose()
+        await pool.join()
+        print(f"Notifications: {receiver.received} emails accepted, {receiver.rejected} rejected")
+        print(f"Graph $batch: {batcher.requests_sent} requests in {batcher.batches_sent} round-trips "
+              f"({batcher.requests_retried} throttled and retried)")
+        stats.report()
+    if stats.failed:
+        exit_code = 1
+    return exit_code
+
+# ════════════════════════════════════════════════════════════════════════════
+# MULTI-MAILBOX INGESTION
+# ════════════════════════════════════════════════════════════════════════════
+
+@dataclass
+class Mailbox:
+    """One entry of a --mailboxes list."""
+    address: str
+    token_path: Path | None = None
+
+    @property
+    def state_dir(self):
+        """Directory holding this mailbox's ledger, delta cursor and resume point."""
+        return MAILBOX_STATE_DIR / re.sub(r"[^a-z0-9@._-]", "_", self.address.lower())
+
+@dataclass
+class MailboxResult:
+    """Outcome of one mailbox's ingest pass (returned across processes)."""
+    address: str
+    exit_code: int
+    processed: int = 0
+    failed: int = 0
+    skipped: int = 0
+    seconds: float = 0.0
+
+def load_mailboxes(path):
+    """Read a --mailboxes list.
+
+    One mailbox address per line, optionally followed by the token file to use
+    for it (relative paths resolve against the list's directory). Mailboxes
+    without a token file share OUTLOOK_TOKEN / TOKEN_PATH, which suits shared
+    mailboxes the signed-in user has delegated access to. Blank lines and
+    lines starting with # are ignored.
+
+    Args:
+        path: Path of the mailbox list
+
+    Returns:
+        list: Mailbox entries in file order, duplicates removed
+    """
+    path = Path(path)
+    mailboxes = {}
+    with open(path, "r") as f:
+        for line in f:
+            fields = line.split("#", 1)[0].split()
+            if not fields:
+                continue
+            token_path = (path.parent / fields[1]).resolve() if len(fields) > 1 else None
+            mailboxes.setdefault(fields[0].lower(), Mailbox(fields[0], token_path))
+    return list(mailboxes.values())
+
+def build_attachment_store(args):
+    """AttachmentStore configured from the command line, or None without --attachments."""
+    if not args.attachments:
+        return None
+    return AttachmentStore(
+        max_bytes=args.attachment_max_bytes,
+        types=args.attachment_types.split(","),
+        text_chars=args.attachment_text_chars,
+    )
+
+async def ingest_mailbox(args, mailbox, tokens, semaphore, thread_registry=None,
+                         attachments=None, graph_transport=None):
+    """Run one ingest pass over a single mailbox of a --mailboxes list.
+
+    Each mailbox gets its own Graph client (and so its own Graph throttle, as
+    Graph limits are per mailbox), its own ledger and cursor state under
+    MAILBOX_STATE_DIR, and reads through /users/{address}. LangGraph
+    submissions share `semaphore` with every other mailbox of the process.
+
+    Returns:
+        MailboxResult: Counters of the pass
+    """
+    started = time.perf_counter()
+    graph = GraphClient(
+        max_connections=args.graph_max_connections,
+        max_keepalive=args.graph_max_keepalive,
+        throttle=Throttle(
+            "Graph", rate=args.graph_rate, max_retries=args.max_retries, labels={"mailbox": mailbox.address}
+        ),
+        token_manager=tokens,
+        transport=graph_transport,
+        mailbox=mailbox.address,
+    )
+    ledger = None
+    if not args.rerun:
+        ledger = ProcessedLedger(mailbox.state_dir / LEDGER_PATH.name, max_age_days=args.ledger_max_age_days)
+    try:
+        print(f"\nIngesting mailbox {mailbox.address}")
+        exit_code, stats = await run_ingest_cycle(
+            args,
+            graph,
+            ledger,
+            thread_registry,
+            attachments=attachments,
+            state_dir=mailbox.state_dir,
+            semaphore=semaphore,
+        )
+    finally:
+        await graph.aclose()
+        if ledger is not None:
+            ledger.close()
+    return MailboxResult(
+        mailbox.address,
+        exit_code,
+        stats.processed,
+        stats.failed,
+        stats.skipped,
+        round(time.perf_counter() - started, 1),
+    )
+
+def shard_concurrency(concurrency, shard, shards):
+    """Share of the global --concurrency budget given to one shard.
+
+    The remainder goes to the lowest-numbered shards, so the shares sum to
+    exactly `concurrency` (run_multi_mailbox never starts more shards than
+    that, so every share is at least 1).
+
+    Args:
+        concurrency: Global maximum of in-flight LangGraph submissions
+        shard: Index of this shard (0-based)
+        shards: Total number of shards
+
+    Returns:
+        int: Maximum in-flight submissions of this shard
+    """
+    return max(1, concurrency // shards + (1 if shard < concurrency % shards else 0))
+
+async def run_mailbox_shard(args, mailboxes, shards=1, graph_transport=None, langgraph_transport=None,
+                            shard=0):
+    """Ingest a group of mailboxes concurrently inside one process.
+
+    Mailboxes sharing a token file share one TokenManager; the LangGraph client,
+    thread registry and attachment cache are shared by the whole shard. The
+    global --concurrency and --langgraph-rate budgets are split across `shards`
+    processes, so all shards together stay within them. Each shard keeps its
+    own thread registry under MAILBOX_STATE_DIR, so processes never overwrite
+    each other's file.
+
+    Args:
+        args: Parsed command-line arguments
+        mailboxes: Mailbox entries of this shard
+        shards: Total number of shards (processes) running
+        graph_transport: Optional httpx transport for Graph requests
+        langgraph_transport: Optional httpx transport for LangGraph requests
+        shard: Index of this shard (0-based)
+
+    Returns:
+        list: One MailboxResult per mailbox
+    """
+    token_managers = {}
+    for mailbox in mailboxes:
+        if mailbox.token_path not in token_managers:
+            tokens = TokenManager(token_path=mailbox.token_path)
+            if tokens.load():
+                tokens.start()
+                token_managers[mailbox.token_path] = tokens
+            else:
+                print(f"Failed to load Outlook credentials for {mailbox.address}")
+                token_managers[mailbox.token_path] = None
+
+    concurrency = shard_concurrency(args.concurrency, shard, shards)
+    get_langgraph_client(
+        args.url,
+        max_connections=langgraph_pool_size(args, concurrency),
+        max_keepalive=args.langgraph_max_keepalive,
+        throttle=Throttle(
+            "LangGraph", rate=args.langgraph_rate / shards, max_retries=args.max_retries
+        ),
+        transport=langgraph_transport,
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+    thread_registry = None
+    if args.thread_cache_size > 0:
+        thread_registry = ThreadRegistry(
+            args.url, path=MAILBOX_STATE_DIR / f"threads.shard{shard}.json",
+            capacity=args.thread_cache_size,
+        )
+    attachments = build_attachment_store(args)
+
+    async def run(mailbox):
+        tokens = token_managers[mailbox.token_path]
+        if tokens is None:
+            return MailboxResult(mailbox.address, 1)
+        try:
+            return await ingest_mailbox(
+                args, mailbox, tokens, semaphore, thread_registry, attachments, graph_transport
+            )
+        except Exception as e:
+            print(f"Error ingesting mailbox {mailbox.address}: {str(e)}")
+            return MailboxResult(mailbox.address, 1)
+
+    try:
+        return await asyncio.gather(*(run(mailbox) for mailbox in mailboxes))
+    finally:
+        for tokens in token_managers.values():
+            if tokens is not None:
+                await tokens.aclose()
+        await close_langgraph_clients()
+        if thread_registry is not None:
+            thread_registry.save()
+        if attachments is not None:
+            print(attachments.summary())
+
+def run_mailbox_shard_process(args, mailboxes, shard, shards):
+    """Process-pool entry point: run one shard on its own event loop."""
+    if args.metrics:
+        # One metrics file per shard so processes don't overwrite each other
+        path = Path(args.metrics)
+        METRICS.configure(path.with_name(f"{path.stem}.shard{shard}{path.suffix}"), args.metrics_format)
+    try:
+        return asyncio.run(run_mailbox_shard(args, mailboxes, shards, shard=shard))
+    finally:
+        METRICS.export()
+
+async def run_multi_mailbox(args, graph_transport=None, langgraph_transport=None):
+    """Ingest every mailbox of a --mailboxes list.
+
+    With --processes 1 all mailboxes run as concurrent tasks on this event loop.
+    With more, the list is dealt round-robin into that many shards, each run by
+    a worker process with its own event loop, so CPU-bound work (JSON decoding,
+    body normalization) spreads across cores instead of queueing on one.
+
+    Args:
+        args: Parsed command-line arguments
+        graph_transport / langgraph_transport: Optional httpx transports, only
+            used in-process (--processes 1)
+
     Returns:
-        dict: Standardized email data with keys:
-            - from_email: Sender email address and name
-            - to_email: Recipient email address
-            - subject: Email subject line
-            - page_content: Email body (extracted)
-            - id: Outlook message ID (for tracking)
-            - thread_id: Outlook conversation ID (groups related emails)
-            - send_time: Email send timestamp (ISO format)
+        int: Exit code (0 if every mailbox succeeded)
     """
-    
-    # Extract key fields from the message
-    # Outlook uses direct dict structure: message["subject"], message["from"]["emailAddress"]["address"], etc.
-    subject = message.get('subject', 'No Subject')
-    from_email = message.get("from", {}).get("emailAddress", {}).get("address", 'Unknown Sender')
-    to_email = ", ".join(
-        [r["emailAddress"]["address"] for r in message.get("toRecipients", [])]
-    )
-    date = message.get('receivedDateTime', 'Unknown Date')
-    
-    # Extract message content using the content extraction helper
-    content = extract_message_part(message)
-    
-    # Create standardized email data object for LangGraph consumption
-    email_data = {
-        "from_email": from_email,
-        "to_email": to_email,
-        "subject": subject,
-        "page_content": content,
-        "id": message['id'],
-        "thread_id": message['conversationId'],
-        "send_time": date
-    }
-    
-    return email_data
+    mailboxes = load_mailboxes(args.mailboxes)
+    if not mailboxes:
+        print(f"No mailboxes listed in {args.mailboxes}")
+        return 1
+
+    started = time.perf_counter()
+    # Every shard needs at least one slot of the global --concurrency budget
+    processes = max(1, min(args.processes, len(mailboxes), args.concurrency))
+    print(f"Ingesting {len(mailboxes)} mailboxes in {processes} process(es)")
+    if processes == 1:
+        results = await run_mailbox_shard(args, mailboxes, 1, graph_transport, langgraph_transport)
+    else:
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            shard_results = await asyncio.gather(*(
+                loop.run_in_executor(
+                    executor, run_mailbox_shard_process, args, mailboxes[shard::processes], shard, processes
+                )
+                for shard in range(processes)
+            ))
+        results = [result for shard in shard_results for result in shard]
+
+    print("\nMailbox summary:")
+    for result in results:
+        status = "ok" if result.exit_code == 0 else "FAILED"
+        print(
+            f"  {result.address}: {status}, {result.processed} processed, {result.failed} failed, "
+            f"{result.skipped} already processed in {result.seconds}s"
+        )
+    total = sum(result.processed for result in results)
+    elapsed = time.perf_counter() - started
+    print(f"Processed {total} emails from {len(results)} mailboxes in {elapsed:.1f}s")
+    return 0 if all(result.exit_code == 0 for result in results) else 1
 
 # ════════════════════════════════════════════════════════════════════════════
-# LANGGRAPH INGESTION FUNCTIONS
+# MAIN EMAIL FETCHING AND PROCESSING WORKFLOW
 # ════════════════════════════════════════════════════════════════════════════
 
-async def ingest_email_to_langgraph(email_data, graph_name, url="http://127.0.0.1:2024"):
-    """Ingest an email to LangGraph for agent processing.
-    
-    This function takes extracted email data and feeds it into a running LangGraph
-    deployment. It handles:
-    1. Thread management (create new or retrieve existing)
-    2. Run cleanup (delete previous runs to avoid state accumulation)
-    3. Email submission to the graph workflow
-    
-    The function converts Outlook conversation IDs (which can be strings) into
-    consistent UUIDs for the LangGraph system, ensuring thread continuity.
-    
+async def run_ingest_cycle(args, graph, ledger=None, thread_registry=None, minutes_since=None,
+                           attachments=None, state_dir=None, semaphore=None):
+    """Run one fetch-and-ingest pass over the mailbox.
+
+    Builds the Graph query, streams matching emails page by page into the
+    ingestion worker pool and waits for every submission to finish. With
+    --coalesce, messages are instead grouped per conversation and submitted once
+    pagination ends. Used once by a one-shot run and once per poll by --daemon,
+    which keeps the clients, ledger and thread registry warm between cycles.
+
     Args:
-        email_data: Dictionary containing extracted email information
-                   Required keys: from_email, to_email, subject, page_content, id, thread_id
-        graph_name: Name of the LangGraph deployment to use
-                   Example: "email_assistant_hitl_memory_outlook"
-        url: URL of the LangGraph deployment
-            Default: http://127.0.0.1:2024 (local development)
-    
+        args: Parsed command-line arguments (see fetch_and_process_emails)
+        graph: Shared GraphClient
+        ledger: Optional ProcessedLedger used to skip already-ingested emails
+        thread_registry: Optional ThreadRegistry of known LangGraph threads
+        minutes_since: Override for args.minutes_since (daemon polling window)
+        attachments: Optional AttachmentStore that downloads attachments of
+                     ingested emails
+        state_dir: Directory for the delta and resume state of this mailbox
+                   (defaults to .state/)
+        semaphore: Semaphore capping LangGraph submissions, shared across
+                   mailboxes in multi-mailbox mode (defaults to --concurrency)
+
     Returns:
-        tuple: (thread_id, run) containing:
-            - thread_id: UUID string for the LangGraph thread
-            - run: Run object with execution details
+        tuple: (exit_code, stats) with 0 for success or 1 for failure, and the
+               IngestStats of this pass
     """
-    # Connect to LangGraph server
-    client = get_client(url=url)
-    
-    # Create a consistent UUID for the thread
-    # This ensures the same Outlook conversation always maps to the same LangGraph thread
-    # Uses MD5 hash to convert Outlook's string conversation IDs to UUID format
-    raw_thread_id = email_data["thread_id"]
-    thread_id = str(
-        uuid.UUID(hex=hashlib.md5(raw_thread_id.encode("UTF-8")).hexdigest())
-    )
-    print(f"Outlook conversation ID: {raw_thread_id} → LangGraph thread ID: {thread_id}")
-    
-    thread_exists = False
+    # Track how many emails we successfully process, and how fast
+    stats = IngestStats()
+    resume_path = state_dir / RESUME_STATE_PATH.name if state_dir else RESUME_STATE_PATH
+    delta_path = state_dir / DELTA_STATE_PATH.name if state_dir else DELTA_STATE_PATH
+    delta_key = f"{graph.mailbox_path}/mailFolders/inbox"
+
     try:
-        # Try to get existing thread info
-        # If the thread already exists in LangGraph, we retrieve it
-        thread_info = await client.threads.get(thread_id)
-        thread_exists = True
-        print(f"Found existing thread: {thread_id}")
-    except Exception as e:
-        # If thread doesn't exist, create it
-        # This happens on the first email for a new Outlook conversation
-        print(f"Creating new thread: {thread_id}")
-        thread_info = await client.threads.create(thread_id=thread_id)
-    
-    # If thread exists, clean up previous runs to avoid state accumulation
-    if thread_exists:
+        # ════════════════════════════════════════════════════════════
+        # STEP 1: Build Outlook Search Query
+        # ════════════════════════════════════════════════════════════
+        
+        resume_link = load_resume_link(resume_path) if args.resume else None
+        if resume_link:
+            # Pick up where a previous run gave up after exhausting its retries
+            print(f"Resuming from saved page link in {resume_path}")
+            url = resume_link
+        elif args.delta:
+            # Incremental sync: only pull what changed since the last run
+            url = build_delta_url(args, graph.mailbox_path, key=delta_key, path=delta_path)
+        else:
+            url = build_messages_url(args, minutes_since=minutes_since, mailbox_path=graph.mailbox_path)
+        
+        print(f"Outlook search query: {url}")
+        
+        # ════════════════════════════════════════════════════════════
+        # STEP 2: Start the Ingestion Workers
+        # ════════════════════════════════════════════════════════════
+        
+        # Fan messages out to a pool of lanes; each lane owns whole conversations
+        # so per-conversation order is kept while conversations run in parallel.
+        # Lane queues are bounded, so a slow LangGraph server applies backpressure
+        # to pagination instead of letting fetched pages pile up in memory.
+        # Attachment metadata of messages that arrive without it (delta pages
+        # cannot $expand) is fetched in $batch round-trips
+        batcher = GraphBatcher(graph) if attachments is not None else None
+        pool = IngestPool(IngestContext(
+            args=args,
+            semaphore=semaphore or asyncio.Semaphore(args.concurrency),
+            stats=stats,
+            ledger=ledger,
+            thread_registry=thread_registry,
+            graph=graph,
+            attachments=attachments,
+            batcher=batcher,
+        ))
+        
+        # ════════════════════════════════════════════════════════════
+        # STEP 3: Stream Matching Emails Into the Workers
+        # ════════════════════════════════════════════════════════════
+        
+        # Pages are handed to the workers as they arrive, so ingestion of page
+        # one overlaps with fetching the rest of the result set
+        fetch_failed = False
+        cursor = {}
+        accepted = 0
+        coalescer = ConversationCoalescer() if args.coalesce else None
+        pages = iter_message_pages(
+            graph,
+            url,
+            headers=message_request_headers(args),
+            cursor=cursor,
+        )
         try:
-            # List all runs for this thread
-            # Each run represents one execution of the workflow
-            runs = await client.runs.list(thread_id)
-            
-            # Delete all previous runs to avoid state accumulation
-            # This ensures fresh processing without old state interference
-            for run_info in runs:
-                run_id = run_info.id
-                print(f"Deleting previous run {run_id} from thread {thread_id}")
-                try:
-                    await client.runs.delete(thread_id, run_id)
-                except Exception as e:
-                    print(f"Failed to delete run {run_id}: {str(e)}")
-        except Exception as e:
-            print(f"Error listing/deleting runs: {str(e)}")
-    
-    # Update thread metadata with current email ID for tracking
-    await client.threads.update(thread_id, metadata={"email_id": email_data["id"]})
-    
-    # Create a fresh run for this email
-    # The run executes the LangGraph workflow with the email as input
-    print(f"Creating run for thread {thread_id} with graph {graph_name}")
-    
-    run = await client.runs.create(
-        thread_id,
-        graph_name,
-        # Transform email data into the format expected by the workflow
-        input={"email_input": {
-            "from": email_data["from_email"],
-            "to": email_data["to_email"],
-            "subject": email_data["subject"],
-            "body": email_data["page_content"],
-            "id": email_data["id"]
-        }},
-        # Use rollback strategy if anything fails
-        multitask_strategy="rollback",
-    )
-    
-    print(f"Run created successfully with thread ID: {thread_id}")
-    
-    return thread_id, run
+            async for page in pages:
+                if args.delta:
+                    # Delta pages come in no particular order; submit each
+                    # conversation oldest first so its newest run is kept
+                    page = sorted(page, key=lambda m: m.get("receivedDateTime", ""))
+                for message in page:
+                    # Delta pages need read-status and sender filtering locally
+                    if args.delta and not wanted_message(message, args):
+                        continue
 
-# ════════════════════════════════════════════════════════════════════════════
-# MAIN EMAIL FETCHING AND PROCESSING WORKFLOW
-# ════════════════════════════════════════════════════════════════════════════
+                    # Stop early if requested (useful for testing)
+                    if args.early and accepted > 0:
+                        break
+
+                    accepted += 1
+                    if coalescer is not None:
+                        # Held back until the window is complete
+                        coalescer.add(message)
+                    else:
+                        await pool.submit(message)
+
+                if args.early and accepted > 0:
+                    print(f"Early stop after processing {accepted} emails")
+                    break
+        except (GraphRequestError, httpx.TransportError) as e:
+            # A page that still fails once the throttle's retries are used up,
+            # whether with an HTTP error or a connection / timeout error
+            print(f"Fetching messages failed: {str(e) or type(e).__name__}")
+            fetch_failed = True
+        finally:
+            await pages.aclose()
+            if coalescer is not None:
+                # One run per conversation: its newest message, with the
+                # earlier ones as context
+                for newest, earlier in coalescer.groups():
+                    await pool.submit(newest, earlier)
+            await pool.join()
+            if batcher is not None:
+                await batcher.aclose()
+        
+        if fetch_failed:
+            # Retries already waited out any throttling; keep the page that
+            # failed so the next run can continue from it with --resume
+            if cursor.get("nextLink"):
+                write_json_atomic(resume_path, {"nextLink": cursor["nextLink"]})
+                print(f"Saved resume point to {resume_path} (continue with --resume)")
+            stats.report()
+            return 1, stats
+        
+        if resume_link:
+            resume_path.unlink(missing_ok=True)
+        
+        # Only advance the delta cursor once every change in this round made it
+        # into LangGraph; otherwise the next run replays the same round
+        if args.delta and cursor.get("deltaLink"):
+            if stats.failed:
+                print("Not saving delta state because some emails failed to ingest")
+            else:
+                save_delta_link(cursor["deltaLink"], key=delta_key, path=delta_path)
+                print(f"Saved delta state to {delta_path}")
+        
+        if pool.submitted == 0:
+            print("No emails found matching the criteria")
+            return 0, stats
+        
+        stats.report()
+        return (1 if stats.failed else 0), stats
+        
+    except Exception as e:
+        print(f"Error processing emails: {str(e)}")
+        return 1, stats
 
-async def fetch_and_process_emails(args):
+async def fetch_and_process_emails(args, graph_transport=None, langgraph_transport=None):
     """Fetch emails from Outlook and process them through LangGraph.
     
     This is the main orchestration function that:
     1. Loads Outlook credentials
-    2. Builds Outlook service connection
+    2. Opens a pooled Graph client shared by every request in the run
     3. Constructs search query based on arguments
-    4. Fetches matching emails
+    4. Streams matching emails page by page
     5. Extracts data from each email
-    6. Submits each to LangGraph for processing
+    6. Submits each to LangGraph for processing while later pages are fetched
     
     The function respects all command-line filters:
     - Time filter (--minutes-since): Only emails from last N minutes
     - Read status (--include-read): Whether to process already-read emails
     - Early stop (--early): Stop after first email (useful for testing)
-    - Rerun (--rerun): Reprocess already-processed emails
+    - Rerun (--rerun): Reprocess already-processed emails; otherwise emails in
+      the local processed ledger (.state/processed.sqlite3) are skipped
+    - Delta (--delta): Pull only changes since the last saved deltaLink instead
+      of re-querying the whole time window
+    - Concurrency (--concurrency): How many emails are ingested in parallel;
+      emails of the same conversation are always ingested in fetch order
+    - Daemon (--daemon): Keep running and poll on an adaptive interval instead
+      of exiting after one pass
+    - Webhook (--webhook): Ingest mail pushed by Graph change notifications
+      instead of polling
     
     Args:
         args: Parsed command-line arguments with:
@@ -335,142 +3455,139 @@ async def fetch_and_process_emails(args):
             - include_read: Include already-read emails flag
             - graph_name: LangGraph deployment name
             - url: LangGraph server URL
+            - run_cleanup: Previous-run cleanup strategy for existing threads
+            - run_cleanup_concurrency: Cap on concurrent run deletes
+            - thread_cache_size: Capacity of the known-thread registry
             - early: Stop after processing one email
             - rerun: Reprocess already-processed emails
+            - ledger_max_age_days: Retention for the processed-email ledger
+            - concurrency: Maximum concurrent LangGraph submissions
+            - graph_max_connections: Graph connection pool size
+            - graph_max_keepalive: Idle Graph connections kept for reuse
+            - page_size: Messages per Graph page ($top)
+            - body_max_chars: Normalized body size cap (0 for no cap)
+            - raw_body: Skip body normalization
+            - strip_quotes: Drop the quoted previous message of replies
+            - triage_headers: Fetch list/bulk headers for the graph's pre-triage rules
+            - text_body: Ask Graph for text instead of HTML bodies
+            - coalesce: One run per conversation per fetch window
+            - metrics / metrics_format: Metrics export file and format
+            - attachments: Download attachments and pass extracts to LangGraph
+            - attachment_max_bytes / attachment_types: Attachment download limits
+            - attachment_text_chars: Text extract length per attachment
+            - mailboxes: Mailbox list file for multi-mailbox mode
+            - processes: Worker processes for multi-mailbox mode
+            - langgraph_max_connections: LangGraph connection pool size (raised to fit --concurrency)
+            - langgraph_max_keepalive: Idle LangGraph connections kept for reuse
+            - delta: Use the delta query and saved deltaLink state
+            - graph_rate / langgraph_rate: Requests per second per service
+            - max_retries: Retries per throttled or failed request
+            - resume: Start from the page saved by a failed run
+            - daemon: Poll continuously instead of running once
+            - poll_min_seconds / poll_max_seconds: Daemon polling interval bounds
+            - webhook: Run the change-notification receiver instead of polling
+            - webhook_host / webhook_port: Receiver listen address
+            - notification_url: Public URL Graph posts notifications to
+            - subscription_minutes: Subscription lifetime between renewals
+        graph_transport: Optional httpx transport for Graph requests (see
+                         bench-ingest-outlook.py); the network by default
+        langgraph_transport: Optional httpx transport for LangGraph requests
             
     Returns:
         int: Exit code (0 for success, 1 for failure)
     """
-    # Load Outlook credentials from environment or local file
-    access_token = load_outlook_credentials()
-    if not access_token:
+    # Per-stage timings, counters and histograms, exported when the run ends
+    if args.metrics:
+        METRICS.configure(args.metrics, args.metrics_format)
+    
+    # Many mailboxes: each gets its own token, Graph client and cursor state
+    if args.mailboxes:
+        try:
+            return await run_multi_mailbox(args, graph_transport, langgraph_transport)
+        finally:
+            METRICS.export()
+    
+    # Load Outlook credentials from environment or local file, then keep the
+    # token fresh in the background so long runs never stall on auth
+    tokens = TokenManager()
+    if not tokens.load():
         print("Failed to load Outlook credentials")
         return 1
+    tokens.start()
     
-    # Headers for Graph API requests    
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json",
-    }
+    # Shared rate limits and retry schedules for both remote services
+    graph_throttle = Throttle("Graph", rate=args.graph_rate, max_retries=args.max_retries)
+    langgraph_throttle = Throttle("LangGraph", rate=args.langgraph_rate, max_retries=args.max_retries)
+    
+    # One pooled Graph client for every request in this run
+    graph = GraphClient(
+        max_connections=args.graph_max_connections,
+        max_keepalive=args.graph_max_keepalive,
+        throttle=graph_throttle,
+        token_manager=tokens,
+        transport=graph_transport,
+    )
+    print(f"Graph client ready (HTTP/2: {'on' if graph.http2 else 'off'})")
     
-    # Track how many emails we successfully process
-    processed_count = 0
+    # One LangGraph client (and connection pool) for every ingest in this run
+    get_langgraph_client(
+        args.url,
+        max_connections=langgraph_pool_size(args),
+        max_keepalive=args.langgraph_max_keepalive,
+        throttle=langgraph_throttle,
+        transport=langgraph_transport,
+    )
+    
+    # Already-processed emails are skipped via the local ledger unless --rerun
+    ledger = None if args.rerun else ProcessedLedger(max_age_days=args.ledger_max_age_days)
     
+    # Attachments are streamed into a local cache and summarized for LangGraph
+    attachments = build_attachment_store(args)
+    
+    # LangGraph threads known to exist, so threads.get can be skipped for them
+    thread_registry = None
+    if args.thread_cache_size > 0:
+        thread_registry = ThreadRegistry(args.url, capacity=args.thread_cache_size)
+
     try:
-        # ════════════════════════════════════════════════════════════
-        # STEP 1: Build Outlook Search Query
-        # ════════════════════════════════════════════════════════════
-        
-        email_address = args.email
-        
-        # Construct Outlook search query using OData filters
-        filters = []
-        
-        # Add time constraint if specified
-        if args.minutes_since > 0:
-            cutoff = (
-                datetime.now(timezone.utc) - timedelta(minutes=args.minutes_since)
-            ).strftime('%Y-%m-%dT%H:%M:%SZ')
-            filters.append(f"receivedDateTime ge {cutoff}")
-            
-        # Only include unread emails unless --include-read is specified
-        # This helps focus on new messages that need responses
-        if not args.include_read:
-            filters.append("isRead eq false")
-            
-        # # Add sender/recipient filter
-        # if args.email:
-        #     filters.append(
-        #         f"(from/emailAddress/address eq '{args.email}' "
-        #         f"or toRecipients/any(r: r/emailAddress/address eq '{args.email}'))"
-        #     )
-
-        # Add sender/recipient filter
-        if args.email:
-            # For now, filter by sender only (toRecipients/any has known syntax issues with Microsoft Graph)
-            # This can be expanded to include recipient filtering if needed
-            filters.append(
-                f"from/emailAddress/address eq '{args.email}'"
-            )
-        
-        filter_query = ""
-        if filters:
-            filter_query = "$filter=" + " and ".join(filters)
-            
-        url = f"{GRAPH_BASE}/me/messages?{filter_query}&$orderby=receivedDateTime desc"
-        
-        print(f"Outlook search query: {url}")
-        
-        # ════════════════════════════════════════════════════════════
-        # STEP 2: Execute Search and Get Matching Emails
-        # ════════════════════════════════════════════════════════════
-        
-        # Execute the search query against Outlook with pagination
-        messages = []
-        while url:
-            response = requests.get(url, headers=headers)
-            if response.status_code != 200:
-                print(response.text)
-                return 1
-            
-            data = response.json()
-            messages.extend(data.get("value", []))
-            url = data.get("@odata.nextLink")
-        
-        if not messages:
-            print("No emails found matching the criteria")
-            return 0
-            
-        print(f"Found {len(messages)} emails")
-        
-        # ════════════════════════════════════════════════════════════
-        # STEP 3: Process Each Email
-        # ════════════════════════════════════════════════════════════
-        
-        # Process each email found by the search
-        for i, message in enumerate(messages):
-            # Stop early if requested (useful for testing)
-            if args.early and i > 0:
-                print(f"Early stop after processing {i} emails")
-                break
-                
-            # Check if we should reprocess this email
-            if not args.rerun:
-                # TODO: Add check for already processed emails
-                # This would track which emails have been processed
-                pass
-                
-            # Extract email data into standardized format
-            email_data = extract_email_data(message)
-            
-            print(f"\nProcessing email {i+1}/{len(messages)}:")
-            print(f"From: {email_data['from_email']}")
-            print(f"Subject: {email_data['subject']}")
-            
-            # Send email to LangGraph for agent processing
-            thread_id, run = await ingest_email_to_langgraph(
-                email_data, 
-                args.graph_name,
-                url=args.url
+        if args.webhook:
+            return await run_webhook_receiver(args, graph, ledger, thread_registry, attachments)
+        if args.daemon:
+            return await run_daemon(args, graph, ledger, thread_registry, attachments)
+        with METRICS.span("cycle"):
+            exit_code, _ = await run_ingest_cycle(
+                args, graph, ledger, thread_registry, attachments=attachments
             )
-            
-            processed_count += 1
-            
-        print(f"\nProcessed {processed_count} emails successfully")
-        return 0
-        
-    except Exception as e:
-        print(f"Error processing emails: {str(e)}")
-        return 1
+        return exit_code
+    finally:
+        print(f"Throttling - {graph_throttle.summary()}; {langgraph_throttle.summary()}")
+        await tokens.aclose()
+        await graph.aclose()
+        await close_langgraph_clients()
+        if ledger is not None:
+            ledger.close()
+        if thread_registry is not None:
+            thread_registry.save()
+        if attachments is not None:
+            print(attachments.summary())
+        if METRICS.enabled:
+            METRICS.export()
+            print(f"Wrote metrics to {METRICS.path}")
 
-def parse_args():
+def parse_args(argv=None):
     """Parse command line arguments for the ingestion script.
     
     This function defines all available command-line options for controlling
     the email ingestion behavior. Users can customize:
-    - Which emails to fetch (time range, read status)
+    - Which emails to fetch (time range, read status, delta sync)
     - Which LangGraph deployment to use
     - Testing/debugging options (early stop, rerun)
+    - One-shot, long-running daemon (adaptive polling) or webhook mode
+    - Throughput options (concurrency, Graph and LangGraph connection pool
+      limits, page size)
+    
+    Args:
+        argv: Argument list to parse instead of sys.argv (used by the benchmark)
     
     Returns:
         argparse.Namespace: Parsed arguments object with attributes for each flag
@@ -480,8 +3597,22 @@ def parse_args():
     parser.add_argument(
         "--email", 
         type=str, 
-        required=True,
-        help="Email address to fetch messages for"
+        default=None,
+        help="Email address to fetch messages for (required unless --mailboxes is given)"
+    )
+    parser.add_argument(
+        "--mailboxes",
+        type=str,
+        default=None,
+        help="File listing mailboxes to ingest, one address per line with an optional "
+             "token file after it; each is read through /users/{address}"
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Worker processes the --mailboxes list is sharded across (1 runs all "
+             "mailboxes as tasks in this process; capped at --concurrency)"
     )
     parser.add_argument(
         "--minutes-since", 
@@ -501,6 +3632,24 @@ def parse_args():
         default="http://127.0.0.1:2024",
         help="URL of the LangGraph deployment"
     )
+    parser.add_argument(
+        "--run-cleanup",
+        choices=RUN_CLEANUP_STRATEGIES,
+        default="concurrent",
+        help="How previous runs on an existing thread are removed before a new run"
+    )
+    parser.add_argument(
+        "--run-cleanup-concurrency",
+        type=int,
+        default=RUN_CLEANUP_CONCURRENCY,
+        help="Maximum concurrent run deletes with --run-cleanup concurrent"
+    )
+    parser.add_argument(
+        "--thread-cache-size",
+        type=int,
+        default=THREAD_REGISTRY_SIZE,
+        help="LangGraph thread IDs remembered as existing between runs (0 disables the cache)"
+    )
     parser.add_argument(
         "--early", 
         action="store_true",
@@ -516,12 +3665,217 @@ def parse_args():
         action="store_true",
         help="Process the same emails again even if already processed"
     )
+    parser.add_argument(
+        "--ledger-max-age-days",
+        type=int,
+        default=LEDGER_MAX_AGE_DAYS,
+        help="Forget processed-email ledger entries older than this many days"
+    )
     parser.add_argument(
         "--skip-filters",
         action="store_true",
         help="Skip filtering of emails"
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Maximum number of emails submitted to LangGraph concurrently"
+    )
+    parser.add_argument(
+        "--graph-max-connections",
+        type=int,
+        default=GRAPH_MAX_CONNECTIONS,
+        help="Maximum open connections in the Graph HTTP pool"
+    )
+    parser.add_argument(
+        "--graph-max-keepalive",
+        type=int,
+        default=GRAPH_MAX_KEEPALIVE,
+        help="Idle keep-alive connections kept in the Graph HTTP pool"
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="Incremental sync via the Graph delta query, resuming from the saved deltaLink"
+    )
+    parser.add_argument(
+        "--langgraph-max-connections",
+        type=int,
+        default=LANGGRAPH_MAX_CONNECTIONS,
+        help="Maximum open connections to the LangGraph deployment (raised to --concurrency "
+             "x --run-cleanup-concurrency if lower, so ingests never wait on the pool)"
+    )
+    parser.add_argument(
+        "--langgraph-max-keepalive",
+        type=int,
+        default=LANGGRAPH_MAX_KEEPALIVE,
+        help="Idle keep-alive connections kept to the LangGraph deployment"
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running and poll for new mail on an adaptive interval"
+    )
+    parser.add_argument(
+        "--poll-min-seconds",
+        type=float,
+        default=POLL_MIN_SECONDS,
+        help="Shortest daemon polling interval, used while mail is arriving"
+    )
+    parser.add_argument(
+        "--poll-max-seconds",
+        type=float,
+        default=POLL_MAX_SECONDS,
+        help="Longest daemon polling interval, reached when the mailbox is idle"
+    )
+    parser.add_argument(
+        "--webhook",
+        action="store_true",
+        help="Ingest new mail from Graph change notifications instead of polling"
+    )
+    parser.add_argument(
+        "--webhook-host",
+        type=str,
+        default=WEBHOOK_HOST,
+        help="Address the change-notification receiver listens on"
+    )
+    parser.add_argument(
+        "--webhook-port",
+        type=int,
+        default=WEBHOOK_PORT,
+        help="Port the change-notification receiver listens on"
+    )
+    parser.add_argument(
+        "--notification-url",
+        type=str,
+        default=None,
+        help="Public HTTPS URL forwarding to the receiver; omit to skip subscribing (local testing)"
+    )
+    parser.add_argument(
+        "--subscription-minutes",
+        type=int,
+        default=SUBSCRIPTION_MINUTES,
+        help="Lifetime of the Graph subscription, renewed at half this interval"
+    )
+    parser.add_argument(
+        "--graph-rate",
+        type=float,
+        default=GRAPH_RATE,
+        help="Maximum sustained Graph requests per second (0 disables the limit)"
+    )
+    parser.add_argument(
+        "--langgraph-rate",
+        type=float,
+        default=LANGGRAPH_RATE,
+        help="Maximum sustained LangGraph requests per second (0 disables the limit)"
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=MAX_RETRIES,
+        help="Retries per request on 429/503/504 or connection errors"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue from the page saved by a run whose pagination failed"
+    )
+    parser.add_argument(
+        "--coalesce",
+        action="store_true",
+        help="Submit one run per conversation (newest message, earlier ones as context) "
+             "instead of one per message; not applied in --webhook mode"
+    )
+    parser.add_argument(
+        "--attachments",
+        action="store_true",
+        help=f"Download attachments into {ATTACHMENTS_DIR} and pass names and short "
+             "text extracts to LangGraph"
+    )
+    parser.add_argument(
+        "--attachment-max-bytes",
+        type=int,
+        default=ATTACHMENT_MAX_BYTES,
+        help="Largest attachment downloaded, in bytes"
+    )
+    parser.add_argument(
+        "--attachment-types",
+        type=str,
+        default=",".join(ATTACHMENT_TYPES),
+        help="Comma-separated MIME type patterns to download (e.g. text/*,application/pdf)"
+    )
+    parser.add_argument(
+        "--attachment-text-chars",
+        type=int,
+        default=ATTACHMENT_TEXT_CHARS,
+        help="Length of the text extract passed to LangGraph per attachment (0 disables)"
+    )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        default=None,
+        help="Record per-stage timings and counters and write them to this file "
+             "(after every cycle in --daemon mode)"
+    )
+    parser.add_argument(
+        "--metrics-format",
+        choices=["jsonl", "prometheus"],
+        default=None,
+        help="Metrics file format (default: prometheus for a .prom file, otherwise jsonl)"
+    )
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=GRAPH_PAGE_SIZE,
+        help=f"Messages per Graph page ($top), at most {GRAPH_MAX_PAGE_SIZE}"
+    )
+    parser.add_argument(
+        "--body-max-chars",
+        type=int,
+        default=BODY_MAX_CHARS,
+        help="Cap on normalized email body length in characters (0 for no cap)"
+    )
+    parser.add_argument(
+        "--raw-body",
+        action="store_true",
+        help="Pass email bodies through unchanged instead of normalizing them to text"
+    )
+    parser.add_argument(
+        "--strip-quotes",
+        action="store_true",
+        help="Drop the quoted previous message from replies (forwards are always kept whole)"
+    )
+    parser.add_argument(
+        "--triage-headers",
+        action="store_true",
+        help="Fetch internetMessageHeaders and pass list/bulk/auto-submitted headers to the graph's pre-triage rules"
+    )
+    parser.add_argument(
+        "--text-body",
+        action="store_true",
+        help='Ask Graph for text bodies (Prefer: outlook.body-content-type="text")'
+    )
+    args = parser.parse_args(argv)
+    if not args.email and not args.mailboxes:
+        parser.error("--email is required unless --mailboxes is given")
+    if args.mailboxes and (args.daemon or args.webhook):
+        parser.error("--mailboxes runs one pass per mailbox and cannot be combined with --daemon or --webhook")
+    if args.processes < 1:
+        parser.error("--processes must be at least 1")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if not 0 < args.poll_min_seconds <= args.poll_max_seconds:
+        parser.error("--poll-min-seconds must be positive and not above --poll-max-seconds")
+    if args.webhook and args.daemon:
+        parser.error("--webhook and --daemon are mutually exclusive")
+    if args.run_cleanup_concurrency < 1:
+        parser.error("--run-cleanup-concurrency must be at least 1")
+    if not 1 <= args.page_size <= GRAPH_MAX_PAGE_SIZE:
+        parser.error(f"--page-size must be between 1 and {GRAPH_MAX_PAGE_SIZE}")
+    if args.body_max_chars < 0:
+        parser.error("--body-max-chars must not be negative")
+    return args
 
 # ════════════════════════════════════════════════════════════════════════════
 # SCRIPT ENTRY POINT
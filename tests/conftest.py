@@ -0,0 +1,40 @@
+"""Shared fixtures: load the Outlook scripts, whose file names are not module names."""
+
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+_ROOT = Path(__file__).resolve().parent.parent
+
+# email_assistant_hitl_memory_outlook.py ends with setup notes after a line of
+# "====", which is not Python; only the code above it is loaded
+_NOTES_MARKER = "\n====\n"
+
+
+def _load(name, path, source=None):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    if source is None:
+        spec.loader.exec_module(module)
+    else:
+        exec(compile(source, str(path), "exec"), module.__dict__)
+    return module
+
+
+@pytest.fixture(scope="session")
+def ingest():
+    """The run-ingest-outlook.py module."""
+    return _load("run_ingest_outlook", _ROOT / "run-ingest-outlook.py")
+
+
+@pytest.fixture(scope="session")
+def assistant():
+    """The email assistant graph module (skipped without its LangChain dependencies)."""
+    for dependency in ("langchain.chat_models", "langgraph.graph", "email_assistant.prompts"):
+        pytest.importorskip(dependency)
+    path = _ROOT / "email_assistant_hitl_memory_outlook.py"
+    source = path.read_text(encoding="utf-8").split(_NOTES_MARKER)[0]
+    return _load("email_assistant_hitl_memory_outlook", path, source)
@@ -0,0 +1,161 @@
+"""Tests for the email assistant's memory rewrites and pre-triage rules.
+
+Skipped unless the assistant's dependencies (langchain, langgraph and the
+email_assistant package) are installed.
+"""
+
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+TRIAGE = ("email_assistant", "triage_preferences")
+
+
+class Store:
+    """Minimal BaseStore: get/put with an updated_at stamp per write."""
+
+    def __init__(self):
+        self.items = {}
+        self.puts = 0
+
+    def get(self, namespace, key):
+        return self.items.get((tuple(namespace), key))
+
+    def put(self, namespace, key, value):
+        self.puts += 1
+        self.items[(tuple(namespace), key)] = SimpleNamespace(
+            value=value, key=key, namespace=namespace, updated_at=datetime.now(timezone.utc)
+        )
+
+
+class MemoryModel:
+    """Memory model double: returns a new profile and can simulate a concurrent writer."""
+
+    def __init__(self, store, conflicts=0):
+        self.store = store
+        self.conflicts = conflicts
+        self.calls = 0
+
+    def invoke(self, messages):
+        self.calls += 1
+        if self.calls <= self.conflicts:
+            # Another worker saves the profile while this rewrite is running
+            self.store.put(TRIAGE, "user_preferences", f"written by another worker {self.calls}")
+        return SimpleNamespace(user_preferences=f"rewrite {self.calls}")
+
+
+@pytest.fixture
+def memory_model(assistant, monkeypatch):
+    """Return (store, install): install(conflicts) puts a MemoryModel on a fresh Store."""
+    store = Store()
+    store.put(TRIAGE, "user_preferences", "original")
+
+    def install(conflicts=0):
+        model = MemoryModel(store, conflicts)
+        monkeypatch.setattr(assistant.models, "get", lambda role: model)
+        return model
+
+    assistant.memory_cache.invalidate()
+    return store, install
+
+
+# ════════════════════════════════════════════════════════════════════════════
+# COMPARE-AND-SWAP REWRITES
+# ════════════════════════════════════════════════════════════════════════════
+
+def test_rewrite_without_conflict_writes_once(assistant, memory_model):
+    store, install = memory_model
+    model = install()
+    assert assistant.rewrite_memory(store, TRIAGE, [[{"role": "user", "content": "x"}]]) == "rewrite 1"
+    assert model.calls == 1
+    assert store.get(TRIAGE, "user_preferences").value == "rewrite 1"
+
+
+def test_rewrite_is_redone_on_top_of_a_concurrent_write(assistant, memory_model):
+    store, install = memory_model
+    model = install(conflicts=1)
+    assistant.rewrite_memory(store, TRIAGE, [[{"role": "user", "content": "x"}]])
+    assert model.calls == 2
+    assert store.get(TRIAGE, "user_preferences").value == "rewrite 2"
+
+
+def test_rewrite_never_overwrites_after_losing_every_attempt(assistant, memory_model):
+    store, install = memory_model
+    attempts = assistant.MEMORY_UPDATE_CAS_RETRIES + 1
+    model = install(conflicts=attempts)
+    with pytest.raises(assistant.MemoryConflictError):
+        assistant.rewrite_memory(store, TRIAGE, [[{"role": "user", "content": "x"}]])
+    assert model.calls == attempts
+    # The other worker's profile survives
+    assert store.get(TRIAGE, "user_preferences").value == f"written by another worker {attempts}"
+
+
+def test_worker_requeues_a_batch_that_lost_every_attempt(assistant, memory_model):
+    store, install = memory_model
+    install(conflicts=assistant.MEMORY_UPDATE_CAS_RETRIES + 1)
+    worker = assistant.MemoryUpdateWorker(debounce=0.01)
+    worker.submit(store, TRIAGE, [{"role": "user", "content": "x"}])
+    assert worker.flush(timeout=5)
+
+    stats = worker.stats()
+    assert stats["conflicts"] == 1
+    assert stats["rewrites"] == 1 and stats["failures"] == 0
+    assert store.get(TRIAGE, "user_preferences").value.startswith("rewrite")
+
+
+# ════════════════════════════════════════════════════════════════════════════
+# PRE-TRIAGE RULES
+# ════════════════════════════════════════════════════════════════════════════
+
+NO_VERDICTS = {"domain": {}, "senders": {}}
+
+
+def email(sender, **headers):
+    return {"from": sender, "headers": headers}
+
+
+def learned(ignore, keep=0, age_days=0):
+    counts = {"ignore": ignore, "keep": keep, "at": time.time() - age_days * 86400}
+    return {"domain": {}, "senders": {"promo@shop.example": counts}}
+
+
+def test_single_bulk_signal_goes_to_the_llm(assistant):
+    # A mailing-list discussion: List-Unsubscribe alone is below the threshold
+    assert assistant.pre_triage(email("dev@list.example", **{"List-Unsubscribe": "<x>"}), NO_VERDICTS)[0] is None
+
+
+def test_newsletter_is_ignored_locally(assistant):
+    decision, reasons = assistant.pre_triage(
+        email("noreply@shop.example", **{"List-Unsubscribe": "<x>"}), NO_VERDICTS
+    )
+    assert decision == "ignore"
+    assert set(reasons) == {"list_unsubscribe", "no_reply_sender"}
+
+
+def test_learned_verdict_alone_goes_to_the_llm(assistant):
+    verdicts = learned(ignore=assistant.PRE_TRIAGE_LEARN_MIN)
+    assert assistant.pre_triage(email("promo@shop.example"), verdicts)[0] is None
+
+
+def test_learned_verdict_tips_automated_mail(assistant):
+    verdicts = learned(ignore=assistant.PRE_TRIAGE_LEARN_MIN)
+    message = email("promo@shop.example", **{"List-Unsubscribe": "<x>"})
+    assert assistant.pre_triage(message, verdicts) == ("ignore", ["list_unsubscribe", "learned_sender"])
+
+
+@pytest.mark.parametrize("verdict_kwargs", [
+    {"ignore": 2},                  # below PRE_TRIAGE_LEARN_MIN
+    {"ignore": 5, "keep": 1},       # kept at least once
+    {"ignore": 5, "age_days": 365}, # stale
+])
+def test_learned_verdict_does_not_count(assistant, verdict_kwargs):
+    message = email("promo@shop.example", **{"List-Unsubscribe": "<x>"})
+    assert assistant.pre_triage(message, learned(**verdict_kwargs))[0] is None
+
+
+def test_kept_sender_vetoes_the_shortcut(assistant):
+    message = email("noreply@shop.example", **{"List-Unsubscribe": "<x>", "Precedence": "bulk"})
+    verdicts = {"domain": {}, "senders": {"noreply@shop.example": {"keep": 2, "ignore": 1, "at": time.time()}}}
+    assert assistant.pre_triage(message, verdicts)[0] is None
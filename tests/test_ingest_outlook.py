@@ -0,0 +1,239 @@
+"""Tests for run-ingest-outlook.py: retries, $batch re-queueing, ledger, registry, quotes."""
+
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+
+def send(ingest, handler, method, max_retries=2):
+    """Send one request through a ThrottledTransport; return (status or error name, attempts)."""
+    calls = []
+
+    def count(request):
+        calls.append(request)
+        return handler(request, len(calls))
+
+    async def run():
+        throttle = ingest.Throttle("Test", max_retries=max_retries, base_delay=0)
+        transport = ingest.ThrottledTransport(httpx.MockTransport(count), throttle)
+        async with httpx.AsyncClient(transport=transport) as client:
+            try:
+                return (await client.request(method, "http://test/runs")).status_code
+            except httpx.TransportError as e:
+                return type(e).__name__
+
+    return asyncio.run(run()), len(calls)
+
+
+def fail_once(error=None, status=None, headers=None):
+    """Handler that fails the first attempt and answers 200 afterwards."""
+    def handler(request, attempt):
+        if attempt > 1:
+            return httpx.Response(200)
+        if error is not None:
+            raise error("simulated", request=request)
+        return httpx.Response(status, headers=headers or {})
+    return handler
+
+
+# ════════════════════════════════════════════════════════════════════════════
+# THROTTLED TRANSPORT
+# ════════════════════════════════════════════════════════════════════════════
+
+@pytest.mark.parametrize("method", ["GET", "POST"])
+def test_connect_errors_are_retried_for_every_method(ingest, method):
+    assert send(ingest, fail_once(error=httpx.ConnectError), method) == (200, 2)
+
+
+def test_read_timeout_is_retried_for_idempotent_methods(ingest):
+    assert send(ingest, fail_once(error=httpx.ReadTimeout), "GET") == (200, 2)
+
+
+def test_read_timeout_on_post_is_not_resent(ingest):
+    # The server may already have created the run
+    assert send(ingest, fail_once(error=httpx.ReadTimeout), "POST") == ("ReadTimeout", 1)
+
+
+@pytest.mark.parametrize("method", ["GET", "POST"])
+def test_429_is_retried_for_every_method(ingest, method):
+    assert send(ingest, fail_once(status=429), method) == (200, 2)
+
+
+def test_503_with_retry_after_is_retried_for_post(ingest):
+    assert send(ingest, fail_once(status=503, headers={"Retry-After": "0"}), "POST") == (200, 2)
+
+
+@pytest.mark.parametrize("status", [503, 504])
+def test_gateway_errors_on_post_are_not_resent(ingest, status):
+    assert send(ingest, fail_once(status=status), "POST") == (status, 1)
+
+
+def test_504_is_retried_for_get(ingest):
+    assert send(ingest, fail_once(status=504), "GET") == (200, 2)
+
+
+def test_last_response_is_returned_once_retries_are_exhausted(ingest):
+    always_429 = lambda request, attempt: httpx.Response(429)
+    assert send(ingest, always_429, "GET", max_retries=2) == (429, 3)
+
+
+# ════════════════════════════════════════════════════════════════════════════
+# GRAPH $BATCH
+# ════════════════════════════════════════════════════════════════════════════
+
+def run_batch(ingest, sub_status, count=10, max_retries=2):
+    """GET `count` messages through a GraphBatcher.
+
+    Args:
+        sub_status: Callable (sub_request_url, attempt) -> status of that sub-response
+
+    Returns:
+        tuple: (statuses per caller, batcher, POSTs sent)
+    """
+    attempts = {}
+    posts = []
+
+    def handler(request):
+        posts.append(request)
+        responses = []
+        for sub_request in json.loads(request.content)["requests"]:
+            url = sub_request["url"]
+            attempts[url] = attempts.get(url, 0) + 1
+            status = sub_status(url, attempts[url])
+            responses.append({
+                "id": sub_request["id"],
+                "status": status,
+                "headers": {"Retry-After": "0"} if status == 429 else {},
+                "body": {"id": url.rsplit("/", 1)[-1]},
+            })
+        return httpx.Response(200, json={"responses": responses})
+
+    async def run():
+        graph = ingest.GraphClient(
+            "token",
+            throttle=ingest.Throttle("Graph", max_retries=max_retries, base_delay=0),
+            transport=httpx.MockTransport(handler),
+        )
+        batcher = ingest.GraphBatcher(graph, window=0.01)
+        try:
+            results = await asyncio.gather(*(batcher.get(f"/me/messages/m{i}") for i in range(count)))
+        finally:
+            await batcher.aclose()
+            await graph.aclose()
+        return [result["status"] for result in results], batcher
+
+    statuses, batcher = asyncio.run(run())
+    return statuses, batcher, len(posts)
+
+
+def test_throttled_sub_requests_are_requeued(ingest):
+    # The second half of the first batch is throttled, as Graph does past 4 concurrent requests
+    throttled_first = lambda url, attempt: 429 if attempt == 1 and int(url[-1]) >= 5 else 200
+    statuses, batcher, posts = run_batch(ingest, throttled_first)
+    assert statuses == [200] * 10
+    assert batcher.requests_retried == 5
+    assert posts == 2
+
+
+def test_sub_request_gets_its_last_response_once_retries_are_exhausted(ingest):
+    always_throttled = lambda url, attempt: 429 if url.endswith("m0") else 200
+    statuses, batcher, _ = run_batch(ingest, always_throttled, count=3, max_retries=2)
+    assert statuses == [429, 200, 200]
+    assert batcher.requests_retried == 2
+
+
+def test_batch_is_flushed_when_full_and_drained_on_close(ingest):
+    statuses, batcher, posts = run_batch(ingest, lambda url, attempt: 200, count=45)
+    assert statuses == [200] * 45
+    assert batcher.batches_sent == posts == 3
+    assert not batcher._flushing and not batcher._retrying
+
+
+# ════════════════════════════════════════════════════════════════════════════
+# PROCESSED LEDGER AND THREAD REGISTRY
+# ════════════════════════════════════════════════════════════════════════════
+
+def age_entries(ledger, days):
+    """Backdate every ledger entry by `days`, on disk and in memory."""
+    ledger._conn.execute("UPDATE processed SET processed_at = processed_at - ?", (days * 86400,))
+    ledger._keys = {key: at - days * 86400 for key, at in ledger._keys.items()}
+
+
+def test_ledger_skips_recorded_content_and_persists(ingest, tmp_path):
+    path = tmp_path / "processed.sqlite3"
+    ledger = ingest.ProcessedLedger(path)
+    ledger.record("m1", "hash-a")
+    assert ledger.seen("m1", "hash-a")
+    assert not ledger.seen("m1", "hash-b")
+    ledger.close()
+    assert ingest.ProcessedLedger(path).seen("m1", "hash-a")
+
+
+def test_ledger_evicts_stale_entries_on_open(ingest, tmp_path):
+    path = tmp_path / "processed.sqlite3"
+    ledger = ingest.ProcessedLedger(path, max_age_days=30)
+    ledger.record("old", "h")
+    age_entries(ledger, 31)
+    ledger.close()
+    assert not ingest.ProcessedLedger(path, max_age_days=30).seen("old", "h")
+
+
+def test_long_lived_ledger_evicts_periodically(ingest, tmp_path):
+    ledger = ingest.ProcessedLedger(tmp_path / "processed.sqlite3", max_age_days=30, evict_seconds=3600)
+    ledger.record("old", "h")
+    age_entries(ledger, 31)
+    ledger.record("new", "h")
+    assert ledger.seen("old", "h")  # not due yet
+
+    ledger._evicted_at -= 3600
+    ledger.record("newer", "h")
+    assert not ledger.seen("old", "h")
+    assert ledger.seen("new", "h") and ledger.seen("newer", "h")
+    assert ledger._conn.execute("SELECT COUNT(*) FROM processed").fetchone()[0] == 2
+    ledger.close()
+
+
+def test_thread_registry_evicts_least_recently_used(ingest, tmp_path):
+    registry = ingest.ThreadRegistry("http://lg", path=tmp_path / "threads.json", capacity=2)
+    registry.add("a")
+    registry.add("b")
+    assert "a" in registry  # refreshes "a"
+    registry.add("c")
+    assert "a" in registry and "c" in registry
+    assert "b" not in registry
+
+
+def test_thread_registry_persists_per_deployment(ingest, tmp_path):
+    path = tmp_path / "threads.json"
+    registry = ingest.ThreadRegistry("http://lg", path=path)
+    registry.add("t1")
+    registry.save()
+    other = ingest.ThreadRegistry("http://other", path=path)
+    other.add("t2")
+    other.save()
+
+    assert "t1" in ingest.ThreadRegistry("http://lg", path=path)
+    assert "t2" not in ingest.ThreadRegistry("http://lg", path=path)
+    assert "t2" in ingest.ThreadRegistry("http://other", path=path)
+
+
+# ════════════════════════════════════════════════════════════════════════════
+# QUOTE STRIPPING
+# ════════════════════════════════════════════════════════════════════════════
+
+def test_reply_is_cut_at_the_quoted_message(ingest):
+    text = "Sounds good, see you then.\nOn Mon, 1 Jan 2024, Bob <b@x.com> wrote:\n> old text"
+    assert ingest.strip_quoted_text(text) == "Sounds good, see you then.\n"
+
+
+def test_forward_is_kept_whole(ingest):
+    text = "FYI below.\nFrom: Bob\nSent: Monday\nTo: Al\nSubject: plan\nThe plan itself"
+    assert ingest.strip_quoted_text(text, "Fwd: plan") == text
+
+
+def test_header_words_inside_body_text_are_kept(ingest):
+    text = "Please see the From: line in the header docs."
+    assert ingest.strip_quoted_text(text) == text